@@ -1,11 +1,24 @@
 import streamlit as st
 import pandas as pd
-import joblib
-import sqlite3
+import functools
 import os
+import time
+from importlib.util import find_spec
 import numpy as np
-from database import init_db, log_prediction, fetch_logs
-from sklearn.metrics import classification_report, confusion_matrix
+from database import (
+    init_db, log_prediction, get_log, delete_log,
+    query_logs, log_date_range, fetch_risk_counts, fetch_daily_counts,
+    save_metrics, release_connection, write_behind_stats,
+)
+from mapeos import (
+    CODE_MAPS, TYPE_MAT_MAP, validar_codigo,
+)
+import metrics
+import profiling
+from explain import get_explainer
+from jobs import JobRegistry
+from model_store import bundle_info
+from scoring import get_scorer, prediction_cache
 
 # ─────────────────────────────────────────────────────────────────────────────
 # CONFIGURACIÓN GLOBAL DE PÁGINA Y ESTILOS
@@ -25,211 +38,42 @@ st.markdown(
     unsafe_allow_html=True
 )
 
-# ─────────────────────────────────────────────────────────────────────────────
-# DICCIONARIOS DE MAPEOS
-# ─────────────────────────────────────────────────────────────────────────────
-TYPE_MAT_MAP = {
-    '': 'TYPE MATERIAL FIRST IGNITED',
-            '00': 'Type of material first ignited, other',
-            '1': 'Flammable Gas',
-            '10': 'Flammable gas, other',
-            '11': 'Natural gas',
-            '12': 'LP gas',
-            '13': 'Anesthetic gas',
-            '14': 'Acetylene',
-            '15': 'Hydrogen',
-            '2': 'Flammable, Combustible Liquid',
-            '20': 'Flammable or combustible liquid, other',
-            '21': 'Ether, pentane type flammable liquid',
-            '22': 'JP4 jet fuel & methyl ethyl ketone type flammable',
-            '23': 'Gasoline',
-            '24': 'Turpentine, butyl alcohol type flammable liquid',
-            '25': 'Kerosene, No.1 and 2 fuel oil, diesel type',
-            '26': 'Cottonseed oil, creosote oil type combustible',
-            '27': 'Cooking oil, transformer or lubricating oil',
-            '28': 'Ethanol',
-            '3': 'Volatile Solid or Chemical',
-            '30': 'Volatile solid or chemical, other',
-            '31': 'Fat, grease, butter, margarine, lard',
-            '32': 'Petroleum jelly and non-food grease',
-            '33': 'Polish, paraffin, wax',
-            '34': 'Adhesive, resin, tar, glue, asphalt, pitch',
-            '35': 'Paint, varnish - applied',
-            '36': 'Combustible metal, included are magnesium',
-            '37': 'Solid chemical, included are explosives',
-            '38': 'Radioactive material',
-            '4': 'Plastics',
-            '41': 'Plastic',
-            '5': 'Natural Product',
-            '50': 'Natural product, other',
-            '51': 'Rubber, excluding synthetic rubbers',
-            '52': 'Cork',
-            '53': 'Leather',
-            '54': 'Hay, straw',
-            '55': 'Grain, natural fiber, (preprocess)',
-            '56': 'Coal, coke, briquettes, peat',
-            '57': 'Food, starch, excluding fat and grease Code 31',
-            '58': 'Tobacco',
-            '6': 'Wood or Paper Processed',
-            '60': 'Wood or paper, processed, other',
-            '61': 'Wood chips, sawdust, shavings',
-            '62': 'Round timber, including round posts, poles',
-            '63': 'Sawn wood, including all finished lumber',
-            '64': 'Plywood',
-            '65': 'Fiberboard, particleboard, and hardboard',
-            '66': 'Wood pulp',
-            '67': 'Paper, including cellulose, waxed paper',
-            '68': 'Cardboard',
-            '7': 'Fabric, Textiles, Fur',
-            '70': 'Fabric, textile, fur, other',
-            '71': 'Fabric, fiber, cotton, blends, rayon, wool',
-            '74': 'Fur, silk, other fabric.',
-            '75': 'Wig',
-            '76': 'Human hair',
-            '77': 'Plastic coated fabric',
-            '8': 'Material Compounded with Oil',
-            '80': 'Material compounded with oil, other',
-            '81': 'Linoleum',
-            '82': 'Oilcloth',
-            '86': 'Asphalt treated material',
-            '9': 'Other Material',
-            '99': 'Multiple types of material',
-            'UU': 'Undetermined'
-}
-
-HEAT_SOURC_MAP = {
-    '': 'HEAT SOURCE',
-            '00': 'Heat source: other',
-            '1': 'Operating equipment',
-            '10': 'Heat from powered equipment, other',
-            '11': 'Spark, ember or flame from operating equipment',
-            '12': 'Radiated, conducted heat from operating equipment',
-            '13': 'Arcing',
-            '4': 'Hot or Smoldering Object',
-            '40': 'Hot or smoldering object, other',
-            '41': 'Heat, spark from friction',
-            '42': 'Molten, hot material',
-            '43': 'Hot ember or ash',
-            '5': 'Explosives, Fireworks',
-            '50': 'Explosive, fireworks, other',
-            '51': 'Munitions',
-            '53': 'Blasting agent',
-            '54': 'Fireworks',
-            '55': 'Model and amateur rockets',
-            '56': 'Incendiary device',
-            '6': 'Other Open Flame or Smoking Materials',
-            '60': 'Heat from other open flame or smoking materials',
-            '61': 'Cigarette',
-            '62': 'Pipe or cigar',
-            '63': 'Heat from undetermined smoking material',
-            '64': 'Match',
-            '65': 'Cigarette lighter',
-            '66': 'Candle',
-            '67': 'Warning or road flare; fusee',
-            '68': 'Backfire from internal combustion engine',
-            '69': 'Flame/torch used for lighting',
-            '7': 'Chemical, Natural Heat Sources',
-            '70': 'Chemical, natural heat source, other',
-            '71': 'Sunlight',
-            '72': 'Chemical reaction',
-            '73': 'Lightning',
-            '74': 'Other static discharge',
-            '8': 'Heat Spread from Another Fire',
-            '80': 'Heat spread from another fire, other',
-            '81': 'Heat from direct flame, convection currents',
-            '82': 'Radiated heat from another fire',
-            '83': 'Flying brand, ember, spark',
-            '84': 'Conducted heat from another fire',
-            '9': 'Other Heat Sources',
-            '97': 'Multiple heat sources including multiple ignitions',
-            'UU': 'Undetermined'
-}
-
-STRUC_STAT_MAP = {
-    '0': 'Other',
-    '1': 'Under construction',
-    '2': 'In normal use',
-    '3': 'Idle, not routinely used',
-    '4': 'Under major renovation',
-    '5': 'Vacant and secured',
-    '6': 'Vacant and unsecured',
-    '7': 'Being demolished',
-    'U': 'Undetermined'
-}
-
-DETECTOR_MAP = {
-    '1': 'Detectors Present',
-    'N': 'None Present',
-    'Y': 'Detectors Present',
-    'U': 'Undetermined'
-}
-
-DET_TYPE_MAP = {
-    '0': 'Other',
-    '1': 'Smoke',
-    '2': 'Heat',
-    '3': 'Combination smoke - heat',
-    '4': 'Sprinkler, water flow detection',
-    '5': 'More than 1 type present',
-    'U': 'Undetermined'
-}
-
-
-
-def validar_codigo(inputs: dict) -> (bool, list):
-    errores = []
-    if inputs["HEAT_SOURC"] not in HEAT_SOURC_MAP:
-        errores.append(f"Fuente de calor inválida: {inputs['HEAT_SOURC']}")
-    if inputs["TYPE_MAT"] not in TYPE_MAT_MAP:
-        errores.append(f"Material combustible inválido: {inputs['TYPE_MAT']}")
-    if inputs["STRUC_STAT"] not in STRUC_STAT_MAP:
-        errores.append(f"Estado estructural inválido: {inputs['STRUC_STAT']}")
-    if inputs["DETECTOR"] not in DETECTOR_MAP:
-        errores.append(f"Detector inválido: {inputs['DETECTOR']}")
-    if inputs["DET_TYPE"] not in DET_TYPE_MAP:
-        errores.append(f"Tipo de detector inválido: {inputs['DET_TYPE']}")
-    return (len(errores) == 0, errores)
-
 # ─────────────────────────────────────────────────────────────────────────────
 # 4) CARGA DEL MODELO
 # ─────────────────────────────────────────────────────────────────────────────
+# get_scorer cachea el bundle en el proceso (compartido por todas las
+# sesiones) y sólo lo recarga si el fichero cambia en disco. Se pide al usarlo:
+# las páginas que no predicen no cargan el modelo en un worker recién creado.
 @st.cache_resource
+def job_registry():
+    # Un único reentrenamiento a la vez para todo el servidor
+    return JobRegistry()
+
 def load_model():
-    bundle = joblib.load("models/aignite_model.pkl")
-    return bundle["model"], bundle["columns"], bundle["cat_cols"]
+    return get_scorer()
 
-clf, model_columns, cat_cols = load_model()
+@st.cache_resource
+def init_storage():
+    # Una vez por proceso: init_db vuelca antes el logging asíncrono y no
+    # hace falta repetirlo en cada rerun
+    init_db()
 
 # ─────────────────────────────────────────────────────────────────────────────
 # 5) INTEGRACIÓN SHAP
 # ─────────────────────────────────────────────────────────────────────────────
-try:
-    import shap
-    import matplotlib.pyplot as plt
-    SHAP_AVAILABLE = True
-
-    @st.cache_resource
-    def load_explainer():
-        return shap.TreeExplainer(clf)
-
-    explainer = load_explainer()
-
-except ImportError:
-    SHAP_AVAILABLE = False
+# explain.get_explainer mantiene un único TreeExplainer por versión de modelo
+# en el proceso (creado al primer uso) y cachea los vectores SHAP. shap y
+# matplotlib tardan segundos en importarse: aquí sólo se comprueba que están
+# instalados y se importan en la explicación local.
+SHAP_AVAILABLE = all(find_spec(m) is not None for m in ("shap", "matplotlib"))
 
 # ─────────────────────────────────────────────────────────────────────────────
 # 6) FUNCIÓN DE PREDICCIÓN
 # ─────────────────────────────────────────────────────────────────────────────
 def predict(data: dict):
-    df = pd.DataFrame([data])
-    for c in cat_cols:
-        df[c] = df[c].astype(str)
-    df_enc = pd.get_dummies(df, columns=cat_cols).reindex(
-        columns=model_columns, fill_value=0
-    )
-    pred  = clf.predict(df_enc)[0]
-    proba = clf.predict_proba(df_enc)[0]
-    return pred, proba, df_enc
+    scorer = load_model()
+    pred, proba = scorer.predict(data)
+    return pred, proba, scorer.encoder.encode(data)
 
 RISK_STYLE = {
     "Bajo":  {"func": st.success, "icon": "🟢"},
@@ -237,34 +81,278 @@ RISK_STYLE = {
     "Alto":  {"func": st.error,   "icon": "🔴"}
 }
 
-def main():
-    # ─────────────────────────────────────────────────────────────────────────
-    # Inicializar base de datos y cargar modelo
-    # ─────────────────────────────────────────────────────────────────────────
-    init_db()
+# ─────────────────────────────────────────────────────────────────────────────
+# 7) SELECTORES DE CÓDIGOS
+# ─────────────────────────────────────────────────────────────────────────────
+def code_select(label: str, field: str, key: str) -> str:
+    """Selector de los códigos de ``field`` (mapeos.CODE_MAPS) con su descripción."""
+    codes = CODE_MAPS[field]
+    value = st.selectbox(label, codes, key=key)
+    st.caption(f"📖 {codes[value]}")
+    return value
+
+# ─────────────────────────────────────────────────────────────────────────────
+# 8) PÁGINAS EVALUAR Y EXPLICABILIDAD
+# ─────────────────────────────────────────────────────────────────────────────
+# Cada columna es un fragmento: cambiar un parámetro sólo vuelve a ejecutar la
+# columna de entradas (para actualizar su descripción) y el botón, que está en
+# la columna de resultados, sólo recalcula y redibuja esa columna. Los
+# resultados leen los valores de los widgets de st.session_state.
+def measured(name: str):
+    """Mide y perfila cada ejecución del fragmento, también sus reruns parciales.
+
+    Un rerun de fragmento no pasa por main(), así que page.<página> no
+    incluye el trabajo del botón; se registra aparte como ``name``.
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper():
+            try:
+                with metrics.timed(name), profiling.profiled(name):
+                    fn()
+            finally:
+                # El rerun parcial también corre en un hilo nuevo
+                release_connection()
+        return wrapper
+    return decorator
+
+
+@st.fragment
+def evaluar_inputs():
+    st.markdown("### 🔧 Parámetros de evaluación")
+
+    # Fuente de calor
+    code_select("Fuente de calor", "HEAT_SOURC", "eval_heat")
+
+    # Material combustible (multiselect)
+    mat_vals = st.multiselect(
+        "Material combustible",
+        options=TYPE_MAT_MAP,
+        default=[list(TYPE_MAT_MAP)[1]],
+        key="eval_mat"
+    )
+    if mat_vals:
+        st.caption("📖 " + ", ".join(TYPE_MAT_MAP[m] for m in mat_vals))
+    else:
+        st.caption("📖 Selecciona al menos un material")
+
+    # Estado estructural
+    code_select("Estado estructural", "STRUC_STAT", "eval_struct")
+
+    # Detector presente
+    code_select("Detector presente", "DETECTOR", "eval_det")
+
+    # Tipo de detector
+    code_select("Tipo de detector", "DET_TYPE", "eval_dtype")
+
+    # Área
+    st.slider("Superficie (m²)", min_value=1, max_value=10000, value=100, key="eval_area")
+
+    # ID manual (opcional)
+    st.number_input(
+        "ID manual (opcional)",
+        min_value=0,
+        value=0,
+        step=1,
+        help="Si lo dejas a 0 se usará autoincremental",
+        key="eval_id"
+    )
 
-    @st.cache_resource
-    def load_explainer():
-        return shap.TreeExplainer(clf)
 
-    explainer = load_explainer()
+@st.fragment
+@measured("fragment.evaluar")
+def evaluar_resultado():
+    evaluate = st.button("🔥 Evaluar riesgo", key="eval_btn")
+    if not evaluate:
+        st.info("Pulsa «🔥 Evaluar riesgo» para ver el resultado aquí.")
+        return
+
+    state = st.session_state
+    mat_vals = state["eval_mat"]
+    id_manual = state["eval_id"]
+    # Preparamos inputs
+    inputs_eval = {
+        "HEAT_SOURC": state["eval_heat"],
+        "TYPE_MAT": mat_vals[0] if mat_vals else None,
+        "STRUC_STAT": state["eval_struct"],
+        "DETECTOR": state["eval_det"],
+        "DET_TYPE": state["eval_dtype"],
+        "AREA": state["eval_area"]
+    }
+
+    # Validación
+    with metrics.timed("evaluar.validar"):
+        ok, errores = validar_codigo(inputs_eval)
+    if not mat_vals:
+        st.error("Debes seleccionar al menos un material combustible.")
+        return
+    if not ok:
+        for err in errores:
+            st.error(err)
+        return
+
+    # Si hay varios materiales, promediamos probas
+    # (una sola pasada del bosque para todos los materiales)
+    with metrics.timed("evaluar.predict"):
+        scorer = load_model()
+        probas = scorer.predict_proba_batch(
+            [{**inputs_eval, "TYPE_MAT": m} for m in mat_vals]
+        )
+        avg_proba = probas.mean(axis=0)
+
+        # Decidimos la clase final
+        risk = scorer.labels(avg_proba[np.newaxis])[0]
+
+    # Logueamos, guardando todos los mats como CSV
+    with metrics.timed("evaluar.log"):
+        log_prediction(
+            {**inputs_eval, "TYPE_MAT": ",".join(mat_vals)},
+            risk,
+            avg_proba,
+            id_manual if id_manual > 0 else None
+        )
 
-    def predict(data: dict):
-        df = pd.DataFrame([data])
-        for c in cat_cols:
-            df[c] = df[c].astype(str)
-        df_enc = pd.get_dummies(df, columns=cat_cols).reindex(
-            columns=model_columns, fill_value=0
+    # Mostrar resultado
+    with metrics.timed("evaluar.render"):
+        st.markdown("<div class='result-card'>", unsafe_allow_html=True)
+        style = RISK_STYLE[risk]
+        style["func"](f"{style['icon']} Nivel de riesgo: **{risk}**")
+        st.write(
+            f"🟢 Bajo: {avg_proba[0]:.1%}  |  "
+            f"🟡 Medio: {avg_proba[1]:.1%}  |  "
+            f"🔴 Alto: {avg_proba[2]:.1%}"
         )
-        pred = clf.predict(df_enc)[0]
-        proba = clf.predict_proba(df_enc)[0]
-        return pred, proba, df_enc
-
-    RISK_STYLE = {
-        "Bajo":  {"func": st.success, "icon": "🟢"},
-        "Medio": {"func": st.warning, "icon": "🟡"},
-        "Alto":  {"func": st.error,   "icon": "🔴"}
+        if risk == "Bajo":
+            st.balloons()
+        st.markdown("</div>", unsafe_allow_html=True)
+
+
+@st.fragment
+def explicar_inputs():
+    st.markdown("### 🔧 Parámetros de explicación")
+    code_select("Fuente de calor", "HEAT_SOURC", "ex1")
+
+    code_select("Material combustible", "TYPE_MAT", "ex2")
+
+    code_select("Estado estructural", "STRUC_STAT", "ex3")
+
+    code_select("Detector presente", "DETECTOR", "ex4")
+
+    code_select("Tipo de detector", "DET_TYPE", "ex5")
+
+    st.slider("Superficie (m²)", 1, 10000, 100, key="ex6")
+
+
+@st.fragment
+@measured("fragment.explicar")
+def explicar_resultado():
+    explain = st.button("🔎 Explicar riesgo", key="ex_btn")
+    explainer = get_explainer()
+
+    # 1) Explicación global: importancias y artefactos precalculados al
+    # entrenar (no necesita shap ni TreeExplainer)
+    st.markdown("### 📊 Importancia global (Random Forest)")
+    st.bar_chart(explainer.global_importances(top=10))
+    shap_medio = explainer.mean_abs_shap()
+    if shap_medio is not None:
+        st.markdown("### 📐 |SHAP| medio por variable y clase")
+        st.bar_chart(shap_medio)
+        art = explainer.artifacts
+        cobertura = art.get("coverage")
+        texto = (f"Calculado al entrenar sobre {art.get('random_sample_size', art['sample_size'])} "
+                 f"filas aleatorias")
+        if cobertura:
+            con_filas = sum(c["with_rows"] for c in cobertura.values())
+            total = sum(c["codes"] for c in cobertura.values())
+            texto += (f"; las contribuciones por código usan {art['sample_size']} filas "
+                      f"y cubren {con_filas} de {total} códigos")
+        if art.get("truncated"):
+            texto += " (muestra recortada por el tope de tiempo de SHAP)"
+        st.caption(texto + ".")
+
+    if not explain:
+        st.info("Pulsa «🔎 Explicar riesgo» para ver la explicación aquí.")
+        return
+
+    state = st.session_state
+    inputs_exp = {
+        "HEAT_SOURC": state["ex1"],
+        "TYPE_MAT": state["ex2"],
+        "STRUC_STAT": state["ex3"],
+        "DETECTOR": state["ex4"],
+        "DET_TYPE": state["ex5"],
+        "AREA": state["ex6"]
     }
+    ok, errores = validar_codigo(inputs_exp)
+    if not ok:
+        for err in errores:
+            st.error(err)
+        return
+
+    # 2) Contribución media de cada código elegido (artefactos)
+    contrib = explainer.code_contributions(inputs_exp)
+    if contrib is not None:
+        st.markdown("### 🧾 Contribución media de los códigos elegidos")
+        st.dataframe(contrib)
+
+    # 3) Explicación local con SHAP
+    if not SHAP_AVAILABLE:
+        st.error("Instala `shap` y `matplotlib` para ver la explicación local.")
+        return
+    # SHAP de la clase predicha (cacheado por códigos y versión)
+    pred, _, X_exp = predict(inputs_exp)
+    clase = list(explainer.scorer.classes_).index(pred)
+    st.markdown(f"### 🔍 Explicación local (SHAP) · clase {pred}")
+    explicacion = explainer.explanation(inputs_exp, clase, encoded=X_exp)
+    import shap
+    import matplotlib.pyplot as plt
+    with metrics.timed("explicar.render"):
+        fig, ax = plt.subplots()
+        shap.plots.bar(explicacion, max_display=10, show=False, ax=ax)
+        st.pyplot(fig)
+        plt.close(fig)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# 9) PÁGINA PERFORMANCE
+# ─────────────────────────────────────────────────────────────────────────────
+def performance_panel():
+    filas = metrics.summary()
+    if not filas:
+        st.write("Aún no hay mediciones en este proceso.")
+        return
+    df = pd.DataFrame(filas).set_index("name").sort_values("total_s", ascending=False)
+    df = df.rename(columns={"count": "llamadas"})
+    st.dataframe(df.round(2), use_container_width=True)
+    if "p99_ms" in df:
+        st.markdown("#### p99 por etapa (ms)")
+        st.bar_chart(df["p99_ms"].dropna().sort_values(ascending=False).head(15))
+    info = bundle_info() or {}
+    cache = prediction_cache.stats()
+    st.caption(
+        f"Modelo {info.get('version', '?')} cargado en {info.get('load_seconds', 0):.2f}s · "
+        f"RSS {info.get('rss_bytes', 0) / 2**20:.0f} MiB · "
+        f"caché de predicciones {cache['size']}/{cache['maxsize']} "
+        f"(aciertos {cache['hit_rate']:.0%})"
+    )
+    escritura = write_behind_stats()
+    if escritura is not None:
+        problemas = escritura["pending"] or escritura["dropped"] or escritura["lost"]
+        aviso = st.warning if problemas else st.caption
+        aviso(
+            f"Logging asíncrono: {escritura['pending']} predicciones pendientes · "
+            f"{escritura['failed_writes']} escrituras fallidas · "
+            f"{escritura['dropped']} descartadas por error permanente · "
+            f"{escritura['lost']} perdidas al cerrar"
+        )
+
+
+def main():
+    # ─────────────────────────────────────────────────────────────────────────
+    # Inicializar base de datos y cargar modelo
+    # ─────────────────────────────────────────────────────────────────────────
+    init_storage()
+    metrics.start_exporter()
 
     # ─────────────────────────────────────────────────────────────────────────
     # Navegación
@@ -272,8 +360,18 @@ def main():
     page = st.sidebar.radio("🏠 Navegación", [
         "Evaluar", "CRUD", "Histórico",
         "Explicabilidad", "Ayuda",
-        "Dashboard", "Retrain"
+        "Dashboard", "Retrain", "Performance"
     ])
+    # st.rerun sale con una excepción: el render se mide igualmente
+    try:
+        with metrics.timed(f"page.{page}"), profiling.profiled(f"page.{page}"):
+            render_page(page)
+    finally:
+        # Cada rerun corre en un hilo nuevo: la conexión vuelve al pool
+        release_connection()
+
+
+def render_page(page: str):
     # ─────────────────────────────────────────────────────────────────────────
     # Página: Evaluar
     # ─────────────────────────────────────────────────────────────────────────
@@ -283,129 +381,10 @@ def main():
             "Selecciona los parámetros, opcionalmente el ID, y haz clic en **🔥 Evaluar riesgo**. Verás el resultado a la derecha.")
 
         col_inputs, col_results = st.columns([1, 2], gap="large")
-
         with col_inputs:
-            st.markdown("### 🔧 Parámetros de evaluación")
-
-            # Fuente de calor
-            heat_val = st.selectbox(
-                "Fuente de calor",
-                list(HEAT_SOURC_MAP.keys()),
-                key="eval_heat"
-            )
-            st.caption(f"📖 {HEAT_SOURC_MAP[heat_val]}")
-
-            # Material combustible (multiselect)
-            mat_vals = st.multiselect(
-                "Material combustible",
-                options=list(TYPE_MAT_MAP.keys()),
-                default=[list(TYPE_MAT_MAP.keys())[1]],
-                key="eval_mat"
-            )
-            if mat_vals:
-                st.caption("📖 " + ", ".join(TYPE_MAT_MAP[m] for m in mat_vals))
-            else:
-                st.caption("📖 Selecciona al menos un material")
-
-            # Estado estructural
-            struct_val = st.selectbox(
-                "Estado estructural",
-                list(STRUC_STAT_MAP.keys()),
-                key="eval_struct"
-            )
-            st.caption(f"📖 {STRUC_STAT_MAP[struct_val]}")
-
-            # Detector presente
-            det_val = st.selectbox(
-                "Detector presente",
-                list(DETECTOR_MAP.keys()),
-                key="eval_det"
-            )
-            st.caption(f"📖 {DETECTOR_MAP[det_val]}")
-
-            # Tipo de detector
-            dtype_val = st.selectbox(
-                "Tipo de detector",
-                list(DET_TYPE_MAP.keys()),
-                key="eval_dtype"
-            )
-            st.caption(f"📖 {DET_TYPE_MAP[dtype_val]}")
-
-            # Área
-            area_val = st.slider(
-                "Superficie (m²)",
-                min_value=1,
-                max_value=10000,
-                value=100,
-                key="eval_area"
-            )
-
-            # ID manual (opcional)
-            id_manual = st.number_input(
-                "ID manual (opcional)",
-                min_value=0,
-                value=0,
-                step=1,
-                help="Si lo dejas a 0 se usará autoincremental",
-                key="eval_id"
-            )
-
-            evaluate = st.button("🔥 Evaluar riesgo", key="eval_btn")
-
+            evaluar_inputs()
         with col_results:
-            if not evaluate:
-                st.info("Pulsa «🔥 Evaluar riesgo» para ver el resultado aquí.")
-            else:
-                # Preparamos inputs
-                inputs_eval = {
-                    "HEAT_SOURC": heat_val,
-                    "TYPE_MAT": mat_vals[0] if mat_vals else None,
-                    "STRUC_STAT": struct_val,
-                    "DETECTOR": det_val,
-                    "DET_TYPE": dtype_val,
-                    "AREA": area_val
-                }
-
-                # Validación
-                ok, errores = validar_codigo(inputs_eval)
-                if not mat_vals:
-                    col_results.error("Debes seleccionar al menos un material combustible.")
-                elif not ok:
-                    for err in errores:
-                        col_results.error(err)
-                else:
-                    # Si hay varios materiales, promediamos probas
-                    import numpy as np
-                    probas = []
-                    for m in mat_vals:
-                        inp = {**inputs_eval, "TYPE_MAT": m}
-                        _, p, _ = predict(inp)
-                        probas.append(p)
-                    avg_proba = np.mean(probas, axis=0)
-
-                    # Decidimos la clase final
-                    risk = clf.classes_[np.argmax(avg_proba)]
-
-                    # Logueamos, guardando todos los mats como CSV
-                    log_prediction(
-                        {**inputs_eval, "TYPE_MAT": ",".join(mat_vals)},
-                        risk,
-                        avg_proba,
-                        id_manual if id_manual > 0 else None
-                    )
-
-                    # Mostrar resultado
-                    st.markdown("<div class='result-card'>", unsafe_allow_html=True)
-                    style = RISK_STYLE[risk]
-                    style["func"](f"{style['icon']} Nivel de riesgo: **{risk}**")
-                    st.write(
-                        f"🟢 Bajo: {avg_proba[0]:.1%}  |  "
-                        f"🟡 Medio: {avg_proba[1]:.1%}  |  "
-                        f"🔴 Alto: {avg_proba[2]:.1%}"
-                    )
-                    if risk == "Bajo":
-                        st.balloons()
-                    st.markdown("</div>", unsafe_allow_html=True)
+            evaluar_resultado()
 
     # ─────────────────────────────────────────────────────────────────────────
     # Página: CRUD
@@ -416,33 +395,27 @@ def main():
         col1, col2 = st.columns(2)
         with col1:
             if st.button("Consultar"):
-                rec = next((r for r in fetch_logs() if r["id"] == rec_id), None)
+                rec = get_log(rec_id)
                 if rec:
                     st.json(rec)
                 else:
                     st.warning("Registro no encontrado.")
         with col2:
             if st.button("Eliminar"):
-                conn = sqlite3.connect("incendios.db")
-                c = conn.cursor()
-                c.execute("DELETE FROM registros_incendios WHERE id = ?", (rec_id,))
-                conn.commit()
-                conn.close()
-                st.info(f"Registro {rec_id} eliminado (si existía).")
+                if delete_log(rec_id):
+                    st.info(f"Registro {rec_id} eliminado.")
+                else:
+                    st.warning("Registro no encontrado.")
 
     # ─────────────────────────────────────────────────────────────────────────
     # Página: Histórico
     # ─────────────────────────────────────────────────────────────────────────
     elif page == "Histórico":
         st.markdown("## <span class='emoji'>📜</span> Histórico de Predicciones", unsafe_allow_html=True)
-        logs = fetch_logs()
-        if not logs:
+        rango = log_date_range()
+        if rango is None:
             st.write("No hay registros aún.")
         else:
-            # Montamos el DataFrame y convertimos timestamp
-            df = pd.DataFrame(logs)
-            df["timestamp"] = pd.to_datetime(df["timestamp"])
-
             # Sidebar de filtros
             with st.sidebar.expander("🔍 Filtros del Historial", expanded=True):
                 # Filtrar por nivel de riesgo
@@ -451,23 +424,47 @@ def main():
                     options=["Bajo", "Medio", "Alto"],
                     default=["Bajo", "Medio", "Alto"]
                 )
-                # Filtrar por rango de fechas
+                # Filtrar por rango de fechas (por defecto, MIN/MAX en SQL)
                 fechas = st.date_input(
                     "Rango de fechas",
-                    value=[df["timestamp"].dt.date.min(), df["timestamp"].dt.date.max()]
+                    value=list(rango)
                 )
-
-            # Aplicamos los filtros
-            mask = (
-                    df["RISK"].isin(niveles)
-                    & (df["timestamp"].dt.date >= fechas[0])
-                    & (df["timestamp"].dt.date <= fechas[1])
+                por_pagina = st.selectbox("Filas por página", [25, 50, 100, 200], index=1)
+
+            # Mientras se elige el rango, date_input devuelve una sola fecha
+            desde = fechas[0] if fechas else rango[0]
+            hasta = fechas[1] if len(fechas) > 1 else desde
+
+            # Paginación por clave: guardamos la clave inicial de cada página
+            # y volvemos a la primera si cambian los filtros.
+            filtros = (tuple(niveles), desde, hasta, por_pagina)
+            if st.session_state.get("hist_filtros") != filtros:
+                st.session_state["hist_filtros"] = filtros
+                st.session_state["hist_cursores"] = [None]
+            cursores = st.session_state["hist_cursores"]
+
+            rows, total = query_logs(
+                niveles, desde, hasta, limit=por_pagina, after=cursores[-1]
             )
-            df_filtrado = df.loc[mask].sort_values("timestamp", ascending=False)
+            inicio = (len(cursores) - 1) * por_pagina
 
             # Mostramos resultado
-            st.write(f"Mostrando {len(df_filtrado)} registros:")
-            st.dataframe(df_filtrado.reset_index(drop=True))
+            with metrics.timed("historico.render"):
+                if rows:
+                    st.write(f"Mostrando {inicio + 1}–{inicio + len(rows)} de {total} registros:")
+                    st.dataframe(pd.DataFrame(rows))
+                else:
+                    st.write(f"Mostrando 0 de {total} registros.")
+
+            col_prev, col_next = st.columns(2)
+            with col_prev:
+                if st.button("◀ Anterior", disabled=len(cursores) == 1):
+                    cursores.pop()
+                    st.rerun()
+            with col_next:
+                if st.button("Siguiente ▶", disabled=inicio + len(rows) >= total):
+                    cursores.append((rows[-1]["timestamp"], rows[-1]["id"]))
+                    st.rerun()
 
     # ─────────────────────────────────────────────────────────────────────────
     # --- Página: Explicabilidad ---
@@ -477,63 +474,10 @@ def main():
             "Selecciona los parámetros y haz clic en **🔎 Explicar riesgo**. Verás a la derecha la importancia global y, si SHAP está disponible, el gráfico local.")
 
         col_inputs, col_results = st.columns([1, 2], gap="large")
-
         with col_inputs:
-            st.markdown("### 🔧 Parámetros de explicación")
-            heat = col_inputs.selectbox("Fuente de calor", list(HEAT_SOURC_MAP.keys()), key="ex1")
-            col_inputs.caption(f"📖 {HEAT_SOURC_MAP.get(heat, '')}")
-
-            mat = col_inputs.selectbox("Material combustible", list(TYPE_MAT_MAP.keys()), key="ex2")
-            col_inputs.caption(f"📖 {TYPE_MAT_MAP.get(mat, '')}")
-
-            struct = col_inputs.selectbox("Estado estructural", list(STRUC_STAT_MAP.keys()), key="ex3")
-            col_inputs.caption(f"📖 {STRUC_STAT_MAP.get(struct, '')}")
-
-            det = col_inputs.selectbox("Detector presente", list(DETECTOR_MAP.keys()), key="ex4")
-            col_inputs.caption(f"📖 {DETECTOR_MAP.get(det, '')}")
-
-            dtype = col_inputs.selectbox("Tipo de detector", list(DET_TYPE_MAP.keys()), key="ex5")
-            col_inputs.caption(f"📖 {DET_TYPE_MAP.get(dtype, '')}")
-
-            area = col_inputs.slider("Superficie (m²)", 1, 10000, 100, key="ex6")
-
-            explain = col_inputs.button("🔎 Explicar riesgo")
-
+            explicar_inputs()
         with col_results:
-            if not explain:
-                col_results.info("Pulsa «🔎 Explicar riesgo» para ver la explicación aquí.")
-            else:
-                inputs_exp = {
-                    "HEAT_SOURC": heat,
-                    "TYPE_MAT": mat,
-                    "STRUC_STAT": struct,
-                    "DETECTOR": det,
-                    "DET_TYPE": dtype,
-                    "AREA": area
-                }
-                ok, errores = validar_codigo(inputs_exp)
-                if not ok:
-                    for err in errores:
-                        col_results.error(err)
-                else:
-                    # 1) Importancia global
-                    feat_imp = pd.Series(clf.feature_importances_, index=model_columns) \
-                        .sort_values(ascending=False).head(10)
-                    col_results.markdown("### 📊 Importancia global (Random Forest)")
-                    col_results.bar_chart(feat_imp)
-
-                    # 2) Explicación local con SHAP
-                    if not SHAP_AVAILABLE:
-                        col_results.error("Instala `shap` y `matplotlib` para ver la explicación local.")
-                    else:
-                        # Preparamos la fila codificada
-                        _, _, df_enc = predict(inputs_exp)
-                        shap_values = explainer.shap_values(df_enc)
-                        col_results.markdown("### 🔍 Explicación local (SHAP)")
-                        # Bar chart SHAP
-                        fig, ax = plt.subplots()
-                        shap.plots.bar(shap_values, df_enc, show=False, ax=ax)
-                        col_results.pyplot(fig)
+            explicar_resultado()
     # ─────────────────────────────────────────────────────────────────────────
     # Página: Ayuda
     # ─────────────────────────────────────────────────────────────────────────
@@ -565,14 +509,16 @@ def main():
     # ─────────────────────────────────────────────────────────────────────────
     elif page == "Dashboard":
         st.markdown("## <span class='emoji'>📊</span> Dashboard Estadísticas", unsafe_allow_html=True)
-        logs = fetch_logs()
-        if logs:
-            df = pd.DataFrame(logs)
-            dist = df["RISK"].value_counts().reindex(["Bajo","Medio","Alto"], fill_value=0)
+        # Sólo se leen los resúmenes que mantienen los triggers de la BD
+        counts = fetch_risk_counts()
+        if counts:
+            dist = pd.Series(counts).reindex(["Bajo","Medio","Alto"], fill_value=0)
             st.bar_chart(dist)
-            df["timestamp"] = pd.to_datetime(df["timestamp"])
-            ts = df.set_index("timestamp").resample("D").size()
-            st.line_chart(ts)
+            diario = fetch_daily_counts()
+            if diario:
+                dias, n = zip(*diario)
+                ts = pd.Series(n, index=pd.to_datetime(list(dias))).resample("D").sum()
+                st.line_chart(ts)
         else:
             st.write("No hay datos para mostrar.")
 
@@ -581,30 +527,85 @@ def main():
     # ─────────────────────────────────────────────────────────────────────────
     elif page == "Retrain":
         st.markdown("## <span class='emoji'>🔄</span> Retraining del Modelo", unsafe_allow_html=True)
-        if st.button("Ejecutar Retraining"):
-            with st.spinner("Entrenando..."):
-                # Asumimos que train_model.py define:
-                # def retrain_and_return_test():
-                #     model, X_test, y_test = ...  # entrena, guarda modelo, y devuelve test
-                from train_model import retrain_and_return_test
-                model, X_test, y_test = retrain_and_return_test()
-
-            st.success("Retraining completado.")
-
-            # Predicción sobre el conjunto de test
-            y_pred = model.predict(X_test)
-
-            # 1) Reporte de clasificación
-            report_dict = classification_report(y_test, y_pred, output_dict=True)
-            df_report = pd.DataFrame(report_dict).transpose()
+        estrategia = st.selectbox(
+            "Búsqueda de hiperparámetros",
+            ["grid", "halving", "warm_start"],
+            format_func=lambda s: {
+                "halving": "Successive halving (rápida)",
+                "warm_start": "Crecimiento de n_estimators (warm start)",
+                "grid": "Rejilla completa (lenta)",
+            }[s],
+        )
+        presupuesto = st.number_input(
+            "Presupuesto de búsqueda (segundos, 0 = sin límite)", min_value=0, value=0, step=60
+        )
+        # El entrenamiento corre en otro proceso (jobs.RetrainJob); al terminar
+        # publica un bundle nuevo que load_model recoge en cada sesión.
+        job = job_registry().get()
+        if st.button("Ejecutar Retraining", disabled=job is not None and job.running):
+            try:
+                job = job_registry().start(strategy=estrategia,
+                                           budget_s=presupuesto or None)
+            except RuntimeError as e:
+                st.warning(str(e))
+
+        if job is not None and job.running:
+            st.progress(job.progress, text=f"Entrenando ({job.phase}) · {job.elapsed:.0f}s")
+            if st.button("Cancelar", disabled=job.cancel_requested is not None):
+                job.cancel()
+            time.sleep(1)
+            st.rerun()
+        elif job is not None and job.state == "cancelled":
+            st.info("Retraining cancelado; se mantiene el modelo anterior.")
+        elif job is not None and job.state == "failed":
+            st.error("El retraining ha fallado; se mantiene el modelo anterior.")
+            st.code(job.error)
+        elif job is not None and job.state == "done":
+            res = job.result
+            st.success(f"Retraining completado: modelo {res['version']} en uso.")
+            st.write("Mejores parámetros:", res["best_params"])
+            timings = res["timings"]
+            st.caption(" · ".join(
+                f"{fase}: {seg:.1f}s" for fase, seg in timings.items() if fase != "fits"
+            ) + f" · ajustes: {timings['fits']}")
+
+            # 1) Reporte de clasificación (sobre el conjunto de test)
+            df_report = pd.DataFrame(res["report"]).transpose()
             st.markdown("#### 📋 Reporte de clasificación")
             st.dataframe(df_report)
 
             # 2) Matriz de confusión
-            cm = confusion_matrix(y_test, y_pred, labels=model.classes_)
-            df_cm = pd.DataFrame(cm, index=model.classes_, columns=model.classes_)
+            df_cm = pd.DataFrame(res["confusion"], index=res["labels"], columns=res["labels"])
             st.markdown("#### 🔢 Matriz de confusión")
             st.table(df_cm)
 
+    # ─────────────────────────────────────────────────────────────────────────
+    # Página: Performance
+    # ─────────────────────────────────────────────────────────────────────────
+    elif page == "Performance":
+        st.markdown("## <span class='emoji'>⏱️</span> Rendimiento", unsafe_allow_html=True)
+        if not metrics.enabled():
+            st.info("Las métricas están desactivadas (AIGNITE_METRICS=0).")
+            return
+        st.write(
+            "Latencias de cada etapa medidas en este proceso del servidor "
+            "(todas las sesiones), sobre las últimas muestras de cada una.")
+        auto = st.checkbox("Actualizar cada 5 s", value=False)
+        # Sólo el panel se vuelve a ejecutar, no la página entera
+        st.fragment(performance_panel, run_every=5 if auto else None)()
+
+        col_prom, col_bd, col_reset = st.columns(3)
+        with col_prom:
+            st.download_button("📥 Exportar (Prometheus)", metrics.prometheus_text(),
+                               file_name="aignite_metrics.prom", mime="text/plain")
+        with col_bd:
+            if st.button("💾 Guardar en la BD"):
+                n = save_metrics(metrics.summary())
+                st.success(f"{n} etapas guardadas en metricas_rendimiento.")
+        with col_reset:
+            if st.button("🗑️ Reiniciar"):
+                metrics.reset()
+                st.rerun()
+
 if __name__ == "__main__":
     main()
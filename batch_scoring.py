@@ -0,0 +1,359 @@
+# batch_scoring.py
+#
+# Puntuación no interactiva de incidentes: lectura en streaming de JSONL o de
+# líneas separadas por "^" (formato fireincident), puntuación por bloques de
+# tamaño fijo y salida JSONL. La memoria no depende del tamaño de la entrada.
+
+import csv
+import json
+import math
+import sys
+import time
+from itertools import islice
+from typing import Dict, IO, Iterable, Iterator, List, Optional
+
+from mapeos import CODE_MAPS, validar_codigo
+
+FIELDS = list(CODE_MAPS)
+CHUNK_SIZE = 1000
+
+
+class InvalidLine(dict):
+    """Línea de entrada que no se puntúa (JSON mal formado, no objeto o
+    registro que no pasa ``validate``).
+
+    Se emite en la salida tal cual, con el número de línea o el registro y el
+    error, y cuenta como error en el informe: una línea mala no corta el stream.
+    """
+
+
+def _parse_json_line(line: str, lineno: int) -> Dict:
+    try:
+        record = json.loads(line)
+    except ValueError as exc:
+        return InvalidLine(line=lineno, error=f"JSON inválido: {exc}")
+    if not isinstance(record, dict):
+        return InvalidLine(line=lineno, error=f"Se esperaba un objeto JSON, no {type(record).__name__}")
+    return record
+
+
+def detect_format(first_line: str) -> str:
+    return "jsonl" if first_line.lstrip().startswith("{") else "caret"
+
+
+def read_records(stream: IO[str], fmt: str = "auto") -> Iterator[Dict]:
+    """Registros de ``stream`` uno a uno.
+
+    En formato "caret" la primera línea es la cabecera (como en
+    ``fireincident.txt``) y sólo se conservan las variables del modelo y AREA.
+    En JSONL, cada línea que no sea un objeto JSON válido sale como
+    ``InvalidLine``.
+    """
+    lines = ((n, line.rstrip("\r\n")) for n, line in enumerate(stream, 1))
+    lines = ((n, line) for n, line in lines if line.strip())
+    first = next(lines, None)
+    if first is None:
+        return
+    if fmt == "auto":
+        fmt = detect_format(first[1])
+    if fmt == "jsonl":
+        yield _parse_json_line(first[1], first[0])
+        for n, line in lines:
+            yield _parse_json_line(line, n)
+    elif fmt == "caret":
+        header = [h.strip() for h in first[1].split("^")]
+        keep = [(i, h) for i, h in enumerate(header) if h in FIELDS or h == "AREA"]
+        for _, line in lines:
+            values = line.split("^")
+            yield {h: values[i].strip() if i < len(values) else "" for i, h in keep}
+    else:
+        raise ValueError(f"Formato de entrada desconocido: {fmt}")
+
+
+def chunked(records: Iterable[Dict], size: int) -> Iterator[List[Dict]]:
+    it = iter(records)
+    while True:
+        chunk = list(islice(it, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def missing_fields(record: Dict) -> List[str]:
+    return [f for f in FIELDS if f not in record]
+
+
+class ValidationError(ValueError):
+    pass
+
+
+def _area(value) -> Optional[float]:
+    if value is None or value == "":
+        return None
+    try:
+        area = float(value)
+    except (TypeError, ValueError):
+        area = math.nan
+    if isinstance(value, bool) or not math.isfinite(area):
+        raise ValidationError(f"AREA inválida: {value!r}")
+    return area
+
+
+def validate(record) -> Dict:
+    """Mismas comprobaciones que la app (``validar_codigo``) sobre un registro JSON.
+
+    La usan el servidor y la puntuación por lotes: los dos caminos aceptan y
+    rechazan exactamente los mismos registros.
+    """
+    if not isinstance(record, dict):
+        raise ValidationError("Cada registro debe ser un objeto JSON")
+    faltan = missing_fields(record)
+    if faltan:
+        raise ValidationError(f"Faltan campos: {faltan}")
+    record = {**record, **{f: str(record[f]) for f in FIELDS}}
+    # AREA es opcional pero se guarda en la BD: un valor que no sea numérico
+    # haría fallar el guardado de todo el lote en el que vaya
+    if "AREA" in record:
+        record["AREA"] = _area(record["AREA"])
+    ok, errores = validar_codigo(record)
+    if not ok:
+        raise ValidationError("; ".join(errores))
+    return record
+
+
+def result_record(record: Dict, label, proba, classes) -> Dict:
+    return {
+        **record,
+        "RISK": str(label),
+        "probas": {str(c): float(p) for c, p in zip(classes, proba)},
+    }
+
+
+def score_stream(scorer, records: Iterable[Dict], out: IO[str],
+                 chunk_size: int = CHUNK_SIZE, log: bool = False,
+                 report: Optional[IO[str]] = sys.stderr) -> Dict:
+    """Puntúa ``records`` por bloques y escribe una línea JSON por registro.
+
+    Los registros que no pasan ``validate`` (variables ausentes o códigos
+    inválidos, como en el servidor) y las líneas ilegibles (``InvalidLine``)
+    se emiten con ``error`` y no se puntúan. Con ``log`` cada bloque se
+    guarda en registros_incendios en una sola transacción. Devuelve (y
+    muestra en ``report``) el rendimiento.
+    """
+    if log:
+        from database import init_db, log_predictions
+        init_db()
+
+    t0 = time.perf_counter()
+    n_ok = n_err = 0
+    t_score = t_log = 0.0
+    for chunk in chunked(records, chunk_size):
+        # Cada registro pasa a ser el validado o la línea de error a emitir
+        checked = []
+        for record in chunk:
+            if isinstance(record, InvalidLine):
+                checked.append(record)
+                continue
+            try:
+                checked.append(validate(record))
+            except ValidationError as exc:
+                checked.append(InvalidLine(record, error=str(exc)))
+        valid = [r for r in checked if not isinstance(r, InvalidLine)]
+        t = time.perf_counter()
+        labels, probas = scorer.predict_batch(valid)
+        t_score += time.perf_counter() - t
+
+        results = iter(zip(labels, probas))
+        lines = []
+        for record in checked:
+            if isinstance(record, InvalidLine):
+                n_err += 1
+                lines.append(json.dumps(record))
+            else:
+                label, proba = next(results)
+                lines.append(json.dumps(result_record(record, label, proba, scorer.classes_)))
+        out.write("\n".join(lines) + "\n")
+        n_ok += len(valid)
+
+        if log and valid:
+            t = time.perf_counter()
+            log_predictions(list(zip(valid, labels, probas)))
+            t_log += time.perf_counter() - t
+    out.flush()
+
+    elapsed = time.perf_counter() - t0
+    stats = {
+        "records": n_ok + n_err,
+        "scored": n_ok,
+        "errors": n_err,
+        "seconds": elapsed,
+        "records_per_s": (n_ok + n_err) / elapsed if elapsed else 0.0,
+        "score_seconds": t_score,
+        "log_seconds": t_log,
+    }
+    if report is not None:
+        print(
+            f"{stats['records']} registros ({n_err} con error) en {elapsed:.2f}s: "
+            f"{stats['records_per_s']:.0f} reg/s "
+            f"(predicción {t_score:.2f}s, BD {t_log:.2f}s)",
+            file=report,
+        )
+    return stats
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Puntuación masiva multiproceso (re-scoring anual del archivo)
+# ─────────────────────────────────────────────────────────────────────────────
+BULK_CHUNK_SIZE = 50000
+
+# Scorer de cada proceso del pool: se carga una vez en el initializer
+_worker_scorer = None
+
+
+def _init_worker(backend: Optional[str], model_path: str):
+    global _worker_scorer
+    from scoring import get_scorer
+    # Bundle abierto con mmap: los arrays planos se comparten entre procesos
+    _worker_scorer = get_scorer(model_path, backend)
+
+
+def _worker_classes() -> List[str]:
+    return [str(c) for c in _worker_scorer.classes_]
+
+
+def _score_columns(columns: Dict[str, List]):
+    t = time.perf_counter()
+    probas = _worker_scorer.predict_proba_columns(columns)
+    labels = _worker_scorer.labels(probas)
+    return labels, probas, time.perf_counter() - t
+
+
+def read_fireincident_chunks(path: str, chunk_size: int = BULK_CHUNK_SIZE,
+                             encoding: str = "latin1") -> Iterator[Dict[str, List]]:
+    """Bloques ``{variable: valores}`` de un fichero fireincident ('^').
+
+    Incluye AREA (float o None) si el fichero tiene esa columna, como el
+    formato "caret" de ``read_records``.
+    """
+    import pandas as pd
+    reader = pd.read_csv(
+        path, sep="^", usecols=lambda c: c in FIELDS or c == "AREA", dtype=str,
+        keep_default_na=False, encoding=encoding, chunksize=chunk_size,
+    )
+    for chunk in reader:
+        faltan = [c for c in FIELDS if c not in chunk]
+        if faltan:
+            raise ValueError(f"Faltan columnas en {path}: {faltan}")
+        columns = {c: chunk[c].tolist() for c in FIELDS}
+        if "AREA" in chunk:
+            area = pd.to_numeric(chunk["AREA"], errors="coerce")
+            columns["AREA"] = area.astype(object).where(area.notna(), None).tolist()
+        yield columns
+
+
+def bulk_score(input_path: str, output_path: Optional[str] = None,
+               to_db: bool = False, workers: Optional[int] = None,
+               chunk_size: int = BULK_CHUNK_SIZE, backend: Optional[str] = None,
+               model_path: Optional[str] = None, encoding: str = "latin1",
+               report: Optional[IO[str]] = sys.stderr) -> Dict:
+    """Puntúa un fichero fireincident en un pool de procesos.
+
+    El proceso principal lee por bloques y los reparte; como mucho hay
+    ``2 * workers`` bloques en vuelo, así que la memoria está acotada. Los
+    resultados se escriben en el orden de entrada (CSV en ``output_path``
+    y/o registros_incendios con ``to_db``).
+    """
+    import os
+    from collections import deque
+    from concurrent.futures import ProcessPoolExecutor
+
+    from model_store import MODEL_PATH
+
+    if output_path is None and not to_db:
+        raise ValueError("Indica un fichero de salida o la base de datos")
+    model_path = model_path or MODEL_PATH
+    workers = workers or os.cpu_count() or 1
+    if to_db:
+        from database import init_db, log_predictions
+        init_db()
+    out = open(output_path, "w", encoding="utf-8", newline="") if output_path else None
+    # csv.writer entrecomilla los códigos con comas, comillas o saltos de línea
+    writer = csv.writer(out, lineterminator="\n") if out is not None else None
+
+    n = 0
+    t_read = t_score_cpu = t_write = 0.0
+    t0 = time.perf_counter()
+
+    def write(columns, labels, probas):
+        nonlocal t_write
+        t = time.perf_counter()
+        if writer is not None:
+            rows = zip(*(columns[c] for c in FIELDS), labels, probas.tolist())
+            writer.writerows((*codes, label, *p) for *codes, label, p in rows)
+        if to_db:
+            # AREA se guarda como en la app y el CLI (None si no viene)
+            areas = columns.get("AREA") or [None] * len(labels)
+            records = [dict(zip(FIELDS, codes), AREA=area)
+                       for *codes, area in zip(*(columns[c] for c in FIELDS), areas)]
+            log_predictions(list(zip(records, labels.tolist(), probas)))
+        t_write += time.perf_counter() - t
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(backend, model_path)) as pool:
+            # El modelo sólo se carga en los procesos del pool
+            classes = pool.submit(_worker_classes).result()
+            if writer is not None:
+                writer.writerow(FIELDS + ["RISK"] + [f"prob_{c}" for c in classes])
+            pending = deque()
+            chunks = read_fireincident_chunks(input_path, chunk_size, encoding)
+            while True:
+                t = time.perf_counter()
+                columns = next(chunks, None)
+                t_read += time.perf_counter() - t
+                if columns is not None:
+                    # AREA no hace falta para puntuar: no se envía al pool
+                    features = {c: columns[c] for c in FIELDS}
+                    pending.append((columns, pool.submit(_score_columns, features)))
+                # Se escribe siempre el bloque más antiguo: orden de entrada
+                while pending and (columns is None or len(pending) >= 2 * workers):
+                    done_columns, future = pending.popleft()
+                    labels, probas, cpu = future.result()
+                    t_score_cpu += cpu
+                    n += len(labels)
+                    write(done_columns, labels, probas)
+                if columns is None:
+                    break
+    finally:
+        if out is not None:
+            out.close()
+
+    elapsed = time.perf_counter() - t0
+
+    def rate(seconds):
+        return n / seconds if seconds else 0.0
+
+    stats = {
+        "records": n,
+        "workers": workers,
+        "chunk_size": chunk_size,
+        "seconds": elapsed,
+        "records_per_s": rate(elapsed),
+        "read_seconds": t_read,
+        "read_records_per_s": rate(t_read),
+        "score_cpu_seconds": t_score_cpu,
+        "score_records_per_s_per_worker": rate(t_score_cpu),
+        "write_seconds": t_write,
+        "write_records_per_s": rate(t_write),
+    }
+    if report is not None:
+        print(
+            f"{n} registros en {elapsed:.2f}s con {workers} procesos: "
+            f"{stats['records_per_s']:.0f} reg/s en total\n"
+            f"  lectura    {t_read:8.2f}s  {stats['read_records_per_s']:12.0f} reg/s\n"
+            f"  predicción {t_score_cpu:8.2f}s  "
+            f"{stats['score_records_per_s_per_worker']:12.0f} reg/s por proceso\n"
+            f"  escritura  {t_write:8.2f}s  {stats['write_records_per_s']:12.0f} reg/s",
+            file=report,
+        )
+    return stats
@@ -0,0 +1,7 @@
+# benchmarks
+#
+# Suite de rendimiento de AIGNITE. Se ejecuta desde la raíz del repositorio:
+#
+#   python -m benchmarks.generate --rows 1000000 --output data/raw/bench.txt
+#   python -m benchmarks.run --sizes 10000 1000000
+#   python -m benchmarks.compare antes.json despues.json
@@ -0,0 +1,56 @@
+# benchmarks/compare.py
+#
+# Compara dos ficheros de resultados de benchmarks.run métrica a métrica.
+#
+#   python -m benchmarks.compare benchmarks/results/antes.json benchmarks/results/despues.json
+
+import argparse
+import json
+from typing import Dict
+
+# Métricas en las que más es mejor (el resto son tiempos: menos es mejor)
+HIGHER_IS_BETTER = ("_per_s",)
+
+
+def flatten(tree: Dict, prefix: str = "") -> Dict[str, float]:
+    out = {}
+    for key, value in tree.items():
+        path = f"{prefix}.{key}" if prefix else str(key)
+        if isinstance(value, dict):
+            out.update(flatten(value, path))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            out[path] = float(value)
+    return out
+
+
+def compare(before: Dict, after: Dict) -> None:
+    a, b = flatten(before["results"]), flatten(after["results"])
+    print(f"antes:   {before['meta'].get('commit')} ({before['meta'].get('started')})")
+    print(f"después: {after['meta'].get('commit')} ({after['meta'].get('started')})\n")
+    width = max((len(k) for k in a if k in b), default=10)
+    for key in sorted(k for k in a if k in b):
+        if key.endswith((".count", ".rows", ".fits")) or ".best_params." in key:
+            continue
+        old, new = a[key], b[key]
+        if old == 0:
+            continue
+        change = new / old - 1
+        better = change > 0 if key.endswith(HIGHER_IS_BETTER) else change < 0
+        mark = "+" if better and abs(change) >= 0.05 else "-" if abs(change) >= 0.05 else " "
+        print(f"{key:<{width}}  {old:>14.4g}  {new:>14.4g}  {change:>+8.1%} {mark}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compara dos resultados de benchmarks")
+    parser.add_argument("before")
+    parser.add_argument("after")
+    args = parser.parse_args(argv)
+    with open(args.before, encoding="utf-8") as f:
+        before = json.load(f)
+    with open(args.after, encoding="utf-8") as f:
+        after = json.load(f)
+    compare(before, after)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+# benchmarks/generate.py
+#
+# Generador de ficheros fireincident sintéticos ('^', latin1, con cabecera)
+# del tamaño que se quiera. Los códigos salen de los diccionarios de mapeos
+# con una distribución de cola larga (unos pocos códigos concentran la mayoría
+# de incidentes, como en los datos reales), más algo de 'UUU' y vacíos.
+# FIRE_SPRD depende de los códigos (más ruido), así que el modelo tiene algo
+# que aprender. Con la misma semilla el fichero es idéntico byte a byte.
+
+import argparse
+import os
+import sys
+import time
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+from mapeos import CODE_MAPS
+
+FEATURES = list(CODE_MAPS)
+COLUMNS = ["INC_NO", "INC_DATE"] + FEATURES + ["FIRE_SPRD", "AREA"]
+CHUNK_ROWS = 200000
+# Exponente de Zipf de la frecuencia de los códigos
+ZIPF = 1.1
+UNKNOWN_RATE = 0.03   # 'UUU' (desconocido): la limpieza descarta la fila
+BLANK_RATE = 0.01
+# Proporción de FIRE_SPRD 1..5 (la mayoría, confinados al objeto de origen)
+SPREAD_SHARES = (0.45, 0.20, 0.15, 0.12, 0.08)
+
+
+class IncidentGenerator:
+    """Filas sintéticas reproducibles a partir de una semilla."""
+
+    def __init__(self, seed: int = 0):
+        self.rng = np.random.default_rng(seed)
+        self.codes: Dict[str, np.ndarray] = {}
+        self.weights: Dict[str, np.ndarray] = {}
+        self.effects: Dict[str, np.ndarray] = {}
+        for f in FEATURES:
+            codes = np.array([c for c in CODE_MAPS[f] if c], dtype=object)
+            # Orden de popularidad aleatorio pero fijo para la semilla
+            codes = codes[self.rng.permutation(len(codes))]
+            w = 1.0 / np.arange(1, len(codes) + 1) ** ZIPF
+            self.codes[f] = codes
+            self.weights[f] = w / w.sum()
+            # Efecto latente de cada código sobre la propagación
+            self.effects[f] = self.rng.normal(0.0, 1.0, len(codes))
+        # Umbrales de FIRE_SPRD fijados con una muestra: iguales en todos los bloques
+        _, score = self._draw(100000)
+        self.cuts = np.quantile(score, np.cumsum(SPREAD_SHARES)[:-1])
+
+    def _draw(self, n: int):
+        idx = {f: self.rng.choice(len(self.codes[f]), size=n, p=self.weights[f])
+               for f in FEATURES}
+        score = sum(self.effects[f][idx[f]] for f in FEATURES)
+        score = score + self.rng.normal(0.0, 1.5, n)
+        return idx, score
+
+    def chunk(self, start: int, n: int) -> pd.DataFrame:
+        idx, score = self._draw(n)
+        out = {
+            "INC_NO": np.arange(start, start + n),
+            "INC_DATE": pd.Timestamp("2023-01-01")
+            + pd.to_timedelta(self.rng.integers(0, 365, n), unit="D"),
+        }
+        for f in FEATURES:
+            values = self.codes[f][idx[f]]
+            r = self.rng.random(n)
+            values[r < UNKNOWN_RATE] = "UUU"
+            values[(r >= UNKNOWN_RATE) & (r < UNKNOWN_RATE + BLANK_RATE)] = ""
+            out[f] = values
+        out["FIRE_SPRD"] = np.searchsorted(self.cuts, score) + 1
+        out["AREA"] = np.round(self.rng.lognormal(3.0, 1.2, n), 1)
+        df = pd.DataFrame(out, columns=COLUMNS)
+        df["INC_DATE"] = df["INC_DATE"].dt.strftime("%m%d%Y")
+        return df
+
+
+def generate(path: str, rows: int, seed: int = 0, chunk_rows: int = CHUNK_ROWS,
+             report=sys.stderr) -> Dict:
+    """Escribe ``rows`` incidentes en ``path`` por bloques (memoria acotada)."""
+    t0 = time.perf_counter()
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    gen = IncidentGenerator(seed)
+    tmp = f"{path}.tmp-{os.getpid()}"
+    with open(tmp, "w", encoding="latin1", newline="") as f:
+        f.write("^".join(COLUMNS) + "\n")
+        for start in range(0, rows, chunk_rows):
+            gen.chunk(start, min(chunk_rows, rows - start)).to_csv(
+                f, sep="^", header=False, index=False, lineterminator="\n")
+    os.replace(tmp, path)
+    elapsed = time.perf_counter() - t0
+    stats = {"path": path, "rows": rows, "seed": seed, "seconds": elapsed,
+             "bytes": os.path.getsize(path)}
+    if report is not None:
+        print(f"{rows} filas ({stats['bytes'] / 2**20:.1f} MiB) escritas en {path} "
+              f"en {elapsed:.1f}s", file=report)
+    return stats
+
+
+def ensure(path: str, rows: int, seed: int = 0) -> Optional[Dict]:
+    """Genera ``path`` salvo que ya exista con ``rows`` filas (None si se reutiliza)."""
+    if os.path.exists(path):
+        with open(path, "rb") as f:
+            existing = sum(1 for _ in f) - 1
+        if existing == rows:
+            return None
+    return generate(path, rows, seed)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Genera un fichero fireincident sintético")
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--output", default=os.path.join("data", "raw", "fireincident-bench.txt"))
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    generate(args.output, args.rows, args.seed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+# benchmarks/importtime.py
+#
+# Control de regresión del arranque en frío. Importa cada punto de entrada en
+# un proceso nuevo con ``python -X importtime`` y comprueba que no arrastra
+# dependencias pesadas que sólo necesitan algunas páginas o acciones (shap,
+# matplotlib, sklearn, joblib...) y que el tiempo total no pasa del límite.
+#
+#   python -m benchmarks.importtime            # sale con código 1 si falla
+#   python -m benchmarks.importtime --json importtime.json
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+from typing import Dict, List, Optional
+
+# Módulo → (dependencias que no debe importar, límite de tiempo en ms)
+TARGETS = {
+    "cli": (("pandas", "numpy", "joblib", "sklearn", "shap", "matplotlib", "seaborn"), 300),
+    "app": (("shap", "matplotlib", "sklearn", "joblib", "seaborn"), 2500),
+    "server": (("pandas", "shap", "matplotlib", "sklearn", "joblib"), 600),
+}
+REPEAT = 3
+
+
+def import_times(module: str, cwd: Optional[str] = None) -> Dict[str, int]:
+    """Tiempo acumulado (µs) de cada módulo importado al hacer ``import module``."""
+    env = {**os.environ, "PYTHONDONTWRITEBYTECODE": "1"}
+    env.pop("AIGNITE_METRICS_FILE", None)
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, cwd=cwd, env=env,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"import {module} falló:\n{proc.stderr[-2000:]}")
+    times = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+def check(targets: Dict = TARGETS, repeat: int = REPEAT, scale: float = 1.0,
+          cwd: Optional[str] = None) -> Dict:
+    """Mejor tiempo de ``repeat`` arranques por módulo y dependencias prohibidas."""
+    results = {}
+    for module, (forbidden, budget_ms) in targets.items():
+        runs = [import_times(module, cwd) for _ in range(repeat)]
+        best = min(runs, key=lambda t: t[module])
+        heavy = sorted(m for m in forbidden if m in best)
+        total_ms = best[module] / 1e3
+        results[module] = {
+            "total_ms": total_ms,
+            "budget_ms": budget_ms * scale,
+            "forbidden_imported": heavy,
+            "ok": not heavy and total_ms <= budget_ms * scale,
+            # Las dependencias directas más lentas, para ver qué ha cambiado
+            "slowest": dict(sorted(
+                ((m, t / 1e3) for m, t in best.items() if m != module and "." not in m),
+                key=lambda kv: kv[1], reverse=True)[:10]),
+        }
+    return results
+
+
+def report(results: Dict) -> List[str]:
+    failures = []
+    for module, r in results.items():
+        estado = "OK" if r["ok"] else "FALLO"
+        print(f"{estado:5} import {module}: {r['total_ms']:.0f} ms (límite {r['budget_ms']:.0f} ms)")
+        if r["forbidden_imported"]:
+            print(f"      importa al arrancar: {', '.join(r['forbidden_imported'])}")
+        if not r["ok"]:
+            failures.append(module)
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Tiempo de arranque en frío (python -X importtime)")
+    parser.add_argument("--repeat", type=int, default=REPEAT)
+    parser.add_argument("--scale", type=float, default=1.0,
+                        help="Multiplica los límites de tiempo (máquinas lentas o CI)")
+    parser.add_argument("--json", help="Guardar los resultados en este fichero")
+    args = parser.parse_args(argv)
+    results = check(repeat=args.repeat, scale=args.scale)
+    failures = report(results)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,336 @@
+# benchmarks/run.py
+#
+# Suite de rendimiento de extremo a extremo. Todo se hace en un directorio de
+# trabajo propio (datos sintéticos, modelo y base de datos), nunca sobre
+# incendios.db ni models/ del repositorio. El resultado es un JSON con los
+# metadatos de la ejecución (commit, versiones, máquina) para comparar
+# ejecuciones entre commits con ``python -m benchmarks.compare``.
+#
+#   python -m benchmarks.run                          # todo, 10k/1M/10M filas
+#   python -m benchmarks.run --sizes 10000 --only predict batch
+
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from datetime import timedelta
+from typing import Callable, Dict, List
+
+import numpy as np
+
+import database
+from batch_scoring import FIELDS, read_fireincident_chunks
+from benchmarks.generate import ensure
+from ingest import cache_paths, peak_rss_bytes
+from mapeos import CODE_MAPS
+from scoring import BACKENDS
+from server import percentiles
+
+SECTIONS = ("startup", "train", "predict", "batch", "log", "queries")
+SIZES = (10000, 1000000, 10000000)
+WORKDIR = os.path.join("benchmarks", "work")
+RESULTS_DIR = os.path.join("benchmarks", "results")
+TRAIN_ROWS = 200000
+BATCH_ROWS = 200000
+PREDICT_SAMPLES = 2000
+LOG_ROWS = 2000
+QUERY_REPEAT = 5
+# fetch_logs devuelve todo el histórico como dicts: por encima de esto no cabe
+FETCH_LOGS_MAX = 1000000
+FILL_CHUNK = 100000
+FORMAT = 1
+
+
+def timed(fn: Callable, repeat: int = QUERY_REPEAT) -> Dict:
+    """Latencias de ``repeat`` llamadas a ``fn`` (percentiles en ms)."""
+    samples = []
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t)
+    return percentiles(samples)
+
+
+def random_records(n: int, seed: int = 0) -> List[Dict]:
+    rng = random.Random(seed)
+    codes = {f: list(CODE_MAPS[f]) for f in FIELDS}
+    return [{f: rng.choice(codes[f]) for f in FIELDS} for _ in range(n)]
+
+
+def run_meta(args) -> Dict:
+    def version(module):
+        try:
+            return __import__(module).__version__
+        except ImportError:
+            return None
+
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"],
+                                capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"],
+                                    capture_output=True, text=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        commit, dirty = None, None
+    return {
+        "format": FORMAT,
+        "commit": commit,
+        "dirty": dirty,
+        "started": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "versions": {m: version(m) for m in ("numpy", "pandas", "sklearn", "joblib", "shap")},
+        "args": vars(args),
+    }
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Secciones
+# ─────────────────────────────────────────────────────────────────────────────
+def bench_startup(args, paths: Dict) -> Dict:
+    from benchmarks.importtime import check
+    return check()
+
+
+def bench_train(args, paths: Dict) -> Dict:
+    from train_model import retrain_and_return_test
+    gen = ensure(paths["train_raw"], args.train_rows, args.seed)
+    # Entrenamiento en frío: sin la caché de ingest del fichero raw
+    for p in cache_paths(paths["train_raw"]):
+        if os.path.exists(p):
+            os.remove(p)
+    t = time.perf_counter()
+    _, _, _, best_params, timings = retrain_and_return_test(
+        args.train_strategy, budget_s=args.train_budget,
+        raw_path=paths["train_raw"], model_path=paths["model"],
+    )
+    return {
+        "rows": args.train_rows,
+        "strategy": args.train_strategy,
+        "budget_s": args.train_budget,
+        "generate_seconds": gen["seconds"] if gen else None,
+        "seconds": time.perf_counter() - t,
+        "phases": timings,
+        "best_params": best_params,
+    }
+
+
+def _scorers(paths: Dict, backends):
+    from model_store import get_bundle
+    from scoring import RiskScorer
+    bundle, version = get_bundle(paths["model"])
+    for backend in backends:
+        scorer = RiskScorer.from_bundle(bundle, version, backend=backend,
+                                        model_path=paths["model"])
+        if backend == "table" and scorer.table is None:
+            continue
+        if backend == "compiled" and scorer.forest is None:
+            continue
+        yield backend, scorer
+
+
+def bench_predict(args, paths: Dict) -> Dict:
+    records = random_records(args.predict_samples, args.seed)
+    out = {}
+    for backend, scorer in _scorers(paths, args.backends):
+        scorer.cache = None  # cada llamada recorre el modelo
+        for r in records[:50]:
+            scorer.predict(r)
+        samples = []
+        for r in records:
+            t = time.perf_counter()
+            scorer.predict(r)
+            samples.append(time.perf_counter() - t)
+        out[backend] = percentiles(samples)
+    return out
+
+
+def bench_batch(args, paths: Dict) -> Dict:
+    gen = ensure(paths["batch_raw"], args.batch_rows, args.seed + 1)
+    chunks = list(read_fireincident_chunks(paths["batch_raw"], chunk_size=50000))
+    rows = [dict(zip(FIELDS, values)) for c in chunks[:1]
+            for values in zip(*(c[f] for f in FIELDS))][:10000]
+    out = {"rows": args.batch_rows,
+           "generate_seconds": gen["seconds"] if gen else None}
+    for backend, scorer in _scorers(paths, args.backends):
+        t = time.perf_counter()
+        n = 0
+        for c in chunks:
+            scorer.labels(scorer.predict_proba_columns(c))
+            n += len(c[FIELDS[0]])
+        columns_s = time.perf_counter() - t
+        # Registros sueltos (cli.py score): sin caché para medir el modelo
+        scorer.cache = None
+        t = time.perf_counter()
+        scorer.predict_batch(rows)
+        rows_s = time.perf_counter() - t
+        out[backend] = {
+            "columns_rows_per_s": n / columns_s,
+            "records_rows_per_s": len(rows) / rows_s,
+        }
+    return out
+
+
+def bench_log(args, paths: Dict) -> Dict:
+    database.DB_PATH = paths["log_db"]
+    if os.path.exists(paths["log_db"]):
+        os.remove(paths["log_db"])
+    database.init_db()
+    rows = [({**r, "AREA": 10.0}, "Medio", [0.2, 0.5, 0.3])
+            for r in random_records(args.log_rows, args.seed)]
+    out = {"rows": len(rows)}
+
+    t = time.perf_counter()
+    for inputs, risk, proba in rows:
+        database.log_prediction(inputs, risk, proba)
+    out["log_prediction_per_s"] = len(rows) / (time.perf_counter() - t)
+
+    t = time.perf_counter()
+    database.log_predictions(rows)
+    out["log_predictions_per_s"] = len(rows) / (time.perf_counter() - t)
+
+    writer = database.enable_write_behind()
+    t = time.perf_counter()
+    for inputs, risk, proba in rows:
+        database.log_prediction(inputs, risk, proba)
+    submit_s = time.perf_counter() - t
+    writer.flush()
+    out["write_behind_submit_per_s"] = len(rows) / submit_s
+    out["write_behind_per_s"] = len(rows) / (time.perf_counter() - t)
+    database.disable_write_behind()
+    database.close_connection()
+    return out
+
+
+def fill_logs(target: int, seed: int = 0, days: int = 365) -> float:
+    """Añade filas a registros_incendios hasta tener ``target``; devuelve segundos."""
+    conn = database.get_connection()
+    have = conn.execute("SELECT COUNT(*) FROM registros_incendios").fetchone()[0]
+    rng = np.random.default_rng(seed + have)
+    codes = {f: np.array(list(CODE_MAPS[f]), dtype=object) for f in FIELDS}
+    risks = np.array(["Bajo", "Medio", "Alto"], dtype=object)
+    start = np.datetime64("2023-01-01T00:00:00")
+    t = time.perf_counter()
+    while have < target:
+        n = min(FILL_CHUNK, target - have)
+        probas = rng.dirichlet((1.0, 1.0, 1.0), n)
+        ts = start + rng.integers(0, days * 86400, n).astype("timedelta64[s]")
+        cols = [rng.choice(codes[f], n) for f in FIELDS] + [
+            np.round(rng.lognormal(3.0, 1.2, n), 1), risks[probas.argmax(1)],
+            probas[:, 0], probas[:, 1], probas[:, 2],
+            np.datetime_as_string(ts).astype(object),
+        ]
+        with conn:
+            conn.executemany(database._INSERT_AUTO_TS, [
+                (a, b, c, d, e, float(area), risk, float(p0), float(p1), float(p2),
+                 s.replace("T", " "))
+                for a, b, c, d, e, area, risk, p0, p1, p2, s in zip(*cols)
+            ])
+        have += n
+    return time.perf_counter() - t
+
+
+def bench_queries(args, paths: Dict) -> Dict:
+    database.DB_PATH = paths["query_db"]
+    database.init_db()
+    out = {}
+    for size in sorted(args.sizes):
+        fill_s = fill_logs(size, args.seed)
+        conn = database.get_connection()
+        conn.execute("ANALYZE")
+        _, hi = database.log_date_range()
+        month = (hi - timedelta(days=30), hi)
+        rows, _ = database.query_logs(limit=50)
+        deep_rows, _ = database.query_logs(limit=50, after=(rows[-1]["timestamp"], rows[-1]["id"]))
+        last = deep_rows[-1]
+        res = {
+            "fill_seconds": fill_s,
+            "historico_first_page": timed(lambda: database.query_logs(limit=50)),
+            "historico_next_page": timed(lambda: database.query_logs(
+                limit=50, after=(last["timestamp"], last["id"]))),
+            "historico_filtered": timed(lambda: database.query_logs(
+                risks=["Alto"], date_from=month[0], date_to=month[1], limit=50)),
+            "log_date_range": timed(database.log_date_range),
+            "dashboard_risk_counts": timed(database.fetch_risk_counts),
+            "dashboard_daily_counts": timed(database.fetch_daily_counts),
+        }
+        if size <= args.fetch_logs_max:
+            res["fetch_logs"] = timed(database.fetch_logs, repeat=1 if size > 100000 else 3)
+        else:
+            res["fetch_logs"] = {"skipped": f"más de {args.fetch_logs_max} filas"}
+        res["db_bytes"] = os.path.getsize(paths["query_db"])
+        out[str(size)] = res
+        print(f"[queries] {size} filas: página {res['historico_first_page']['p50_ms']:.2f} ms, "
+              f"dashboard {res['dashboard_daily_counts']['p50_ms']:.2f} ms", file=sys.stderr)
+    database.close_connection()
+    return out
+
+
+BENCHES = {
+    "startup": bench_startup,
+    "train": bench_train,
+    "predict": bench_predict,
+    "batch": bench_batch,
+    "log": bench_log,
+    "queries": bench_queries,
+}
+
+
+def run(args) -> Dict:
+    os.makedirs(args.workdir, exist_ok=True)
+    paths = {
+        "train_raw": os.path.join(args.workdir, f"train-{args.train_rows}.txt"),
+        "batch_raw": os.path.join(args.workdir, f"batch-{args.batch_rows}.txt"),
+        "model": args.model or os.path.join(args.workdir, "models", "aignite_model.pkl"),
+        "log_db": os.path.join(args.workdir, "log.db"),
+        "query_db": os.path.join(args.workdir, "queries.db"),
+    }
+    result = {"meta": run_meta(args), "results": {}}
+    needs_model = {"predict", "batch"} & set(args.only)
+    if needs_model and "train" not in args.only and not os.path.exists(paths["model"]):
+        sys.exit(f"No hay modelo en {paths['model']}: añade 'train' a --only o usa --model")
+    for name in SECTIONS:
+        if name not in args.only:
+            continue
+        print(f"[{name}] …", file=sys.stderr)
+        t = time.perf_counter()
+        result["results"][name] = BENCHES[name](args, paths)
+        print(f"[{name}] {time.perf_counter() - t:.1f}s", file=sys.stderr)
+    result["meta"]["peak_rss_bytes"] = peak_rss_bytes()
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks de AIGNITE")
+    parser.add_argument("--only", nargs="+", choices=SECTIONS, default=list(SECTIONS))
+    parser.add_argument("--sizes", nargs="+", type=int, default=list(SIZES),
+                        help="Filas de registros_incendios para las consultas")
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=list(BACKENDS))
+    parser.add_argument("--model", help="Bundle ya entrenado (si no, el de --workdir)")
+    parser.add_argument("--train-rows", type=int, default=TRAIN_ROWS)
+    parser.add_argument("--train-strategy", default="halving")
+    parser.add_argument("--train-budget", type=float, help="Segundos para la búsqueda")
+    parser.add_argument("--batch-rows", type=int, default=BATCH_ROWS)
+    parser.add_argument("--predict-samples", type=int, default=PREDICT_SAMPLES)
+    parser.add_argument("--log-rows", type=int, default=LOG_ROWS)
+    parser.add_argument("--fetch-logs-max", type=int, default=FETCH_LOGS_MAX)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workdir", default=WORKDIR)
+    parser.add_argument("--output", help="JSON de resultados (por defecto en benchmarks/results)")
+    args = parser.parse_args(argv)
+
+    result = run(args)
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{result['meta']['commit'] or 'local'}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2, default=str)
+    print(f"Resultados guardados en {output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,19 @@
 #!/usr/bin/env python3
+import argparse
 import os
-import sqlite3
-import pandas as pd
-import joblib
-import math
-from database import init_db, log_prediction, fetch_logs, guardar_en_bd_con_id_manual
+import sys
+# Sólo módulos ligeros al arrancar: pandas, NumPy, joblib y sklearn se
+# importan dentro de las acciones que los usan ("Listar registros" no los carga)
+from batch_scoring import (
+    BULK_CHUNK_SIZE, CHUNK_SIZE, bulk_score, read_records, score_stream,
+)
+from database import (
+    init_db, fetch_logs, get_log, delete_log,
+    guardar_en_bd_con_id_manual, rebuild_rollups,
+)
+import metrics
+import profiling
+from model_store import BACKENDS, get_bundle
 
 def montar_drive():
     try:
@@ -13,52 +22,67 @@ def montar_drive():
     except ImportError:
         pass
 
-def preprocesar():
-    raw_path = os.path.join("data", "raw", "fireincident.txt")
-    df = pd.read_csv(raw_path, sep="^", engine="python", header=0, encoding="latin1")
-
-    # Resumen de nulos
-    null_summary = pd.DataFrame({
-        'missing_count': df.isna().sum(),
-        'missing_pct': df.isna().mean() * 100
-    })
-    os.makedirs("data/reports", exist_ok=True)
-    null_summary.to_csv("data/reports/null_summary.csv", index=True)
-    print("Resumen de nulos guardado en data/reports/null_summary.csv")
-
-    # CSV intermedios
-    os.makedirs("data/intermediate", exist_ok=True)
-    df.to_csv("data/intermediate/data.csv", index=False)
-    cols = ["HEAT_SOURC","TYPE_MAT","STRUC_STAT","DETECTOR","DET_TYPE","FIRE_SPRD"]
-    df[cols].to_csv("data/intermediate/data_filtrada.csv", index=False)
-    df_filtrada = df[cols].dropna()
-    df_filtrada.to_csv("data/intermediate/data_menos_nans.csv", index=False)
-    df_filtrada.to_csv("data/intermediate/data_final.csv", index=False)
-    print("CSV intermedios guardados en data/intermediate/")
-
-    # Distribución FIRE_SPRD
+def preprocesar(chunk_size=None):
+    # Por bloques: la memoria no depende del tamaño del fichero raw. Cada
+    # etapa se omite si sus entradas no han cambiado desde la última vez.
+    import ingest
+    chunk_size = chunk_size or ingest.CHUNK_SIZE
+    raw_path = ingest.PREPROCESS_RAW
+    ingest.run_stage(
+        "escaneo", [raw_path], ingest.SCAN_OUTPUTS,
+        lambda: ingest.scan_raw(raw_path, chunk_size),
+    )
+    print(f"Resumen de nulos guardado en {ingest.NULL_SUMMARY_CSV}")
+    print(f"CSV intermedios guardados en {ingest.INTERMEDIATE_DIR}/")
+
+    png_path = os.path.join(ingest.REPORTS_DIR, "fire_spread_distribution.png")
+    ingest.run_stage(
+        "grafico", [ingest.FIRE_SPRD_CSV], [png_path],
+        lambda: graficar_fire_sprd(png_path),
+    )
+
+def graficar_fire_sprd(png_path):
+    # Distribución FIRE_SPRD (acumulada en el escaneo)
     try:
         import seaborn as sns
         import matplotlib.pyplot as plt
-        dist = df["FIRE_SPRD"].value_counts().sort_index()
-        plt.figure()
-        sns.barplot(x=dist.index, y=dist.values)
-        plt.title("Distribución de FIRE_SPRD")
-        plt.savefig("data/reports/fire_spread_distribution.png")
-        print("Gráfico de distribución guardado en data/reports/fire_spread_distribution.png")
     except ImportError:
         print("Seaborn o matplotlib no están instalados: omitiendo gráfico.")
+        return
+    import pandas as pd
+    import ingest
+    dist = pd.read_csv(ingest.FIRE_SPRD_CSV, index_col=0)["count"]
+    plt.figure()
+    sns.barplot(x=dist.index, y=dist.values)
+    plt.title("Distribución de FIRE_SPRD")
+    plt.savefig(png_path)
+    plt.close()
+    print(f"Gráfico de distribución guardado en {png_path}")
 
 def entrenar():
     from train_model import retrain_and_return_test
-    model, X_test, y_test, best_params = retrain_and_return_test()
-    print("Mejores parámetros:", best_params)
+    estrategia = input("Estrategia (grid/halving/warm_start) [grid]: ").strip() or "grid"
+    presupuesto = input("Presupuesto en segundos (vacío = sin límite): ").strip()
+    retrain_and_return_test(estrategia, budget_s=float(presupuesto) if presupuesto else None)
+
+def cargar_modelo(backend=None):
+    # Cacheado en el proceso: el menú no vuelve a leer el .pkl en cada acción
+    from scoring import get_scorer
+    return get_scorer(backend=backend)
+
+def materializar_cli():
+    from risk_table import RiskTable, materialize, verify
+    bundle, version = get_bundle()
+    materialize(bundle, version)
+    verify(RiskTable.load(version=version), bundle)
+
+def compilar_cli():
+    from compiled_forest import export
+    bundle, version = get_bundle()
+    export(bundle, version)
 
 def predict_cli():
-    bundle = joblib.load("models/aignite_model.pkl")
-    clf = bundle["model"]
-    cat_cols = bundle["cat_cols"]
-    columns = bundle["columns"]
+    scorer = cargar_modelo()
 
     inputs = {}
     inputs["HEAT_SOURC"] = input("Fuente de calor: ")
@@ -68,20 +92,13 @@ def predict_cli():
     inputs["DET_TYPE"] = input("Tipo de detector: ")
     inputs["AREA"] = float(input("Superficie (m²): "))
 
-    df = pd.DataFrame([inputs])
-    for c in cat_cols:
-        df[c] = df[c].astype(str)
-    df_enc = pd.get_dummies(df, columns=cat_cols).reindex(columns=columns, fill_value=0)
-
-    pred = clf.predict(df_enc)[0]
-    proba = clf.predict_proba(df_enc)[0]
+    pred, proba = scorer.predict(inputs)
     print("\nPredicción:", pred)
     print(f"Bajo: {proba[0]:.1%}, Medio: {proba[1]:.1%}, Alto: {proba[2]:.1%}")
 
 def consultar_cli():
     rec_id = int(input("ID del registro: "))
-    logs = fetch_logs()
-    rec = next((r for r in logs if r["id"] == rec_id), None)
+    rec = get_log(rec_id)
     if rec:
         print("\n", rec)
     else:
@@ -89,12 +106,10 @@ def consultar_cli():
 
 def eliminar_cli():
     rec_id = int(input("ID del registro a eliminar: "))
-    conn = sqlite3.connect("incendios.db")
-    cursor = conn.cursor()
-    cursor.execute("DELETE FROM registros_incendios WHERE id=?", (rec_id,))
-    conn.commit()
-    conn.close()
-    print(f"Registro {rec_id} eliminado.")
+    if delete_log(rec_id):
+        print(f"Registro {rec_id} eliminado.")
+    else:
+        print("Registro no encontrado.")
 
 def listar_cli():
     logs = fetch_logs()
@@ -103,10 +118,7 @@ def listar_cli():
 
 def guardar_manual_cli():
     rec_id = int(input("ID manual para guardar: "))
-    bundle = joblib.load("models/aignite_model.pkl")
-    clf = bundle["model"]
-    cat_cols = bundle["cat_cols"]
-    columns = bundle["columns"]
+    scorer = cargar_modelo()
 
     inputs = {}
     inputs["HEAT_SOURC"] = input("Fuente de calor: ")
@@ -116,51 +128,123 @@ def guardar_manual_cli():
     inputs["DET_TYPE"] = input("Tipo de detector: ")
     inputs["AREA"] = float(input("Superficie (m²): "))
 
-    df = pd.DataFrame([inputs])
-    for c in cat_cols:
-        df[c] = df[c].astype(str)
-    df_enc = pd.get_dummies(df, columns=cat_cols).reindex(columns=columns, fill_value=0)
-
-    pred = clf.predict(df_enc)[0]
-    proba = clf.predict_proba(df_enc)[0]
+    pred, proba = scorer.predict(inputs)
     ok = guardar_en_bd_con_id_manual(rec_id, inputs, pred, proba)
     if ok:
         print(f"Registro con ID {rec_id} guardado correctamente.")
     else:
         print(f"Ya existe un registro con el ID {rec_id}. No se ha guardado.")
 
+def preprocesar_cli():
+    montar_drive()
+    preprocesar()
+
+def resumenes_cli():
+    rebuild_rollups()
+    print("Resúmenes reconstruidos.")
+
+# Opción del menú → (texto, acción)
+ACCIONES = {
+    "1": ("Preprocesar datos", preprocesar_cli),
+    "2": ("Entrenar modelo", entrenar),
+    "3": ("Predecir", predict_cli),
+    "4": ("Consultar registro", consultar_cli),
+    "5": ("Eliminar registro", eliminar_cli),
+    "6": ("Listar registros", listar_cli),
+    "7": ("Guardar con ID manual", guardar_manual_cli),
+    "8": ("Materializar tabla de riesgo", materializar_cli),
+    "9": ("Reconstruir resúmenes del Dashboard", resumenes_cli),
+    "10": ("Compilar bosque (backend compiled)", compilar_cli),
+}
+
 def menu_principal():
     init_db()
     while True:
         print("\n--- Menú ---")
-        print("1. Preprocesar datos")
-        print("2. Entrenar modelo")
-        print("3. Predecir")
-        print("4. Consultar registro")
-        print("5. Eliminar registro")
-        print("6. Listar registros")
-        print("7. Guardar con ID manual")
+        for opt, (texto, _) in ACCIONES.items():
+            print(f"{opt}. {texto}")
         print("0. Salir")
         opt = input("Opción: ")
-        if opt == "1":
-            montar_drive()
-            preprocesar()
-        elif opt == "2":
-            entrenar()
-        elif opt == "3":
-            predict_cli()
-        elif opt == "4":
-            consultar_cli()
-        elif opt == "5":
-            eliminar_cli()
-        elif opt == "6":
-            listar_cli()
-        elif opt == "7":
-            guardar_manual_cli()
-        elif opt == "0":
+        if opt == "0":
             break
-        else:
+        if opt not in ACCIONES:
             print("Opción inválida. Intenta de nuevo.")
+            continue
+        accion = ACCIONES[opt][1]
+        nombre = f"cli.{accion.__name__}"
+        with metrics.timed(nombre), profiling.profiled(nombre):
+            accion()
+
+def score_cmd(args):
+    scorer = cargar_modelo(args.backend)
+    # Los códigos son ASCII; el resto del fichero fireincident viene en latin1
+    encoding = args.encoding or ("latin1" if args.format == "caret" else "utf-8")
+    if args.input == "-":
+        sys.stdin.reconfigure(encoding=encoding, errors="replace")
+        records = read_records(sys.stdin, args.format)
+        score_stream(scorer, records, sys.stdout, args.chunk_size, args.log)
+    else:
+        with open(args.input, encoding=encoding, errors="replace") as f:
+            score_stream(scorer, read_records(f, args.format), sys.stdout,
+                         args.chunk_size, args.log)
+
+def bulk_cmd(args):
+    bulk_score(args.input, args.output, to_db=args.db, workers=args.workers,
+               chunk_size=args.chunk_size, backend=args.backend,
+               encoding=args.encoding)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="AIGNITE – línea de comandos. Sin subcomando abre el menú interactivo."
+    )
+    parser.add_argument("--profile", action="store_true",
+                        help="Perfilar cada acción con cProfile y tracemalloc (AIGNITE_PROFILE=1)")
+    parser.add_argument("--profile-rate", type=float,
+                        help="Fracción de acciones perfiladas (AIGNITE_PROFILE_RATE)")
+    parser.add_argument("--profile-dir", help="Directorio de perfiles (AIGNITE_PROFILE_DIR)")
+    sub = parser.add_subparsers(dest="cmd")
+
+    p = sub.add_parser(
+        "score",
+        help="Puntúa incidentes (JSONL o fireincident '^') y escribe JSONL en stdout",
+    )
+    p.add_argument("input", nargs="?", default="-",
+                   help="Fichero de entrada ('-' o nada para stdin)")
+    p.add_argument("--format", choices=["auto", "jsonl", "caret"], default="auto")
+    p.add_argument("--chunk-size", type=int, default=CHUNK_SIZE,
+                   help="Registros por bloque de predicción")
+    p.add_argument("--log", action="store_true",
+                   help="Guardar también en registros_incendios (un commit por bloque)")
+    p.add_argument("--backend", choices=BACKENDS,
+                   help="Backend de predicción (por defecto AIGNITE_BACKEND)")
+    p.add_argument("--encoding", help="Codificación de la entrada")
+    p.set_defaults(func=score_cmd)
+
+    p = sub.add_parser(
+        "bulk",
+        help="Re-puntúa un fichero fireincident grande en varios procesos",
+    )
+    p.add_argument("input", help="Fichero fireincident ('^')")
+    p.add_argument("--output", help="CSV de salida (mismo orden que la entrada)")
+    p.add_argument("--db", action="store_true",
+                   help="Guardar los resultados en registros_incendios")
+    p.add_argument("--workers", type=int, help="Procesos (por defecto, nº de CPUs)")
+    p.add_argument("--chunk-size", type=int, default=BULK_CHUNK_SIZE,
+                   help="Filas por bloque enviado a cada proceso")
+    p.add_argument("--backend", choices=BACKENDS,
+                   help="Backend de predicción (por defecto AIGNITE_BACKEND)")
+    p.add_argument("--encoding", default="latin1", help="Codificación de la entrada")
+    p.set_defaults(func=bulk_cmd)
+
+    args = parser.parse_args(argv)
+    metrics.start_exporter()
+    profiling.configure(enabled=args.profile or None, rate=args.profile_rate,
+                        profile_dir=args.profile_dir)
+    if args.cmd is None:
+        menu_principal()
+    else:
+        with metrics.timed(f"cli.{args.cmd}"), profiling.profiled(f"cli.{args.cmd}"):
+            args.func(args)
 
 if __name__ == "__main__":
-    menu_principal()
+    main()
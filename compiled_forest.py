@@ -0,0 +1,198 @@
+# compiled_forest.py
+#
+# Bosque "compilado": todos los árboles de ``model.estimators_`` aplanados en
+# arrays NumPy contiguos (feature, threshold, hijos, distribución de clases en
+# cada nodo) y un recorrido vectorizado que puntúa filas sueltas o lotes sin
+# pasar por sklearn. Se guarda junto al bundle como .npy (abiertos con mmap,
+# compartidos entre procesos) y se selecciona con AIGNITE_BACKEND=compiled.
+
+import json
+import os
+import shutil
+import sys
+import time
+from typing import Dict, Optional
+
+import numpy as np
+
+from encoder import DTYPE
+from model_store import MODEL_PATH, artifact_path, bundle_fingerprint
+
+ARRAYS = ("feature", "threshold", "left", "right", "is_leaf", "value", "roots")
+BATCH_SIZE = 1024
+
+
+def forest_dir(model_path: str, version: Optional[str]) -> str:
+    return artifact_path(model_path, version, ".forest")
+
+
+class CompiledForest:
+    """Recorrido de todos los árboles a la vez, nivel a nivel.
+
+    En cada paso sólo se avanzan los cursores (fila, árbol) que aún no están
+    en una hoja, así que el coste sigue la profundidad real de cada camino.
+    Las probabilidades se suman árbol a árbol y se dividen por el número de
+    árboles, en el mismo orden que ``RandomForestClassifier.predict_proba``.
+    """
+
+    def __init__(self, arrays: Dict[str, np.ndarray], meta: Dict):
+        for name in ARRAYS:
+            setattr(self, name, arrays[name])
+        self.meta = meta
+        self.version = meta.get("version")
+        self.max_depth = meta["max_depth"]
+        self.n_trees = len(self.roots)
+        self.classes_ = np.array(meta["classes"], dtype=object)
+
+    @classmethod
+    def from_model(cls, model, version: Optional[str] = None) -> "CompiledForest":
+        parts = {name: [] for name in ARRAYS}
+        offset = 0
+        max_depth = 0
+        for est in model.estimators_:
+            t = est.tree_
+            ids = np.arange(t.node_count) + offset
+            leaf = t.children_left == -1
+            parts["feature"].append(np.where(leaf, 0, t.feature).astype(np.int32))
+            parts["threshold"].append(np.where(leaf, np.inf, t.threshold))
+            parts["left"].append(np.where(leaf, ids, t.children_left + offset).astype(np.int32))
+            parts["right"].append(np.where(leaf, ids, t.children_right + offset).astype(np.int32))
+            parts["is_leaf"].append(leaf)
+            # sklearn >= 1.4 guarda ya fracciones por clase y predict_proba las
+            # devuelve tal cual; las versiones anteriores guardan recuentos y
+            # normalizan al predecir. Se reproduce lo mismo bit a bit.
+            value = t.value[:, 0, :].astype(np.float64)
+            if not np.allclose(value.sum(axis=1), 1.0):
+                norm = value.sum(axis=1, keepdims=True)
+                norm[norm == 0.0] = 1.0
+                value = value / norm
+            parts["value"].append(value)
+            parts["roots"].append(np.array([offset], dtype=np.int32))
+            offset += t.node_count
+            max_depth = max(max_depth, t.max_depth)
+        arrays = {name: np.ascontiguousarray(np.concatenate(p)) for name, p in parts.items()}
+        meta = {
+            "version": version,
+            "max_depth": int(max_depth),
+            "n_nodes": int(offset),
+            "n_features": int(model.n_features_in_),
+            "classes": [str(c) for c in model.classes_],
+        }
+        return cls(arrays, meta)
+
+    def save(self, model_path: str = MODEL_PATH) -> str:
+        if self.meta["version"] is None:
+            raise ValueError("El bosque compilado no tiene versión de bundle")
+        path = forest_dir(model_path, self.meta["version"])
+        tmp = f"{path}.tmp-{os.getpid()}"
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        for name in ARRAYS:
+            np.save(os.path.join(tmp, f"{name}.npy"), getattr(self, name))
+        with open(os.path.join(tmp, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(self.meta, f)
+        # Se sustituye el directorio entero; los procesos que tengan los .npy
+        # anteriores mapeados siguen leyendo los ficheros ya borrados.
+        old = f"{path}.old-{os.getpid()}"
+        if os.path.exists(path):
+            os.replace(path, old)
+        os.replace(tmp, path)
+        shutil.rmtree(old, ignore_errors=True)
+        return path
+
+    @classmethod
+    def load(cls, model_path: str = MODEL_PATH,
+             version: Optional[str] = None) -> Optional["CompiledForest"]:
+        """Abre en mmap los arrays de ``version`` (por defecto, la del bundle en disco).
+
+        ``None`` si no existen o son de otro bundle.
+        """
+        if version is None:
+            if not os.path.exists(model_path):
+                return None
+            version = bundle_fingerprint(model_path)
+        path = forest_dir(model_path, version)
+        if not os.path.exists(path):
+            path = forest_dir(model_path, None)  # nombre sin versión
+        meta_path = os.path.join(path, "meta.json")
+        if not os.path.exists(meta_path):
+            return None
+        with open(meta_path, encoding="utf-8") as f:
+            meta = json.load(f)
+        if version is not None and meta["version"] != version:
+            print(f"Bosque compilado obsoleto ({meta['version']} != {version}): se ignora.",
+                  file=sys.stderr)
+            return None
+        # np.asarray: vistas ndarray sobre el mmap (indexar un np.memmap es más lento)
+        arrays = {
+            name: np.asarray(np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r"))
+            for name in ARRAYS
+        }
+        return cls(arrays, meta)
+
+    def predict_proba(self, X: np.ndarray, batch_size: int = BATCH_SIZE) -> np.ndarray:
+        X = np.asarray(X, dtype=DTYPE)
+        n, n_features = X.shape
+        out = np.empty((n, len(self.classes_)), dtype=np.float64)
+        for start in range(0, n, batch_size):
+            Xb = X[start:start + batch_size]
+            m = Xb.shape[0]
+            flat = Xb.ravel()
+            # Un cursor por (árbol, fila); sólo se avanzan los que no están en hoja
+            node = np.repeat(self.roots, m)
+            offset = np.tile(np.arange(m) * n_features, self.n_trees)
+            active = np.flatnonzero(~self.is_leaf[node])
+            while active.size:
+                current = node[active]
+                go_left = flat[offset[active] + self.feature[current]] <= self.threshold[current]
+                current = np.where(go_left, self.left[current], self.right[current])
+                node[active] = current
+                active = active[~self.is_leaf[current]]
+            # Acumulación árbol a árbol, en el mismo orden que sklearn: ``sum``
+            # puede sumar por parejas y diferir en el último bit; ``cumsum`` no
+            values = self.value[node].reshape(self.n_trees, m, -1)
+            out[start:start + m] = np.cumsum(values, axis=0)[-1] / self.n_trees
+        return out
+
+
+def verify(forest: CompiledForest, model, X: np.ndarray, atol: float = 1e-12) -> float:
+    """Compara el motor compilado con ``model.predict_proba`` sobre ``X``."""
+    X = np.asarray(X, dtype=DTYPE)
+    live = model.predict_proba(X)
+    compiled = forest.predict_proba(X)
+    max_diff = float(np.max(np.abs(live - compiled))) if len(X) else 0.0
+    same_labels = np.array_equal(live.argmax(axis=1), compiled.argmax(axis=1))
+    if max_diff > atol or not same_labels:
+        raise ValueError(
+            f"El bosque compilado no coincide con el modelo (máx. diferencia {max_diff:.3g})"
+        )
+    print(f"Bosque compilado verificado con {len(X)} filas "
+          f"(máx. diferencia {max_diff:.3g}).")
+    return max_diff
+
+
+def export(bundle: Dict, version: str, model_path: str = MODEL_PATH,
+           X_check: Optional[np.ndarray] = None) -> CompiledForest:
+    """Compila el bosque del bundle, lo verifica y sólo entonces lo guarda.
+
+    Si la verificación falla no se escribe nada: el backend "compiled" nunca
+    carga un bosque sin verificar.
+    """
+    t0 = time.perf_counter()
+    forest = CompiledForest.from_model(bundle["model"], version)
+    if X_check is None:
+        # Filas one-hot aleatorias con un código por variable
+        from encoder import CategoricalEncoder
+        encoder = CategoricalEncoder.from_bundle(bundle)
+        rng = np.random.default_rng(0)
+        X_check = np.zeros((2000, encoder.n_features), dtype=DTYPE)
+        for c in encoder.cat_cols:
+            cols = np.array(sorted(encoder.code_columns(c).values()))
+            if len(cols):
+                X_check[np.arange(len(X_check)), rng.choice(cols, len(X_check))] = 1
+    verify(forest, bundle["model"], X_check)
+    path = forest.save(model_path)
+    print(f"Bosque compilado ({forest.n_trees} árboles, {forest.meta['n_nodes']} nodos, "
+          f"profundidad {forest.max_depth}) guardado en {path} "
+          f"en {time.perf_counter() - t0:.1f}s")
+    return forest
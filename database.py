@@ -1,81 +1,695 @@
 # database.py
 
+import atexit
+import os
+import queue
 import sqlite3
-from typing import Dict, List, Optional
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from itertools import groupby
+from datetime import date, timedelta
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import metrics
 
 DB_PATH = "incendios.db"
 
-def init_db():
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS registros_incendios (
-        id         INTEGER PRIMARY KEY AUTOINCREMENT,
-        HEAT_SOURC TEXT,
-        TYPE_MAT   TEXT,
-        STRUC_STAT TEXT,
-        DETECTOR   TEXT,
-        DET_TYPE   TEXT,
-        AREA       REAL,
-        RISK       TEXT,
-        prob_bajo  REAL,
-        prob_medio REAL,
-        prob_alto  REAL,
-        timestamp  DATETIME DEFAULT CURRENT_TIMESTAMP
+# Espera máxima cuando otra sesión tiene el fichero bloqueado (segundos)
+BUSY_TIMEOUT = 5.0
+# Sentencias preparadas que sqlite3 mantiene en caché por conexión
+CACHED_STATEMENTS = 256
+# WAL permite lecturas concurrentes con una escritura; con WAL basta
+# synchronous=NORMAL para no perder consistencia ante un corte.
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-16000",   # ~16 MB de caché de páginas
+    "PRAGMA temp_store=MEMORY",
+    # Para que INSERT OR REPLACE dispare el trigger de borrado del resumen
+    "PRAGMA recursive_triggers=ON",
+)
+
+_INSERT_AUTO = '''
+    INSERT INTO registros_incendios
+    (HEAT_SOURC, TYPE_MAT, STRUC_STAT, DETECTOR, DET_TYPE, AREA,
+     RISK, prob_bajo, prob_medio, prob_alto)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+_INSERT_WITH_ID = '''
+    INSERT {verb} INTO registros_incendios
+    (id, HEAT_SOURC, TYPE_MAT, STRUC_STAT, DETECTOR, DET_TYPE, AREA,
+     RISK, prob_bajo, prob_medio, prob_alto)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+_INSERT_OR_REPLACE = _INSERT_WITH_ID.format(verb="OR REPLACE")
+_INSERT_NEW_ID = _INSERT_WITH_ID.format(verb="")
+
+# Variantes con timestamp explícito para el modo write-behind: la hora es la
+# de la evaluación, no la del volcado. Mismo formato que CURRENT_TIMESTAMP.
+_INSERT_AUTO_TS = '''
+    INSERT INTO registros_incendios
+    (HEAT_SOURC, TYPE_MAT, STRUC_STAT, DETECTOR, DET_TYPE, AREA,
+     RISK, prob_bajo, prob_medio, prob_alto, timestamp)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+_INSERT_OR_REPLACE_TS = '''
+    INSERT OR REPLACE INTO registros_incendios
+    (id, HEAT_SOURC, TYPE_MAT, STRUC_STAT, DETECTOR, DET_TYPE, AREA,
+     RISK, prob_bajo, prob_medio, prob_alto, timestamp)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+# Conexiones libres por fichero, compartidas por todo el proceso. Streamlit
+# ejecuta cada rerun en un hilo nuevo (ScriptRunner), así que una caché sólo
+# por hilo casi nunca se reutilizaría y dejaría una conexión abierta por
+# interacción. Cada hilo toma una conexión del pool al primer uso y la
+# devuelve con release_connection() o, como muy tarde, cuando el hilo termina.
+# Todas se abren en _connect: así llevan siempre PRAGMAS (recursive_triggers
+# incluido, del que dependen los triggers del resumen diario).
+POOL_SIZE = 8
+_pool: Dict[str, List[sqlite3.Connection]] = {}
+_pool_lock = threading.Lock()
+_local = threading.local()
+
+
+def _connect(path: str) -> sqlite3.Connection:
+    # check_same_thread=False: la conexión pasa de un hilo a otro a través
+    # del pool, pero nunca la usan dos hilos a la vez
+    conn = sqlite3.connect(
+        path, timeout=BUSY_TIMEOUT, cached_statements=CACHED_STATEMENTS,
+        check_same_thread=False,
     )
-    ''')
-    conn.commit()
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+def _checkout(path: str) -> sqlite3.Connection:
+    with _pool_lock:
+        idle = _pool.get(path)
+        if idle:
+            return idle.pop()
+    return _connect(path)
+
+
+def _checkin(conn: sqlite3.Connection, path: str):
+    try:
+        # Una transacción a medias no debe pasar al siguiente hilo
+        conn.rollback()
+    except sqlite3.Error:
+        conn.close()
+        return
+    with _pool_lock:
+        idle = _pool.setdefault(path, [])
+        if len(idle) < POOL_SIZE:
+            idle.append(conn)
+            return
     conn.close()
 
+
+class _Lease:
+    """Conexión prestada al hilo actual; vuelve al pool si el hilo termina."""
+
+    __slots__ = ("path", "conn")
+
+    def __init__(self, path: str):
+        self.path = path
+        self.conn = _checkout(path)
+
+    def release(self):
+        conn, self.conn = self.conn, None
+        if conn is not None:
+            _checkin(conn, self.path)
+
+    __del__ = release
+
+
+def get_connection() -> sqlite3.Connection:
+    """Conexión del hilo actual, ya configurada (tomada del pool de DB_PATH)."""
+    lease = getattr(_local, "lease", None)
+    if lease is None or lease.conn is None or lease.path != DB_PATH:
+        if lease is not None:
+            lease.release()
+        lease = _local.lease = _Lease(DB_PATH)
+    return lease.conn
+
+
+def release_connection():
+    """Devuelve al pool la conexión del hilo actual (p. ej. al final de un rerun)."""
+    lease = getattr(_local, "lease", None)
+    if lease is not None:
+        lease.release()
+        _local.lease = None
+
+
+@contextmanager
+def transaction() -> Iterator[sqlite3.Connection]:
+    """Commit al salir del bloque, rollback si se lanza una excepción.
+
+    Con write-behind activo, antes se vuelcan las predicciones en cola para
+    que borrados o inserciones con ID manual respeten el orden de llegada.
+    """
+    writer = _writer
+    if writer is not None and threading.current_thread() is not writer.thread:
+        if not writer.flush(writer.FLUSH_TIMEOUT):
+            # Sin espera indefinida: la operación sigue aunque queden filas
+            # retenidas (la base de datos sigue bloqueada)
+            print(f"[log-writer] El volcado de predicciones no terminó en "
+                  f"{writer.FLUSH_TIMEOUT:.0f}s; se continúa sin esperar", file=sys.stderr)
+    conn = get_connection()
+    try:
+        yield conn
+    except BaseException:
+        conn.rollback()
+        raise
+    with metrics.timed("db.commit"):
+        conn.commit()
+
+
+def close_connection():
+    """Cierra la conexión del hilo actual y las libres del pool.
+
+    Para cuando el fichero de la base de datos se borra o se sustituye.
+    """
+    lease = getattr(_local, "lease", None)
+    if lease is not None:
+        conn, lease.conn = lease.conn, None
+        if conn is not None:
+            conn.close()
+        _local.lease = None
+    with _pool_lock:
+        idle = [c for conns in _pool.values() for c in conns]
+        _pool.clear()
+    for conn in idle:
+        conn.close()
+
+
+def init_db():
+    if os.environ.get("AIGNITE_LOG_WRITE_BEHIND") == "1":
+        enable_write_behind()
+    with transaction() as conn:
+        conn.execute('''
+        CREATE TABLE IF NOT EXISTS registros_incendios (
+            id         INTEGER PRIMARY KEY AUTOINCREMENT,
+            HEAT_SOURC TEXT,
+            TYPE_MAT   TEXT,
+            STRUC_STAT TEXT,
+            DETECTOR   TEXT,
+            DET_TYPE   TEXT,
+            AREA       REAL,
+            RISK       TEXT,
+            prob_bajo  REAL,
+            prob_medio REAL,
+            prob_alto  REAL,
+            timestamp  DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+        ''')
+        # El índice de timestamp incluye implícitamente el id (rowid)
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_registros_timestamp "
+            "ON registros_incendios (timestamp)"
+        )
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_registros_risk "
+            "ON registros_incendios (RISK)"
+        )
+        # Instantáneas de métricas de rendimiento (página Performance)
+        conn.execute('''
+        CREATE TABLE IF NOT EXISTS metricas_rendimiento (
+            timestamp  DATETIME DEFAULT CURRENT_TIMESTAMP,
+            proceso    INTEGER,
+            etapa      TEXT NOT NULL,
+            n          INTEGER,
+            total_s    REAL,
+            p50_ms     REAL,
+            p90_ms     REAL,
+            p99_ms     REAL,
+            max_ms     REAL
+        )
+        ''')
+        _init_rollups(conn)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Resumen diario por nivel de riesgo (Dashboard)
+# ─────────────────────────────────────────────────────────────────────────────
+# Los triggers mantienen resumen_diario_riesgo al insertar, borrar, reemplazar
+# (vía recursive_triggers) o actualizar, venga la escritura de donde venga.
+_ROLLUP_DDL = (
+    '''
+    CREATE TABLE IF NOT EXISTS resumen_diario_riesgo (
+        dia   TEXT NOT NULL,
+        RISK  TEXT NOT NULL,
+        n     INTEGER NOT NULL,
+        PRIMARY KEY (dia, RISK)
+    ) WITHOUT ROWID
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_resumen_insert
+    AFTER INSERT ON registros_incendios
+    BEGIN
+        INSERT INTO resumen_diario_riesgo (dia, RISK, n)
+        VALUES (IFNULL(date(NEW.timestamp), ''), IFNULL(NEW.RISK, ''), 1)
+        ON CONFLICT (dia, RISK) DO UPDATE SET n = n + 1;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_resumen_delete
+    AFTER DELETE ON registros_incendios
+    BEGIN
+        UPDATE resumen_diario_riesgo SET n = n - 1
+        WHERE dia = IFNULL(date(OLD.timestamp), '') AND RISK = IFNULL(OLD.RISK, '');
+        DELETE FROM resumen_diario_riesgo WHERE n <= 0;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_resumen_update
+    AFTER UPDATE OF timestamp, RISK ON registros_incendios
+    BEGIN
+        UPDATE resumen_diario_riesgo SET n = n - 1
+        WHERE dia = IFNULL(date(OLD.timestamp), '') AND RISK = IFNULL(OLD.RISK, '');
+        DELETE FROM resumen_diario_riesgo WHERE n <= 0;
+        INSERT INTO resumen_diario_riesgo (dia, RISK, n)
+        VALUES (IFNULL(date(NEW.timestamp), ''), IFNULL(NEW.RISK, ''), 1)
+        ON CONFLICT (dia, RISK) DO UPDATE SET n = n + 1;
+    END
+    ''',
+)
+
+
+def _init_rollups(conn: sqlite3.Connection):
+    nueva = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'resumen_diario_riesgo'"
+    ).fetchone() is None
+    for ddl in _ROLLUP_DDL:
+        conn.execute(ddl)
+    if nueva:
+        # Base de datos anterior a los resúmenes: se rellenan con lo que haya
+        _rebuild_rollups(conn)
+
+
+def _rebuild_rollups(conn: sqlite3.Connection):
+    conn.execute("DELETE FROM resumen_diario_riesgo")
+    conn.execute('''
+        INSERT INTO resumen_diario_riesgo (dia, RISK, n)
+        SELECT IFNULL(date(timestamp), ''), IFNULL(RISK, ''), COUNT(*)
+        FROM registros_incendios
+        GROUP BY 1, 2
+    ''')
+
+
+def rebuild_rollups():
+    """Recalcula el resumen diario desde registros_incendios."""
+    with transaction() as conn:
+        _rebuild_rollups(conn)
+
+
+@metrics.instrument("db.fetch_risk_counts")
+def fetch_risk_counts() -> Dict[str, int]:
+    return dict(get_connection().execute(
+        "SELECT RISK, SUM(n) FROM resumen_diario_riesgo GROUP BY RISK"
+    ).fetchall())
+
+
+@metrics.instrument("db.fetch_daily_counts")
+def fetch_daily_counts() -> List[Tuple[str, int]]:
+    return get_connection().execute(
+        "SELECT dia, SUM(n) FROM resumen_diario_riesgo WHERE dia != '' "
+        "GROUP BY dia ORDER BY dia"
+    ).fetchall()
+
+
+def _row(inputs: Dict, risk: str, proba: List[float]) -> tuple:
+    return (
+        inputs["HEAT_SOURC"],
+        inputs["TYPE_MAT"],
+        inputs["STRUC_STAT"],
+        inputs["DETECTOR"],
+        inputs["DET_TYPE"],
+        inputs["AREA"],
+        risk,
+        proba[0],
+        proba[1],
+        proba[2],
+    )
+
+
+@metrics.instrument("db.log_prediction")
 def log_prediction(inputs: Dict, risk: str, proba: List[float], id_manual: Optional[int] = None):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    if id_manual is not None and id_manual > 0:
-        # reemplaza o inserta con ID concreto
-        cursor.execute('''
-            INSERT OR REPLACE INTO registros_incendios
-            (id, HEAT_SOURC, TYPE_MAT, STRUC_STAT, DETECTOR, DET_TYPE, AREA,
-             RISK, prob_bajo, prob_medio, prob_alto)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            id_manual,
-            inputs["HEAT_SOURC"],
-            inputs["TYPE_MAT"],
-            inputs["STRUC_STAT"],
-            inputs["DETECTOR"],
-            inputs["DET_TYPE"],
-            inputs["AREA"],
-            risk,
-            proba[0],
-            proba[1],
-            proba[2],
-        ))
-    else:
-        # autoincremental
-        cursor.execute('''
-            INSERT INTO registros_incendios
-            (HEAT_SOURC, TYPE_MAT, STRUC_STAT, DETECTOR, DET_TYPE, AREA,
-             RISK, prob_bajo, prob_medio, prob_alto)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            inputs["HEAT_SOURC"],
-            inputs["TYPE_MAT"],
-            inputs["STRUC_STAT"],
-            inputs["DETECTOR"],
-            inputs["DET_TYPE"],
-            inputs["AREA"],
-            risk,
-            proba[0],
-            proba[1],
-            proba[2],
-        ))
-    conn.commit()
-    conn.close()
-def fetch_logs() -> List[Dict]:
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM registros_incendios ORDER BY timestamp DESC")
+    if _writer is not None:
+        _writer.submit(inputs, risk, proba, id_manual)
+        return
+    with transaction() as conn:
+        if id_manual is not None and id_manual > 0:
+            # reemplaza o inserta con ID concreto
+            conn.execute(_INSERT_OR_REPLACE, (id_manual,) + _row(inputs, risk, proba))
+        else:
+            # autoincremental
+            conn.execute(_INSERT_AUTO, _row(inputs, risk, proba))
+
+
+@metrics.instrument("db.log_predictions")
+def log_predictions(rows: List[Tuple[Dict, str, List[float]]]):
+    """Guarda varias predicciones (autoincrementales) en una sola transacción."""
+    with transaction() as conn:
+        conn.executemany(_INSERT_AUTO, [
+            _row({"AREA": None, **inputs}, risk, proba) for inputs, risk, proba in rows
+        ])
+
+
+@metrics.instrument("db.guardar_en_bd_con_id_manual")
+def guardar_en_bd_con_id_manual(rec_id: int, inputs: Dict, risk: str, proba: List[float]) -> bool:
+    """Inserta con un ID concreto sin sobrescribir; False si el ID ya existe."""
+    try:
+        with transaction() as conn:
+            conn.execute(_INSERT_NEW_ID, (rec_id,) + _row(inputs, risk, proba))
+    except sqlite3.IntegrityError:
+        return False
+    return True
+
+
+def _dicts(cursor: sqlite3.Cursor) -> List[Dict]:
     cols = [c[0] for c in cursor.description]
-    rows = cursor.fetchall()
-    conn.close()
-    return [dict(zip(cols, row)) for row in rows]
+    return [dict(zip(cols, row)) for row in cursor.fetchall()]
+
+
+@metrics.instrument("db.fetch_logs")
+def fetch_logs() -> List[Dict]:
+    return _dicts(get_connection().execute(
+        "SELECT * FROM registros_incendios ORDER BY timestamp DESC"
+    ))
+
+
+def _log_filters(risks: Optional[Sequence[str]], date_from: Optional[date],
+                 date_to: Optional[date], risk_col: str = "RISK") -> Tuple[List[str], List]:
+    where, params = [], []
+    if risks is not None:
+        where.append(f"{risk_col} IN ({','.join('?' * len(risks))})" if risks else "0")
+        params.extend(risks)
+    # timestamp es texto 'YYYY-MM-DD HH:MM:SS': comparar como cadena usa el índice
+    if date_from is not None:
+        where.append("timestamp >= ?")
+        params.append(date_from.isoformat())
+    if date_to is not None:
+        where.append("timestamp < ?")
+        params.append((date_to + timedelta(days=1)).isoformat())
+    return where, params
+
+
+@metrics.instrument("db.query_logs")
+def query_logs(risks: Optional[Sequence[str]] = None,
+               date_from: Optional[date] = None,
+               date_to: Optional[date] = None,
+               limit: int = 50,
+               after: Optional[Tuple[str, int]] = None) -> Tuple[List[Dict], int]:
+    """Una página del histórico (más recientes primero) y el total filtrado.
+
+    La paginación es por clave ``(timestamp, id)``: ``after`` es la clave de
+    la última fila de la página anterior, así que cada página cuesta lo mismo
+    sin importar lo lejos que esté.
+    """
+    where, params = _log_filters(risks, date_from, date_to)
+    conn = get_connection()
+    clause = f" WHERE {' AND '.join(where)}" if where else ""
+    total = conn.execute(
+        f"SELECT COUNT(*) FROM registros_incendios{clause}", params
+    ).fetchone()[0]
+
+    # "+RISK" impide usar idx_registros_risk en la página: así SQLite recorre
+    # idx_registros_timestamp en orden y se detiene en LIMIT sin ordenar nada.
+    where, params = _log_filters(risks, date_from, date_to, risk_col="+RISK")
+    if after is not None:
+        where.append("(timestamp, id) < (?, ?)")
+        params.extend(after)
+    clause = f" WHERE {' AND '.join(where)}" if where else ""
+    rows = _dicts(conn.execute(
+        f"SELECT * FROM registros_incendios{clause} "
+        "ORDER BY timestamp DESC, id DESC LIMIT ?",
+        params + [limit],
+    ))
+    return rows, total
+
+
+@metrics.instrument("db.log_date_range")
+def log_date_range() -> Optional[Tuple[date, date]]:
+    """Primera y última fecha registradas (None si no hay registros)."""
+    lo, hi = get_connection().execute(
+        "SELECT MIN(timestamp), MAX(timestamp) FROM registros_incendios"
+    ).fetchone()
+    if lo is None:
+        return None
+    return date.fromisoformat(lo[:10]), date.fromisoformat(hi[:10])
+
+
+@metrics.instrument("db.get_log")
+def get_log(rec_id: int) -> Optional[Dict]:
+    rows = _dicts(get_connection().execute(
+        "SELECT * FROM registros_incendios WHERE id = ?", (rec_id,)
+    ))
+    return rows[0] if rows else None
+
+
+@metrics.instrument("db.get_logs")
+def get_logs(ids: List[int], chunk_size: int = 500) -> List[Dict]:
+    """Registros de ``ids`` en el orden pedido (los inexistentes se omiten)."""
+    conn = get_connection()
+    found = {}
+    for start in range(0, len(ids), chunk_size):
+        chunk = ids[start:start + chunk_size]
+        marks = ",".join("?" * len(chunk))
+        for rec in _dicts(conn.execute(
+            f"SELECT * FROM registros_incendios WHERE id IN ({marks})", chunk
+        )):
+            found[rec["id"]] = rec
+    return [found[i] for i in ids if i in found]
+
+
+@metrics.instrument("db.delete_log")
+def delete_log(rec_id: int) -> bool:
+    """Borra un registro; True si existía."""
+    with transaction() as conn:
+        cursor = conn.execute("DELETE FROM registros_incendios WHERE id = ?", (rec_id,))
+    return cursor.rowcount > 0
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Métricas de rendimiento (página Performance)
+# ─────────────────────────────────────────────────────────────────────────────
+def save_metrics(rows: List[Dict]) -> int:
+    """Guarda una instantánea de ``metrics.summary()``; devuelve las filas escritas."""
+    with transaction() as conn:
+        conn.executemany(
+            "INSERT INTO metricas_rendimiento "
+            "(proceso, etapa, n, total_s, p50_ms, p90_ms, p99_ms, max_ms) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            [(os.getpid(), r["name"], r["count"], r["total_s"], r.get("p50_ms"),
+              r.get("p90_ms"), r.get("p99_ms"), r.get("max_ms")) for r in rows],
+        )
+    return len(rows)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Logging write-behind (opcional)
+# ─────────────────────────────────────────────────────────────────────────────
+class PredictionLogWriter:
+    """Cola acotada + hilo que vuelca las predicciones por lotes.
+
+    ``submit`` se bloquea si la cola está llena (backpressure). El hilo agrupa
+    filas hasta ``batch_size`` o ``flush_interval`` segundos y las escribe en
+    una sola transacción con ``executemany``; las filas con ID manual siguen
+    usando INSERT OR REPLACE y se ejecutan en el mismo orden en que llegaron.
+
+    Si SQLite falla de forma transitoria (OperationalError: base de datos
+    bloqueada, disco lleno...) el lote se reintenta con espera exponencial y,
+    si sigue fallando, las filas se conservan y van delante en el siguiente
+    volcado. Con ``max_queue`` filas retenidas el hilo deja de leer la cola
+    hasta poder escribir, así que ``submit`` se bloquea en lugar de perder
+    registros. Un error permanente (IntegrityError, un parámetro de tipo no
+    soportado...) no se arregla reintentando: el lote se escribe fila a fila
+    y sólo se descartan las filas que fallan. ``stats()`` expone los fallos,
+    las filas pendientes, las descartadas y las que no se pudieron guardar al
+    cerrar.
+    """
+
+    RETRIES = 5
+    BACKOFF = 0.1       # segundos; se dobla en cada reintento
+    MAX_BACKOFF = 5.0
+    # Espera máxima de transaction() por el volcado previo (segundos)
+    FLUSH_TIMEOUT = 10.0
+
+    def __init__(self, max_queue: int = 10000, batch_size: int = 500,
+                 flush_interval: float = 1.0):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_queue
+        self.failed_writes = 0
+        self.dropped = 0
+        self.lost = 0
+        self._pending: List = []
+        self._closing = False
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max_queue)
+        self.thread = threading.Thread(
+            target=self._run, name="aignite-log-writer", daemon=True
+        )
+        self.thread.start()
+
+    def submit(self, inputs: Dict, risk: str, proba: List[float],
+               id_manual: Optional[int] = None):
+        ts = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime())
+        if id_manual is not None and id_manual > 0:
+            item = (_INSERT_OR_REPLACE_TS, (id_manual,) + _row(inputs, risk, proba) + (ts,))
+        else:
+            item = (_INSERT_AUTO_TS, _row(inputs, risk, proba) + (ts,))
+        self._queue.put(item)
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Espera a que todo lo encolado hasta ahora esté en disco.
+
+        Devuelve False si se agota ``timeout`` o si quedan filas retenidas
+        por un error de escritura.
+        """
+        if not self.thread.is_alive():
+            return not self._pending
+        done = threading.Event()
+        self._queue.put(("flush", done))
+        return done.wait(timeout) and not self._pending
+
+    def close(self, timeout: Optional[float] = None):
+        # Deja de esperar a la base de datos: lo que siga retenido al
+        # procesar "stop" se cuenta como perdido
+        self._closing = True
+        if self.thread.is_alive():
+            done = threading.Event()
+            self._queue.put(("stop", done))
+            done.wait(timeout)
+            self.thread.join(timeout)
+
+    def stats(self) -> Dict[str, int]:
+        return {"pending": len(self._pending), "failed_writes": self.failed_writes,
+                "dropped": self.dropped, "lost": self.lost}
+
+    def _run(self):
+        batch = []
+        deadline = 0.0
+        while True:
+            # Con demasiadas filas retenidas no se lee más hasta poder escribir
+            while len(self._pending) >= self.max_pending and not self._closing:
+                self._write([])
+            if batch:
+                timeout = max(0.0, deadline - time.monotonic())
+            else:
+                # Sin tráfico nuevo, lo retenido se reintenta igualmente
+                timeout = self.MAX_BACKOFF if self._pending else None
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                self._write(batch)
+                batch = []
+                continue
+            if item[0] in ("flush", "stop"):
+                self._write(batch)
+                batch = []
+                if item[0] == "stop" and self._pending:
+                    self.lost += len(self._pending)
+                    print(f"[log-writer] {len(self._pending)} predicciones sin guardar al cerrar",
+                          file=sys.stderr)
+                    self._pending = []
+                item[1].set()
+                if item[0] == "stop":
+                    return
+                continue
+            if not batch:
+                deadline = time.monotonic() + self.flush_interval
+            batch.append(item)
+            if len(batch) >= self.batch_size:
+                self._write(batch)
+                batch = []
+
+    def _write(self, batch) -> bool:
+        # Lo retenido de volcados anteriores va delante: se conserva el orden
+        batch = self._pending + batch
+        if not batch:
+            return True
+        delay = self.BACKOFF
+        for attempt in range(self.RETRIES):
+            try:
+                conn = get_connection()
+                try:
+                    with metrics.timed("db.write_behind"), conn:
+                        # Tramos consecutivos con la misma sentencia: conserva el orden
+                        for sql, items in groupby(batch, key=lambda it: it[0]):
+                            conn.executemany(sql, [params for _, params in items])
+                except sqlite3.OperationalError:
+                    raise
+                except sqlite3.Error as exc:
+                    # executemany ya revirtió el lote: se repite fila a fila
+                    print(f"[log-writer] Error no recuperable en un lote de {len(batch)} "
+                          f"predicciones ({exc}); se escriben fila a fila", file=sys.stderr)
+                    self._write_rows(conn, batch)
+                self._pending = []
+                return True
+            except sqlite3.OperationalError as exc:
+                self.failed_writes += 1
+                error = exc
+                if attempt + 1 < self.RETRIES:
+                    time.sleep(delay)
+                    delay = min(delay * 2, self.MAX_BACKOFF)
+        self._pending = batch
+        print(f"[log-writer] No se pudieron guardar {len(batch)} predicciones "
+              f"tras {self.RETRIES} intentos ({error}); se reintentará", file=sys.stderr)
+        return False
+
+    def _write_rows(self, conn: sqlite3.Connection, batch):
+        # Una transacción con una sentencia por fila: la fila que falla se
+        # descarta (SQLite sólo deshace esa sentencia) y el resto se guarda.
+        # Un OperationalError deshace todo y vuelve al bucle de reintentos.
+        dropped = 0
+        with metrics.timed("db.write_behind"), conn:
+            for sql, params in batch:
+                try:
+                    conn.execute(sql, params)
+                except sqlite3.OperationalError:
+                    raise
+                except sqlite3.Error as exc:
+                    dropped += 1
+                    error = exc
+        if dropped:
+            self.dropped += dropped
+            print(f"[log-writer] {dropped} predicciones descartadas por un error "
+                  f"permanente ({error})", file=sys.stderr)
+
+
+_writer: Optional[PredictionLogWriter] = None
+_writer_lock = threading.Lock()
+
+
+def enable_write_behind(**kwargs) -> PredictionLogWriter:
+    """Activa el logging asíncrono (idempotente) y lo vacía al salir."""
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = PredictionLogWriter(**kwargs)
+            atexit.register(disable_write_behind)
+        return _writer
+
+
+def disable_write_behind():
+    """Vuelca lo pendiente y vuelve al logging síncrono."""
+    global _writer
+    with _writer_lock:
+        writer, _writer = _writer, None
+    if writer is not None:
+        writer.close()
+
+
+def flush_pending_logs(timeout: Optional[float] = None) -> bool:
+    writer = _writer
+    return writer.flush(timeout) if writer is not None else True
+
+
+def write_behind_stats() -> Optional[Dict[str, int]]:
+    """Fallos y filas pendientes del logging asíncrono (None si no está activo)."""
+    writer = _writer
+    return writer.stats() if writer is not None else None
@@ -0,0 +1,131 @@
+# encoder.py
+
+import warnings
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+import numpy as np
+
+# El bosque convierte internamente la entrada a float32: generamos ya ese dtype
+# para que sklearn no tenga que copiar la matriz.
+DTYPE = np.float32
+
+# El bundle se entrena con un DataFrame, pero el encoder entrega ya el orden
+# exacto de ``columns``: el aviso de sklearn al predecir con arrays sin nombres
+# de columna no aporta nada en el hot path. Se instala una sola vez para todo
+# el proceso; ``warnings.catch_warnings`` por llamada cambia el estado global
+# de warnings y no es seguro con varios hilos (sesiones de Streamlit, servidor).
+warnings.filterwarnings(
+    "ignore", message="X does not have valid feature names", category=UserWarning
+)
+
+
+class CategoricalEncoder:
+    """One-hot precompilado a partir de ``columns``/``cat_cols`` del bundle.
+
+    Produce exactamente los mismos vectores que
+    ``pd.get_dummies(...).reindex(columns=columns, fill_value=0)``: cada
+    ``(columna, código)`` conocido enciende su índice y los códigos que el
+    modelo no vio en entrenamiento dejan la fila a cero.
+    """
+
+    def __init__(self, columns: Sequence[str], cat_cols: Sequence[str]):
+        self.columns = list(columns)
+        self.cat_cols = list(cat_cols)
+        self.n_features = len(self.columns)
+
+        # (columna, código) -> índice, agrupado por columna para el hot path.
+        # Se prueban primero los prefijos más largos por si uno contiene a otro.
+        prefixes = sorted(self.cat_cols, key=len, reverse=True)
+        self._lookup: Dict[str, Dict[str, int]] = {c: {} for c in self.cat_cols}
+        self._passthrough = []
+        for idx, name in enumerate(self.columns):
+            for c in prefixes:
+                if name.startswith(c + "_"):
+                    self._lookup[c][name[len(c) + 1:]] = idx
+                    break
+            else:
+                # Columnas no categóricas (p. ej. numéricas) pasan tal cual
+                self._passthrough.append((name, idx))
+        self._lookup_items = [(c, self._lookup[c]) for c in self.cat_cols]
+
+    @property
+    def passthrough_columns(self) -> List[str]:
+        return [name for name, _ in self._passthrough]
+
+    @classmethod
+    def from_bundle(cls, bundle: Dict) -> "CategoricalEncoder":
+        return cls(bundle["columns"], bundle["cat_cols"])
+
+    def code_columns(self, column: str) -> Dict[str, int]:
+        """Código -> índice one-hot de ``column``, sólo los códigos que el modelo conoce."""
+        return dict(self._lookup[column])
+
+    def index_of(self, column: str, code) -> int:
+        """Índice de la columna one-hot de ``code`` o -1 si el modelo no lo conoce."""
+        return self._lookup[column].get(str(code), -1)
+
+    def encode_into(self, data: Dict, out: np.ndarray) -> np.ndarray:
+        # ``out`` debe llegar a cero; sólo se escriben los unos y las numéricas
+        for c, table in self._lookup_items:
+            idx = table.get(str(data[c]))
+            if idx is not None:
+                out[idx] = 1
+        for name, idx in self._passthrough:
+            out[idx] = data.get(name, 0)
+        return out
+
+    def encode(self, data: Dict) -> np.ndarray:
+        """Codifica un registro como matriz de una fila ``(1, n_features)``."""
+        X = np.zeros((1, self.n_features), dtype=DTYPE)
+        self.encode_into(data, X[0])
+        return X
+
+    def encode_many(self, rows: Iterable[Dict]) -> np.ndarray:
+        rows = rows if isinstance(rows, list) else list(rows)
+        X = np.zeros((len(rows), self.n_features), dtype=DTYPE)
+        for i, data in enumerate(rows):
+            self.encode_into(data, X[i])
+        return X
+
+    def encode_columns(self, columns: Dict[str, Sequence]) -> np.ndarray:
+        """Codifica por columnas (``{variable: valores}``) sin crear dicts por fila."""
+        n = len(columns[self.cat_cols[0]])
+        X = np.zeros((n, self.n_features), dtype=DTYPE)
+        for c, table in self._lookup_items:
+            idx = np.fromiter((table.get(str(v), -1) for v in columns[c]),
+                              dtype=np.intp, count=n)
+            rows = np.flatnonzero(idx >= 0)
+            X[rows, idx[rows]] = 1
+        for name, idx in self._passthrough:
+            if name in columns:
+                X[:, idx] = np.asarray(columns[name], dtype=DTYPE)
+        return X
+
+    def key(self, data: Dict) -> Tuple:
+        """Tupla hashable que identifica la fila codificada.
+
+        Un índice por columna categórica (-1 si el código es desconocido,
+        igual que la fila a cero) seguido de los valores que pasan tal cual.
+        Dos entradas con la misma clave producen exactamente el mismo vector.
+        """
+        key = tuple(table.get(str(data[c]), -1) for c, table in self._lookup_items)
+        if self._passthrough:
+            key += tuple(data.get(name, 0) for name, _ in self._passthrough)
+        return key
+
+    def encode_keys(self, keys: Sequence[Tuple]) -> np.ndarray:
+        n_cat = len(self._lookup_items)
+        X = np.zeros((len(keys), self.n_features), dtype=DTYPE)
+        for i, key in enumerate(keys):
+            for idx in key[:n_cat]:
+                if idx >= 0:
+                    X[i, idx] = 1
+            for (_, idx), value in zip(self._passthrough, key[n_cat:]):
+                X[i, idx] = value
+        return X
+
+    def to_frame(self, X: np.ndarray):
+        """DataFrame con las columnas del modelo (sólo para mostrar/SHAP)."""
+        import pandas as pd
+        return pd.DataFrame(X, columns=self.columns)
+
@@ -0,0 +1,418 @@
+# explain.py
+#
+# Servicio de explicaciones: un único TreeExplainer por versión de modelo en
+# el proceso (compartido por todas las sesiones), caché LRU de vectores SHAP
+# por (versión, códigos de entrada) y explicación por lotes en una sola
+# llamada a shap. Las importancias globales se calculan una vez por modelo.
+#
+# Al entrenar se generan además artefactos de explicación (importancias, media
+# de |SHAP| por clase y contribución media de cada código de los diccionarios
+# de mapeos) en un JSON junto al bundle, ligado a su versión: la app muestra
+# la explicación global sin importar shap.
+
+import json
+import os
+import sys
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+import metrics
+from encoder import DTYPE, CategoricalEncoder
+from mapeos import CODE_MAPS
+from model_store import MODEL_PATH, artifact_path, bundle_fingerprint, on_bundle_saved
+from scoring import PredictionCache, RiskScorer, get_scorer
+
+EXPLAIN_CACHE_SIZE = 1024
+# Filas de entrenamiento explicadas con SHAP para los artefactos: una muestra
+# aleatoria (medias globales) más las filas necesarias para que cada código
+# conocido tenga al menos ARTIFACT_MIN_PER_CODE. TreeExplainer cuesta del
+# orden de décimas de segundo por fila con cientos de árboles profundos.
+ARTIFACT_SAMPLE = 100
+ARTIFACT_MIN_PER_CODE = 3
+# Filas de la muestra aleatoria con la variable a cero para el grupo "(otro)"
+ARTIFACT_OTHER_SAMPLE = 20
+# Tope de tiempo de SHAP en build_artifacts (segundos), comprobado cada
+# ARTIFACT_CHUNK filas: con bosques grandes y profundos la muestra completa
+# puede costar minutos, fuera del presupuesto de la búsqueda
+ARTIFACT_SECONDS = 60.0
+ARTIFACT_CHUNK = 8
+OTHER_CODE = "(otro)"
+
+# Vectores SHAP (n_features, n_clases) por (versión, encoder.key(...))
+shap_cache = PredictionCache(EXPLAIN_CACHE_SIZE)
+on_bundle_saved(lambda path: shap_cache.clear())
+
+
+class RiskExplainer:
+    """Explicaciones del modelo de un ``RiskScorer``.
+
+    El ``shap.TreeExplainer`` se construye la primera vez que hace falta (con
+    un bosque de cientos de árboles tarda), así que ``global_importances``
+    funciona aunque ``shap`` no esté instalado.
+    """
+
+    def __init__(self, scorer: RiskScorer, cache: Optional[PredictionCache] = shap_cache,
+                 model_path: str = MODEL_PATH):
+        self.scorer = scorer
+        self.model_path = model_path
+        self.model = scorer.model
+        self.encoder = scorer.encoder
+        self.version = scorer.version
+        self.cache = cache if self.version is not None else None
+        self._tree = None
+        self._importances: Optional[pd.Series] = None
+        self._artifacts: Optional[Dict] = None
+        self._lock = threading.Lock()
+
+    @property
+    def tree_explainer(self):
+        with self._lock:
+            if self._tree is None:
+                import shap
+                self._tree = shap.TreeExplainer(self.model)
+            return self._tree
+
+    @property
+    def expected_value(self) -> np.ndarray:
+        return np.atleast_1d(np.asarray(self.tree_explainer.expected_value, dtype=float))
+
+    @property
+    def artifacts(self) -> Optional[Dict]:
+        """Artefactos de entrenamiento de esta versión (``None`` si no hay)."""
+        if self._artifacts is None and self.version is not None:
+            self._artifacts = load_artifacts(self.model_path, self.version) or {}
+        return self._artifacts or None
+
+    def global_importances(self, top: Optional[int] = None) -> pd.Series:
+        """``feature_importances_`` ordenadas de mayor a menor (una vez por modelo)."""
+        if self._importances is None:
+            self._importances = pd.Series(
+                self.model.feature_importances_, index=self.encoder.columns
+            ).sort_values(ascending=False)
+        return self._importances if top is None else self._importances.head(top)
+
+    def mean_abs_shap(self, by: str = "feature") -> Optional[pd.DataFrame]:
+        """Media de |SHAP| precalculada: por variable (``by="feature"``) o por
+        columna one-hot (``by="column"``), una columna por clase."""
+        art = self.artifacts
+        key = "feature_mean_abs_shap" if by == "feature" else "mean_abs_shap"
+        if not art or not art.get(key):
+            return None
+        return pd.DataFrame(art[key])[art["classes"]]
+
+    def code_contributions(self, data: Dict) -> Optional[pd.DataFrame]:
+        """Contribución SHAP media (por clase) de cada código de ``data``.
+
+        Sale de los artefactos: media sobre las filas de entrenamiento con ese
+        código. ``n`` es el número de filas; los códigos que no aparecieron
+        en la muestra quedan vacíos.
+        """
+        art = self.artifacts
+        if not art or not art.get("codes"):
+            return None
+        out = {}
+        for feature, codes in art["codes"].items():
+            code = str(data[feature])
+            entry = codes.get(code) or codes.get(OTHER_CODE) or {"n": 0, "mean": None}
+            out[f"{feature}={code}"] = {"n": entry["n"], **(entry["mean"] or {})}
+        return pd.DataFrame(out).T
+
+    def _shap(self, X: np.ndarray) -> np.ndarray:
+        explainer = self.tree_explainer
+        with self._lock, metrics.timed("explain.shap"):
+            values = explainer.shap_values(X)
+        # Según la versión de shap: lista por clase o array (n, features, clases)
+        if isinstance(values, list):
+            values = np.stack(values, axis=-1)
+        return np.asarray(values, dtype=float)
+
+    def explain_batch(self, rows: List[Dict]) -> np.ndarray:
+        """Valores SHAP de ``rows``: array ``(n, n_features, n_clases)``.
+
+        Sólo las combinaciones de códigos distintas que no están en la caché
+        pasan por TreeExplainer, y todas en una sola llamada.
+        """
+        if not rows:
+            return np.empty((0, self.encoder.n_features, len(self.scorer.classes_)))
+        if self.cache is None:
+            return self._shap(self.encoder.encode_many(rows))
+
+        keys = [(self.version, self.encoder.key(r)) for r in rows]
+        cached = self.cache.get_many(keys)
+        missing = list(dict.fromkeys(k for k, v in zip(keys, cached) if v is None))
+        if missing:
+            values = self._shap(self.encoder.encode_keys([k[1] for k in missing]))
+            fresh = {k: v.copy() for k, v in zip(missing, values)}
+            self.cache.put_many(fresh)
+            cached = [fresh[k] if v is None else v for k, v in zip(keys, cached)]
+        return np.stack(cached)
+
+    def explain(self, data: Dict) -> np.ndarray:
+        return self.explain_batch([data])[0]
+
+    def explanation(self, data: Dict, class_index: int,
+                    encoded: Optional[np.ndarray] = None):
+        """``shap.Explanation`` de una fila para una clase (para ``shap.plots``).
+
+        ``encoded`` es la fila ya codificada (``encoder.encode(data)``), si se tiene.
+        """
+        import shap
+        if encoded is None:
+            encoded = self.encoder.encode(data)
+        return shap.Explanation(
+            values=self.explain(data)[:, class_index],
+            base_values=self.expected_value[class_index],
+            data=encoded[0],
+            feature_names=self.encoder.columns,
+        )
+
+
+# Explicador vigente por (ruta, backend): se renueva cuando cambia el scorer
+_explainers: Dict[Tuple[str, Optional[str]], RiskExplainer] = {}
+_explainers_lock = threading.Lock()
+
+
+def get_explainer(model_path: str = MODEL_PATH, backend: Optional[str] = None) -> RiskExplainer:
+    scorer = get_scorer(model_path, backend)
+    key = (model_path, backend)
+    with _explainers_lock:
+        explainer = _explainers.get(key)
+        if explainer is None or explainer.scorer is not scorer:
+            explainer = RiskExplainer(scorer, model_path=model_path)
+            _explainers[key] = explainer
+        return explainer
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Artefactos de explicación generados al entrenar
+# ─────────────────────────────────────────────────────────────────────────────
+def artifacts_path(model_path: str, version: Optional[str]) -> str:
+    return artifact_path(model_path, version, ".explain.json")
+
+
+def _group_columns(encoder: CategoricalEncoder) -> Dict[str, Tuple[np.ndarray, List[str]]]:
+    # Índices one-hot y código de cada uno, por variable
+    groups = {}
+    for f in encoder.cat_cols:
+        table = encoder.code_columns(f)
+        groups[f] = (np.array(list(table.values()), dtype=np.intp), list(table))
+    return groups
+
+
+def artifact_sample(X: np.ndarray, encoder: CategoricalEncoder,
+                    size: int = ARTIFACT_SAMPLE, per_code: int = ARTIFACT_MIN_PER_CODE,
+                    seed: int = 0) -> Tuple[np.ndarray, int]:
+    """Filas de ``X`` (entrenamiento codificado) para ``build_artifacts``.
+
+    Devuelve ``(muestra, n_aleatorias)``: las primeras ``n_aleatorias`` filas
+    son una muestra aleatoria de ``size``; detrás van las filas añadidas para
+    que cada código con filas en ``X`` aparezca al menos ``per_code`` veces.
+    """
+    rng = np.random.default_rng(seed)
+    chosen = rng.permutation(len(X))[:size]
+    counts = (X[chosen] > 0).sum(axis=0)
+    taken = np.zeros(len(X), dtype=bool)
+    taken[chosen] = True
+    extra = []
+    for _, (idx, _) in _group_columns(encoder).items():
+        for col in idx:
+            need = per_code - counts[col]
+            if need <= 0:
+                continue
+            rows = np.flatnonzero((X[:, col] > 0) & ~taken)
+            rows = rng.permutation(rows)[:need]
+            taken[rows] = True
+            counts += (X[rows] > 0).sum(axis=0)
+            extra.append(rows)
+    rows = np.concatenate([chosen] + extra) if extra else chosen
+    return X[rows], len(chosen)
+
+
+def _artifact_shap_values(tree, X: np.ndarray, deadline: Optional[float],
+                          stop: Optional[Callable[[], bool]]) -> np.ndarray:
+    # (n, columnas, clases) por tramos de ARTIFACT_CHUNK filas. Se para al
+    # pasar ``deadline`` o si ``stop()`` y devuelve las filas ya calculadas
+    # (al menos un tramo). Sin comprobar la aditividad: con árboles muy
+    # profundos shap 0.51 la da por fallida en todas las filas y para
+    # resúmenes orientativos el error numérico no importa.
+    parts = []
+    for start in range(0, len(X), ARTIFACT_CHUNK):
+        if parts and ((deadline is not None and time.perf_counter() >= deadline)
+                      or (stop is not None and stop())):
+            break
+        values = tree.shap_values(X[start:start + ARTIFACT_CHUNK], check_additivity=False)
+        if isinstance(values, list):
+            values = np.stack(values, axis=-1)
+        parts.append(np.asarray(values, dtype=float))
+    return np.concatenate(parts)
+
+
+def _shap_summaries(shap, model, encoder: CategoricalEncoder, classes: List[str],
+                    X: np.ndarray, n_random: int, deadline: Optional[float],
+                    stop: Optional[Callable[[], bool]]) -> Dict:
+    groups = _group_columns(encoder)
+    tree = shap.TreeExplainer(model)
+
+    # Filas aleatorias con cada variable a cero, para "(otro)"
+    other_rows = X[:min(n_random, ARTIFACT_OTHER_SAMPLE)]
+    blanked = []
+    for f, (idx, _) in groups.items():
+        rows = other_rows.copy()
+        rows[:, idx] = 0
+        blanked.append(rows)
+    n_blank = len(other_rows) * len(groups)
+    # Por orden de prioridad, por si se agota el tiempo: la parte aleatoria
+    # (medias globales), "(otro)" y las filas añadidas para la cobertura
+    ordered = np.concatenate([X[:n_random]] + blanked + [X[n_random:]])
+    values_all = _artifact_shap_values(tree, ordered, deadline, stop)
+    done = len(values_all)
+    n_done_random = min(n_random, done)
+    n_done_extra = max(0, done - n_random - n_blank)
+    values = np.concatenate([values_all[:n_done_random], values_all[n_random + n_blank:]])
+    X = np.concatenate([X[:n_done_random], X[n_random:n_random + n_done_extra]])
+    if done >= n_random + n_blank:
+        values_other = np.split(values_all[n_random:n_random + n_blank], len(groups))
+    else:
+        values_other = [values_all[:0]] * len(groups)
+
+    out: Dict = {
+        "sample_size": len(X),
+        "random_sample_size": n_done_random,
+        "truncated": done < len(ordered),
+    }
+    mean_abs = np.abs(values[:n_done_random]).mean(axis=0)
+    out["mean_abs_shap"] = {
+        c: dict(zip(encoder.columns, map(float, mean_abs[:, k])))
+        for k, c in enumerate(classes)
+    }
+
+    feature_abs = {}
+    codes_out = {}
+    coverage = {}
+    for (f, (idx, codes)), other in zip(groups.items(), values_other):
+        # Los valores SHAP son aditivos: la contribución de la variable es
+        # la suma de sus columnas one-hot
+        group = values[:, idx, :].sum(axis=1) if len(idx) else np.zeros((len(X), len(classes)))
+        feature_abs[f] = np.abs(group[:n_done_random]).mean(axis=0)
+        row_code = np.full(len(X), None, dtype=object)
+        if len(idx):
+            active = X[:, idx] > 0
+            has_code = active.any(axis=1)
+            row_code[has_code] = np.array(codes, dtype=object)[active[has_code].argmax(axis=1)]
+        summary = {}
+        for code in codes:
+            mask = row_code == code
+            summary[code] = {
+                "n": int(mask.sum()),
+                "mean": dict(zip(classes, map(float, group[mask].mean(axis=0))))
+                if mask.any() else None,
+            }
+        other_group = other[:, idx, :].sum(axis=1) if len(idx) else np.zeros((len(other), len(classes)))
+        summary[OTHER_CODE] = {
+            "n": len(other),
+            "mean": dict(zip(classes, map(float, other_group.mean(axis=0))))
+            if len(other) else None,
+        }
+        coverage[f] = {
+            "codes": len(codes),
+            "with_rows": sum(1 for c in codes if summary[c]["n"]),
+            "min_rows": sum(1 for c in codes if summary[c]["n"] >= ARTIFACT_MIN_PER_CODE),
+        }
+        # Los códigos que el modelo no conoce se codifican como "(otro)"
+        for code in CODE_MAPS.get(f, {}):
+            summary.setdefault(code, summary[OTHER_CODE])
+        codes_out[f] = summary
+    out["feature_mean_abs_shap"] = {
+        c: {f: float(v[k]) for f, v in feature_abs.items()} for k, c in enumerate(classes)
+    }
+    out["codes"] = codes_out
+    out["coverage"] = coverage
+    return out
+
+
+def build_artifacts(bundle: Dict, version: str, X_sample: np.ndarray,
+                    model_path: str = MODEL_PATH, n_random: Optional[int] = None,
+                    max_seconds: Optional[float] = ARTIFACT_SECONDS,
+                    stop: Optional[Callable[[], bool]] = None) -> str:
+    """Calcula y guarda los artefactos de explicación de un bundle.
+
+    Las importancias salen del bosque; las medias de |SHAP| y las
+    contribuciones por código, de explicar ``X_sample`` con TreeExplainer
+    (ver ``artifact_sample``). Las medias globales usan sólo las primeras
+    ``n_random`` filas, la parte aleatoria; las contribuciones por código,
+    todas. "(otro)" es la contribución de la variable con un código que el
+    modelo no conoce (sus columnas a cero).
+
+    SHAP se calcula por tramos y se detiene al pasar ``max_seconds`` o si
+    ``stop()`` devuelve True; los resúmenes usan las filas ya explicadas
+    (``truncated`` en el JSON). Sin shap instalado, o si shap falla, se
+    guardan sólo las importancias: los artefactos no impiden publicar.
+    """
+    t0 = time.perf_counter()
+    model = bundle["model"]
+    encoder = CategoricalEncoder.from_bundle(bundle)
+    classes = [str(c) for c in model.classes_]
+    art: Dict = {
+        "version": version,
+        "classes": classes,
+        "importances": dict(zip(encoder.columns, map(float, model.feature_importances_))),
+        "sample_size": 0,
+    }
+    try:
+        import shap
+    except ImportError:
+        print("shap no está instalado: artefactos sólo con importancias.", file=sys.stderr)
+        shap = None
+
+    if shap is not None and len(X_sample):
+        X = np.asarray(X_sample, dtype=DTYPE)
+        n_random = len(X) if n_random is None else n_random
+        deadline = t0 + max_seconds if max_seconds is not None else None
+        try:
+            art.update(_shap_summaries(shap, model, encoder, classes, X, n_random,
+                                       deadline, stop))
+        except Exception as exc:
+            print(f"No se pudieron calcular los valores SHAP ({type(exc).__name__}: {exc}): "
+                  "artefactos sólo con importancias.", file=sys.stderr)
+        if art.get("truncated"):
+            print(f"SHAP detenido tras {time.perf_counter() - t0:.1f}s: "
+                  f"{art['sample_size']} de {len(X)} filas explicadas.", file=sys.stderr)
+
+    path = artifacts_path(model_path, version)
+    tmp = f"{path}.tmp-{os.getpid()}"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(art, f)
+    os.replace(tmp, path)
+    print(f"Artefactos de explicación ({art['sample_size']} filas con SHAP) guardados "
+          f"en {path} en {time.perf_counter() - t0:.1f}s")
+    for f, cov in art.get("coverage", {}).items():
+        print(f"  {f}: {cov['with_rows']}/{cov['codes']} códigos con filas, "
+              f"{cov['min_rows']} con al menos {ARTIFACT_MIN_PER_CODE}")
+    return path
+
+
+def load_artifacts(model_path: str = MODEL_PATH, version: Optional[str] = None) -> Optional[Dict]:
+    """Artefactos de ``version`` (por defecto, la del bundle en disco).
+
+    ``None`` si no existen o son de otro bundle.
+    """
+    if version is None:
+        if not os.path.exists(model_path):
+            return None
+        version = bundle_fingerprint(model_path)
+    path = artifacts_path(model_path, version)
+    if not os.path.exists(path):
+        path = artifacts_path(model_path, None)  # nombre sin versión
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        art = json.load(f)
+    if version is not None and art.get("version") != version:
+        print(f"Artefactos de explicación obsoletos ({art.get('version')} != {version}): "
+              "se ignoran.", file=sys.stderr)
+        return None
+    return art
@@ -0,0 +1,241 @@
+# ingest.py
+#
+# Carga del fichero fireincident para entrenar. Sólo se leen las columnas del
+# modelo y FIRE_SPRD con el parser C de pandas, por bloques (memoria acotada),
+# y cada bloque se limpia y pasa a ``category`` antes de juntarlo. El resultado
+# limpio se guarda en data/cache como pickle junto a la huella del fichero raw
+# (tamaño, mtime y SHA-1): los reentrenamientos siguientes no parsean el CSV.
+
+import json
+import os
+import sys
+import time
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+from mapeos import CODE_MAPS
+from model_store import file_digest
+
+RAW_PATH = os.path.join("data", "raw", "fireincident-2.txt")
+CACHE_DIR = os.path.join("data", "cache")
+FEATURES = list(CODE_MAPS)
+TARGET = "FIRE_SPRD"
+CHUNK_SIZE = 200000
+
+# Súbelo si cambia la limpieza o las columnas: invalida las cachés existentes
+CACHE_FORMAT = 1
+
+
+def cache_paths(raw_path: str = RAW_PATH, cache_dir: str = CACHE_DIR):
+    name = os.path.basename(raw_path)
+    return (os.path.join(cache_dir, f"{name}.clean.pkl"),
+            os.path.join(cache_dir, f"{name}.clean.json"))
+
+
+def _clean_chunk(chunk: pd.DataFrame) -> pd.DataFrame:
+    # Misma limpieza que el notebook: fuera 'UUU' y vacíos en cualquier columna
+    chunk = chunk.replace("UUU", pd.NA).dropna()
+    out = {c: chunk[c].astype("category") for c in FEATURES}
+    out[TARGET] = pd.to_numeric(chunk[TARGET]).astype(np.int8)
+    return pd.DataFrame(out)
+
+
+def read_clean(raw_path: str = RAW_PATH, chunk_size: int = CHUNK_SIZE,
+               encoding: str = "latin1") -> pd.DataFrame:
+    """Lee y limpia el fichero raw por bloques.
+
+    Los códigos se leen siempre como texto (``'00'`` sigue siendo ``'00'``,
+    igual que en los diccionarios de ``mapeos``) y se guardan como categorías
+    con el vocabulario unido de todos los bloques.
+    """
+    reader = pd.read_csv(
+        raw_path, sep="^", header=0, usecols=FEATURES + [TARGET], dtype=str,
+        encoding=encoding, chunksize=chunk_size,
+    )
+    chunks = [_clean_chunk(chunk) for chunk in reader]
+    if not chunks:
+        return pd.DataFrame({**{c: pd.Categorical([]) for c in FEATURES},
+                             TARGET: np.array([], dtype=np.int8)})
+    df = pd.DataFrame({
+        c: union_categoricals([ch[c] for ch in chunks], sort_categories=True)
+        for c in FEATURES
+    })
+    df[TARGET] = np.concatenate([ch[TARGET].to_numpy() for ch in chunks])
+    return df
+
+
+def file_fingerprint(path: str, previous: Optional[Dict] = None) -> Dict:
+    """Tamaño, mtime y SHA-1 de ``path``.
+
+    Si tamaño y mtime coinciden con ``previous`` se reutiliza su SHA-1 sin
+    volver a leer el fichero; así sólo se hashea lo que parece haber cambiado.
+    """
+    st = os.stat(path)
+    fp = {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+    if previous and all(previous.get(k) == v for k, v in fp.items()) and "sha1" in previous:
+        fp["sha1"] = previous["sha1"]
+    else:
+        fp["sha1"] = file_digest(path)
+    return fp
+
+
+def _read_json(path: str) -> Optional[Dict]:
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def load_clean(raw_path: str = RAW_PATH, cache_dir: Optional[str] = CACHE_DIR,
+               chunk_size: int = CHUNK_SIZE, encoding: str = "latin1") -> pd.DataFrame:
+    """DataFrame limpio (FEATURES categóricas + FIRE_SPRD), desde caché si vale.
+
+    Si tamaño y mtime coinciden con los de la caché se usa sin más; si no,
+    se compara el SHA-1 del fichero y sólo se vuelve a parsear si el
+    contenido ha cambiado. Con ``cache_dir=None`` no se usa caché.
+    """
+    t0 = time.perf_counter()
+    if cache_dir is None:
+        return read_clean(raw_path, chunk_size, encoding)
+
+    pkl_path, meta_path = cache_paths(raw_path, cache_dir)
+    meta = _read_json(meta_path) if os.path.exists(pkl_path) else None
+    if meta is not None and meta.get("format") != CACHE_FORMAT:
+        meta = None
+    fp = file_fingerprint(raw_path, meta)
+    if meta is not None and meta["sha1"] == fp["sha1"]:
+        df = pd.read_pickle(pkl_path)
+        if meta["mtime_ns"] != fp["mtime_ns"]:
+            # Mismo contenido con otro mtime: se actualiza la huella
+            _write_json(meta_path, {**meta, **fp})
+        print(f"Datos limpios de {raw_path} leídos de la caché ({len(df)} filas) "
+              f"en {time.perf_counter() - t0:.2f}s", file=sys.stderr)
+        return df
+
+    df = read_clean(raw_path, chunk_size, encoding)
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp = f"{pkl_path}.tmp-{os.getpid()}"
+    df.to_pickle(tmp)
+    os.replace(tmp, pkl_path)
+    _write_json(meta_path, {**fp, "format": CACHE_FORMAT, "rows": len(df)})
+    print(f"{raw_path} parseado ({len(df)} filas limpias) en "
+          f"{time.perf_counter() - t0:.2f}s; caché en {pkl_path}", file=sys.stderr)
+    return df
+
+
+def _write_json(path: str, data: Dict) -> None:
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Preprocesado por bloques (cli.py, opción 1)
+# ─────────────────────────────────────────────────────────────────────────────
+PREPROCESS_RAW = os.path.join("data", "raw", "fireincident.txt")
+REPORTS_DIR = os.path.join("data", "reports")
+INTERMEDIATE_DIR = os.path.join("data", "intermediate")
+STAMP_PATH = os.path.join(REPORTS_DIR, "preprocesado.json")
+
+NULL_SUMMARY_CSV = os.path.join(REPORTS_DIR, "null_summary.csv")
+FIRE_SPRD_CSV = os.path.join(REPORTS_DIR, "fire_spread_distribution.csv")
+FILTERED_CSV = os.path.join(INTERMEDIATE_DIR, "data_filtrada.csv")
+FINAL_CSV = os.path.join(INTERMEDIATE_DIR, "data_final.csv")
+SCAN_OUTPUTS = [NULL_SUMMARY_CSV, FIRE_SPRD_CSV, FILTERED_CSV, FINAL_CSV]
+
+
+def peak_rss_bytes() -> int:
+    """Pico de memoria residente del proceso (0 si el SO no lo expone)."""
+    try:
+        import resource
+    except ImportError:
+        return 0
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+def scan_raw(raw_path: str = PREPROCESS_RAW, chunk_size: int = CHUNK_SIZE,
+             encoding: str = "latin1") -> Dict:
+    """Una sola pasada por bloques sobre el fichero raw.
+
+    Acumula el resumen de nulos (todas las columnas) y la distribución de
+    FIRE_SPRD, y escribe a la vez data_filtrada.csv (columnas del modelo) y
+    data_final.csv (las mismas sin nulos). Los valores se copian como texto.
+    """
+    cols = FEATURES + [TARGET]
+    os.makedirs(REPORTS_DIR, exist_ok=True)
+    os.makedirs(INTERMEDIATE_DIR, exist_ok=True)
+    tmp = f".tmp-{os.getpid()}"
+
+    n_rows = 0
+    n_final = 0
+    missing: Optional[pd.Series] = None
+    spread = pd.Series(dtype=np.int64)
+    reader = pd.read_csv(raw_path, sep="^", header=0, dtype=str,
+                         encoding=encoding, chunksize=chunk_size)
+    with open(FILTERED_CSV + tmp, "w", encoding="utf-8", newline="") as filtered, \
+         open(FINAL_CSV + tmp, "w", encoding="utf-8", newline="") as final:
+        for i, chunk in enumerate(reader):
+            n_rows += len(chunk)
+            nulls = chunk.isna().sum()
+            missing = nulls if missing is None else missing.add(nulls, fill_value=0)
+            counts = pd.to_numeric(chunk[TARGET], errors="coerce").value_counts()
+            spread = spread.add(counts, fill_value=0)
+
+            sel = chunk[cols]
+            sel.to_csv(filtered, header=i == 0, index=False)
+            clean = sel.dropna()
+            n_final += len(clean)
+            clean.to_csv(final, header=i == 0, index=False)
+    os.replace(FILTERED_CSV + tmp, FILTERED_CSV)
+    os.replace(FINAL_CSV + tmp, FINAL_CSV)
+
+    if missing is None:
+        missing = pd.Series(dtype=np.int64)
+    null_summary = pd.DataFrame({
+        "missing_count": missing.astype(np.int64),
+        "missing_pct": missing / n_rows * 100 if n_rows else missing * 0.0,
+    })
+    null_summary.to_csv(NULL_SUMMARY_CSV, index=True)
+    spread = spread.astype(np.int64).sort_index()
+    spread.rename_axis(TARGET).rename("count").to_csv(FIRE_SPRD_CSV, header=True)
+    return {"rows": n_rows, "final_rows": n_final}
+
+
+def run_stage(name: str, inputs, outputs, fn, stamp_path: str = STAMP_PATH) -> Dict:
+    """Ejecuta ``fn`` salvo que sus entradas no hayan cambiado desde la última vez.
+
+    La huella de cada entrada se guarda en ``stamp_path``; si todas coinciden y
+    las salidas existen, la etapa se omite. Se informa del tiempo y del pico
+    de memoria del proceso al terminar.
+    """
+    stamps = _read_json(stamp_path) or {}
+    previous = stamps.get(name, {}).get("inputs", {})
+    fps = {p: file_fingerprint(p, previous.get(p)) for p in inputs}
+    up_to_date = (
+        set(previous) == set(fps)
+        and all(previous[p]["sha1"] == fp["sha1"] for p, fp in fps.items())
+        and all(os.path.exists(o) for o in outputs)
+    )
+    if up_to_date:
+        if fps != previous:
+            # Mismo contenido con otro mtime: se guarda para no volver a hashear
+            stamps[name]["inputs"] = fps
+            _write_json(stamp_path, stamps)
+        print(f"[{name}] entradas sin cambios: se omite")
+        return {"stage": name, "skipped": True}
+
+    t0 = time.perf_counter()
+    result = fn() or {}
+    elapsed = time.perf_counter() - t0
+    stamps[name] = {"inputs": fps, "outputs": list(outputs)}
+    os.makedirs(os.path.dirname(stamp_path) or ".", exist_ok=True)
+    _write_json(stamp_path, stamps)
+    peak = peak_rss_bytes()
+    print(f"[{name}] {elapsed:.2f}s; pico de memoria del proceso {peak / 2**20:.0f} MiB")
+    return {"stage": name, "skipped": False, "seconds": elapsed,
+            "peak_rss_bytes": peak, **result}
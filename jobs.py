@@ -0,0 +1,158 @@
+# jobs.py
+#
+# Reentrenamiento en segundo plano para la app. El entrenamiento corre en un
+# proceso aparte (no bloquea la sesión de Streamlit ni compite por el GIL del
+# servidor), informa del progreso por una cola y se puede cancelar. Al acabar
+# publica un bundle nuevo; cada sesión lo recoge en su siguiente ejecución a
+# través de get_scorer, y las peticiones en curso terminan con el anterior.
+
+import atexit
+import multiprocessing as mp
+import queue
+import threading
+import time
+import traceback
+from typing import Dict, List, Optional
+
+# Segundos de margen para la cancelación cooperativa antes de matar el proceso
+CANCEL_GRACE = 10.0
+
+
+def _run_retrain(events, cancel, kwargs: Dict) -> None:
+    # Proceso hijo: todo lo que vuelve al padre son mensajes pequeños
+    from sklearn.metrics import classification_report, confusion_matrix
+    from model_store import MODEL_PATH, bundle_fingerprint
+    from train_model import TrainingCancelled, retrain_and_return_test
+    try:
+        model, X_test, y_test, best_params, timings = retrain_and_return_test(
+            **kwargs, cancel=cancel,
+            progress=lambda phase, fraction: events.put(("progress", (phase, fraction))),
+        )
+        y_pred = model.predict(X_test)
+        events.put(("done", {
+            "version": bundle_fingerprint(kwargs.get("model_path", MODEL_PATH)),
+            "best_params": best_params,
+            "timings": timings,
+            "labels": [str(c) for c in model.classes_],
+            "report": classification_report(y_test, y_pred, output_dict=True),
+            "confusion": confusion_matrix(y_test, y_pred, labels=model.classes_).tolist(),
+        }))
+    except TrainingCancelled:
+        events.put(("cancelled", None))
+    except Exception:
+        events.put(("failed", traceback.format_exc()))
+
+
+class RetrainJob:
+    """Un reentrenamiento en un proceso hijo.
+
+    ``state`` pasa de "running" a "done", "cancelled" o "failed". El estado
+    sólo se actualiza al llamar a ``poll``, que vacía la cola de mensajes.
+    """
+
+    def __init__(self, **kwargs):
+        ctx = mp.get_context("spawn")
+        self.kwargs = kwargs
+        self.state = "running"
+        self.phase = "inicio"
+        self.progress = 0.0
+        self.result: Optional[Dict] = None
+        self.error: Optional[str] = None
+        self.started = time.time()
+        self.finished: Optional[float] = None
+        self.cancel_requested: Optional[float] = None
+        self._lock = threading.Lock()
+        self._events = ctx.Queue()
+        self._cancel = ctx.Event()
+        # No daemon: joblib entrena en serie dentro de procesos daemon
+        self._process = ctx.Process(target=_run_retrain,
+                                    args=(self._events, self._cancel, kwargs))
+        self._process.start()
+
+    @property
+    def running(self) -> bool:
+        return self.state == "running"
+
+    @property
+    def elapsed(self) -> float:
+        return (self.finished or time.time()) - self.started
+
+    def _drain(self) -> None:
+        while True:
+            try:
+                kind, payload = self._events.get_nowait()
+            except queue.Empty:
+                return
+            if kind == "progress":
+                self.phase, self.progress = payload
+            elif kind == "done":
+                self.state, self.result, self.progress = "done", payload, 1.0
+            elif kind == "cancelled":
+                self.state = "cancelled"
+            elif kind == "failed":
+                self.state, self.error = "failed", payload
+
+    def poll(self) -> "RetrainJob":
+        with self._lock:
+            if not self.running:
+                return self
+            self._drain()
+            if self.running and not self._process.is_alive():
+                self._drain()  # mensajes enviados justo antes de salir
+                if self.running:
+                    self.state = "failed"
+                    self.error = f"El proceso de entrenamiento terminó (código {self._process.exitcode})"
+            if (self.running and self.cancel_requested is not None
+                    and self.phase != "guardado"
+                    and time.time() - self.cancel_requested > CANCEL_GRACE):
+                # La búsqueda sólo mira la cancelación entre candidatos
+                self._process.terminate()
+                self.state = "cancelled"
+            if not self.running:
+                self.finished = time.time()
+                self._process.join(timeout=1)
+            return self
+
+    def cancel(self) -> None:
+        """Pide cancelar; si no se atiende en ``CANCEL_GRACE`` s, se mata el proceso.
+
+        Durante el guardado no se mata el proceso (el bundle se publica entero o
+        no se publica): la cancelación se atiende entre tramos de SHAP.
+        """
+        with self._lock:
+            if self.running and self.cancel_requested is None:
+                self._cancel.set()
+                self.cancel_requested = time.time()
+
+    def terminate(self) -> None:
+        if self._process.is_alive():
+            self._process.terminate()
+            self._process.join(timeout=5)
+
+
+class JobRegistry:
+    """Trabajo de reentrenamiento del proceso, compartido por todas las sesiones."""
+
+    def __init__(self, history: int = 10):
+        self._lock = threading.Lock()
+        self.current: Optional[RetrainJob] = None
+        self.history: List[RetrainJob] = []
+        self._max_history = history
+        atexit.register(self.shutdown)
+
+    def start(self, **kwargs) -> RetrainJob:
+        with self._lock:
+            if self.current is not None and self.current.poll().running:
+                raise RuntimeError("Ya hay un reentrenamiento en curso")
+            if self.current is not None:
+                self.history = ([self.current] + self.history)[:self._max_history]
+            self.current = RetrainJob(**kwargs)
+            return self.current
+
+    def get(self) -> Optional[RetrainJob]:
+        job = self.current
+        return job.poll() if job is not None else None
+
+    def shutdown(self) -> None:
+        if self.current is not None:
+            self.current.terminate()
@@ -0,0 +1,175 @@
+# mapeos.py
+#
+# Códigos válidos de cada variable categórica del modelo. Se comparten entre
+# la app, el CLI y los procesos de entrenamiento sin importar Streamlit.
+
+TYPE_MAT_MAP = {
+    '': 'TYPE MATERIAL FIRST IGNITED',
+            '00': 'Type of material first ignited, other',
+            '1': 'Flammable Gas',
+            '10': 'Flammable gas, other',
+            '11': 'Natural gas',
+            '12': 'LP gas',
+            '13': 'Anesthetic gas',
+            '14': 'Acetylene',
+            '15': 'Hydrogen',
+            '2': 'Flammable, Combustible Liquid',
+            '20': 'Flammable or combustible liquid, other',
+            '21': 'Ether, pentane type flammable liquid',
+            '22': 'JP4 jet fuel & methyl ethyl ketone type flammable',
+            '23': 'Gasoline',
+            '24': 'Turpentine, butyl alcohol type flammable liquid',
+            '25': 'Kerosene, No.1 and 2 fuel oil, diesel type',
+            '26': 'Cottonseed oil, creosote oil type combustible',
+            '27': 'Cooking oil, transformer or lubricating oil',
+            '28': 'Ethanol',
+            '3': 'Volatile Solid or Chemical',
+            '30': 'Volatile solid or chemical, other',
+            '31': 'Fat, grease, butter, margarine, lard',
+            '32': 'Petroleum jelly and non-food grease',
+            '33': 'Polish, paraffin, wax',
+            '34': 'Adhesive, resin, tar, glue, asphalt, pitch',
+            '35': 'Paint, varnish - applied',
+            '36': 'Combustible metal, included are magnesium',
+            '37': 'Solid chemical, included are explosives',
+            '38': 'Radioactive material',
+            '4': 'Plastics',
+            '41': 'Plastic',
+            '5': 'Natural Product',
+            '50': 'Natural product, other',
+            '51': 'Rubber, excluding synthetic rubbers',
+            '52': 'Cork',
+            '53': 'Leather',
+            '54': 'Hay, straw',
+            '55': 'Grain, natural fiber, (preprocess)',
+            '56': 'Coal, coke, briquettes, peat',
+            '57': 'Food, starch, excluding fat and grease Code 31',
+            '58': 'Tobacco',
+            '6': 'Wood or Paper Processed',
+            '60': 'Wood or paper, processed, other',
+            '61': 'Wood chips, sawdust, shavings',
+            '62': 'Round timber, including round posts, poles',
+            '63': 'Sawn wood, including all finished lumber',
+            '64': 'Plywood',
+            '65': 'Fiberboard, particleboard, and hardboard',
+            '66': 'Wood pulp',
+            '67': 'Paper, including cellulose, waxed paper',
+            '68': 'Cardboard',
+            '7': 'Fabric, Textiles, Fur',
+            '70': 'Fabric, textile, fur, other',
+            '71': 'Fabric, fiber, cotton, blends, rayon, wool',
+            '74': 'Fur, silk, other fabric.',
+            '75': 'Wig',
+            '76': 'Human hair',
+            '77': 'Plastic coated fabric',
+            '8': 'Material Compounded with Oil',
+            '80': 'Material compounded with oil, other',
+            '81': 'Linoleum',
+            '82': 'Oilcloth',
+            '86': 'Asphalt treated material',
+            '9': 'Other Material',
+            '99': 'Multiple types of material',
+            'UU': 'Undetermined'
+}
+
+HEAT_SOURC_MAP = {
+    '': 'HEAT SOURCE',
+            '00': 'Heat source: other',
+            '1': 'Operating equipment',
+            '10': 'Heat from powered equipment, other',
+            '11': 'Spark, ember or flame from operating equipment',
+            '12': 'Radiated, conducted heat from operating equipment',
+            '13': 'Arcing',
+            '4': 'Hot or Smoldering Object',
+            '40': 'Hot or smoldering object, other',
+            '41': 'Heat, spark from friction',
+            '42': 'Molten, hot material',
+            '43': 'Hot ember or ash',
+            '5': 'Explosives, Fireworks',
+            '50': 'Explosive, fireworks, other',
+            '51': 'Munitions',
+            '53': 'Blasting agent',
+            '54': 'Fireworks',
+            '55': 'Model and amateur rockets',
+            '56': 'Incendiary device',
+            '6': 'Other Open Flame or Smoking Materials',
+            '60': 'Heat from other open flame or smoking materials',
+            '61': 'Cigarette',
+            '62': 'Pipe or cigar',
+            '63': 'Heat from undetermined smoking material',
+            '64': 'Match',
+            '65': 'Cigarette lighter',
+            '66': 'Candle',
+            '67': 'Warning or road flare; fusee',
+            '68': 'Backfire from internal combustion engine',
+            '69': 'Flame/torch used for lighting',
+            '7': 'Chemical, Natural Heat Sources',
+            '70': 'Chemical, natural heat source, other',
+            '71': 'Sunlight',
+            '72': 'Chemical reaction',
+            '73': 'Lightning',
+            '74': 'Other static discharge',
+            '8': 'Heat Spread from Another Fire',
+            '80': 'Heat spread from another fire, other',
+            '81': 'Heat from direct flame, convection currents',
+            '82': 'Radiated heat from another fire',
+            '83': 'Flying brand, ember, spark',
+            '84': 'Conducted heat from another fire',
+            '9': 'Other Heat Sources',
+            '97': 'Multiple heat sources including multiple ignitions',
+            'UU': 'Undetermined'
+}
+
+STRUC_STAT_MAP = {
+    '0': 'Other',
+    '1': 'Under construction',
+    '2': 'In normal use',
+    '3': 'Idle, not routinely used',
+    '4': 'Under major renovation',
+    '5': 'Vacant and secured',
+    '6': 'Vacant and unsecured',
+    '7': 'Being demolished',
+    'U': 'Undetermined'
+}
+
+DETECTOR_MAP = {
+    '1': 'Detectors Present',
+    'N': 'None Present',
+    'Y': 'Detectors Present',
+    'U': 'Undetermined'
+}
+
+DET_TYPE_MAP = {
+    '0': 'Other',
+    '1': 'Smoke',
+    '2': 'Heat',
+    '3': 'Combination smoke - heat',
+    '4': 'Sprinkler, water flow detection',
+    '5': 'More than 1 type present',
+    'U': 'Undetermined'
+}
+
+
+def validar_codigo(inputs: dict) -> (bool, list):
+    errores = []
+    if inputs["HEAT_SOURC"] not in HEAT_SOURC_MAP:
+        errores.append(f"Fuente de calor inválida: {inputs['HEAT_SOURC']}")
+    if inputs["TYPE_MAT"] not in TYPE_MAT_MAP:
+        errores.append(f"Material combustible inválido: {inputs['TYPE_MAT']}")
+    if inputs["STRUC_STAT"] not in STRUC_STAT_MAP:
+        errores.append(f"Estado estructural inválido: {inputs['STRUC_STAT']}")
+    if inputs["DETECTOR"] not in DETECTOR_MAP:
+        errores.append(f"Detector inválido: {inputs['DETECTOR']}")
+    if inputs["DET_TYPE"] not in DET_TYPE_MAP:
+        errores.append(f"Tipo de detector inválido: {inputs['DET_TYPE']}")
+    return (len(errores) == 0, errores)
+
+
+# Variables del modelo en el orden de ``cat_cols`` y su diccionario de códigos
+CODE_MAPS = {
+    "HEAT_SOURC": HEAT_SOURC_MAP,
+    "TYPE_MAT":   TYPE_MAT_MAP,
+    "STRUC_STAT": STRUC_STAT_MAP,
+    "DETECTOR":   DETECTOR_MAP,
+    "DET_TYPE":   DET_TYPE_MAP,
+}
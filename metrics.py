@@ -0,0 +1,212 @@
+# metrics.py
+#
+# Métricas de rendimiento en el proceso: un histograma de latencias por etapa
+# (codificación, predict_proba, SHAP, consultas y commits de SQLite, carga del
+# modelo, render de cada página...). Cada histograma guarda cubetas
+# acumuladas para exportar en formato texto de Prometheus y una ventana de
+# muestras recientes para los percentiles de la página Performance.
+#
+# Activadas por defecto; con AIGNITE_METRICS=0 ``timed`` devuelve un context
+# manager vacío compartido y el coste por etapa es una llamada a función.
+# Con AIGNITE_METRICS_FILE=ruta se vuelca el texto de Prometheus a ese
+# fichero cada AIGNITE_METRICS_INTERVAL segundos (textfile collector).
+
+import atexit
+import bisect
+import contextlib
+import functools
+import os
+import sys
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, List, Optional, Sequence
+
+ENABLED = os.environ.get("AIGNITE_METRICS", "1") != "0"
+# Límites superiores de las cubetas (segundos), como en los clientes de Prometheus
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+           0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# Muestras recientes por histograma para los percentiles
+WINDOW = 2048
+EXPORT_INTERVAL = 15.0
+PREFIX = "aignite"
+
+_NULL = contextlib.nullcontext()
+
+
+def quantile(ordered: Sequence[float], q: float) -> float:
+    """Cuantil con interpolación lineal (como ``numpy.percentile``) de una lista ordenada."""
+    pos = (len(ordered) - 1) * q
+    lo = int(pos)
+    hi = min(lo + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (pos - lo)
+
+
+class Histogram:
+    """Latencias de una etapa: cubetas acumuladas, suma y ventana reciente."""
+
+    def __init__(self, name: str, window: int = WINDOW):
+        self.name = name
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.recent: deque = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float) -> None:
+        i = bisect.bisect_left(BUCKETS, seconds)
+        with self._lock:
+            self.counts[i] += 1
+            self.count += 1
+            self.sum += seconds
+            self.recent.append(seconds)
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            recent = sorted(self.recent)
+            count, total = self.count, self.sum
+        row = {"name": self.name, "count": count, "total_s": total}
+        if recent:
+            row.update({f"p{int(q * 100)}_ms": quantile(recent, q) * 1e3
+                        for q in (0.5, 0.9, 0.99)})
+            row["max_ms"] = recent[-1] * 1e3
+        return row
+
+
+class _Timer:
+    __slots__ = ("hist", "start")
+
+    def __init__(self, hist: Histogram):
+        self.hist = hist
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.hist.observe(time.perf_counter() - self.start)
+        return False
+
+
+_histograms: Dict[str, Histogram] = {}
+_histograms_lock = threading.Lock()
+
+
+def histogram(name: str) -> Histogram:
+    hist = _histograms.get(name)
+    if hist is None:
+        with _histograms_lock:
+            hist = _histograms.setdefault(name, Histogram(name))
+    return hist
+
+
+def enabled() -> bool:
+    return ENABLED
+
+
+def set_enabled(on: bool) -> None:
+    global ENABLED
+    ENABLED = bool(on)
+
+
+def timed(name: str):
+    """Context manager que mide el bloque en el histograma ``name``."""
+    if not ENABLED:
+        return _NULL
+    return _Timer(histogram(name))
+
+
+def instrument(name: str) -> Callable:
+    """Decorador: mide cada llamada a la función en ``name``."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not ENABLED:
+                return fn(*args, **kwargs)
+            with _Timer(histogram(name)):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def observe(name: str, seconds: float) -> None:
+    if ENABLED:
+        histogram(name).observe(seconds)
+
+
+def summary() -> List[Dict]:
+    """Una fila por histograma (recuento, tiempo total y percentiles en ms)."""
+    with _histograms_lock:
+        hists = sorted(_histograms.values(), key=lambda h: h.name)
+    return [h.snapshot() for h in hists if h.count]
+
+
+def reset() -> None:
+    with _histograms_lock:
+        _histograms.clear()
+
+
+def prometheus_text() -> str:
+    """Todos los histogramas en formato de exposición de texto de Prometheus."""
+    metric = f"{PREFIX}_stage_duration_seconds"
+    lines = [
+        f"# HELP {metric} Duración de cada etapa de AIGNITE.",
+        f"# TYPE {metric} histogram",
+    ]
+    with _histograms_lock:
+        hists = sorted(_histograms.values(), key=lambda h: h.name)
+    for h in hists:
+        with h._lock:
+            counts, count, total = list(h.counts), h.count, h.sum
+        label = h.name.replace("\\", "\\\\").replace('"', '\\"')
+        cumulative = 0
+        for bound, n in zip(BUCKETS, counts):
+            cumulative += n
+            lines.append(f'{metric}_bucket{{stage="{label}",le="{bound}"}} {cumulative}')
+        lines.append(f'{metric}_bucket{{stage="{label}",le="+Inf"}} {count}')
+        lines.append(f'{metric}_sum{{stage="{label}"}} {total}')
+        lines.append(f'{metric}_count{{stage="{label}"}} {count}')
+    return "\n".join(lines) + "\n"
+
+
+def write_prometheus(path: str) -> str:
+    """Escribe ``prometheus_text()`` en ``path`` de forma atómica."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.tmp-{os.getpid()}"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(prometheus_text())
+    os.replace(tmp, path)
+    return path
+
+
+_exporter: Optional[threading.Thread] = None
+
+
+def start_exporter(path: Optional[str] = None, interval: Optional[float] = None) -> bool:
+    """Vuelca las métricas a ``path`` periódicamente (idempotente).
+
+    Sin argumentos usa AIGNITE_METRICS_FILE y AIGNITE_METRICS_INTERVAL; si
+    no hay ruta no hace nada y devuelve False.
+    """
+    global _exporter
+    path = path or os.environ.get("AIGNITE_METRICS_FILE")
+    if not path or not ENABLED:
+        return False
+    interval = interval or float(os.environ.get("AIGNITE_METRICS_INTERVAL", EXPORT_INTERVAL))
+    with _histograms_lock:
+        if _exporter is not None:
+            return True
+
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    write_prometheus(path)
+                except OSError as exc:
+                    print(f"[metrics] No se pudo escribir {path}: {exc}", file=sys.stderr)
+
+        _exporter = threading.Thread(target=run, name="aignite-metrics", daemon=True)
+        _exporter.start()
+        # Último volcado al salir: el hilo es daemon
+        atexit.register(write_prometheus, path)
+    return True
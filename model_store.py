@@ -0,0 +1,244 @@
+# model_store.py
+#
+# Cargador único del bundle para la app, el CLI y los procesos de puntuación.
+# El bundle se guarda sin comprimir para poder abrirlo con ``mmap_mode``: los
+# arrays NumPy del bundle se paginan bajo demanda y el SO comparte esas páginas
+# entre procesos. (Los árboles de sklearn copian sus nodos al deserializarse;
+# los arrays planos, como los del bosque compilado, sí quedan mapeados.)
+
+import hashlib
+import os
+import shutil
+import sys
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import metrics
+
+MODEL_PATH = os.path.join("models", "aignite_model.pkl")
+MMAP_MODE = "r"
+
+# "sklearn" puntúa con el bosque (con caché); "table" usa la tabla
+# materializada por risk_table y sólo cae al bosque fuera de sus códigos;
+# "compiled" recorre el bosque aplanado de compiled_forest en lugar de sklearn.
+# Están aquí y no en scoring para que el CLI pueda validar --backend sin
+# importar NumPy (scoring los reexporta).
+BACKENDS = ("sklearn", "table", "compiled")
+BACKEND = os.environ.get("AIGNITE_BACKEND", "sklearn")
+# Subdirectorio, junto al bundle, con las últimas versiones publicadas
+VERSIONS_DIR = "versions"
+KEEP_VERSIONS = 5
+
+# Callbacks que se ejecutan cada vez que este proceso escribe un bundle nuevo
+_on_save: List[Callable[[str], None]] = []
+
+# Bundle cargado por ruta en este proceso (ver get_bundle)
+_loaded: Dict[str, Dict] = {}
+_load_lock = threading.Lock()
+
+
+def bundle_fingerprint(path: str = MODEL_PATH) -> str:
+    """Huella barata del bundle en disco (tamaño + mtime en ns)."""
+    st = os.stat(path)
+    return f"{st.st_size:x}-{st.st_mtime_ns:x}"
+
+
+def file_digest(path: str, chunk_size: int = 1 << 20) -> str:
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(chunk_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def resident_bytes() -> int:
+    """Memoria residente actual del proceso (RSS)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        import resource
+        # ru_maxrss es el pico (KiB en Linux, bytes en macOS): mejor que nada
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return rss if sys.platform == "darwin" else rss * 1024
+
+
+def load_bundle(path: str = MODEL_PATH,
+                mmap_mode: Optional[str] = MMAP_MODE) -> Tuple[Dict, str]:
+    # La huella se toma antes de leer: si el fichero cambia en medio, la
+    # siguiente comprobación verá otra huella y volverá a cargar.
+    import joblib  # ~50 ms de importación: sólo al cargar o guardar un bundle
+    fingerprint = bundle_fingerprint(path)
+    return joblib.load(path, mmap_mode=mmap_mode), fingerprint
+
+
+def get_bundle(path: str = MODEL_PATH) -> Tuple[Dict, str]:
+    """Bundle cacheado en el proceso; se recarga sólo si cambia en disco.
+
+    Cada llamada hace un ``stat``. Si cambian tamaño o mtime se compara el
+    SHA-1 del contenido, y sólo si también cambia se vuelve a cargar.
+    Devuelve ``(bundle, versión)``; la versión es la huella con la que se cargó.
+    """
+    fingerprint = bundle_fingerprint(path)
+    with _load_lock:
+        entry = _loaded.get(path)
+        if entry is not None and entry["fingerprint"] == fingerprint:
+            return entry["bundle"], entry["version"]
+
+        digest = file_digest(path)
+        if entry is not None and entry["sha1"] == digest:
+            entry["fingerprint"] = fingerprint
+            return entry["bundle"], entry["version"]
+
+        rss_before = resident_bytes()
+        t0 = time.perf_counter()
+        bundle, version = load_bundle(path)
+        entry = {
+            "path": path,
+            "bundle": bundle,
+            "version": version,
+            "fingerprint": fingerprint,
+            "sha1": digest,
+            "load_seconds": time.perf_counter() - t0,
+            "rss_bytes": resident_bytes(),
+        }
+        entry["rss_delta_bytes"] = entry["rss_bytes"] - rss_before
+        metrics.observe("model.load", entry["load_seconds"])
+        _loaded[path] = entry
+        print(
+            f"Modelo {path} ({version}) cargado en {entry['load_seconds']:.2f}s; "
+            f"RSS {entry['rss_bytes'] / 2**20:.0f} MiB "
+            f"(+{entry['rss_delta_bytes'] / 2**20:.0f} MiB)",
+            file=sys.stderr,
+        )
+        return bundle, version
+
+
+def bundle_info(path: str = MODEL_PATH) -> Optional[Dict]:
+    """Versión, hash, tiempo de carga y memoria del bundle cargado (sin el modelo)."""
+    entry = _loaded.get(path)
+    if entry is None:
+        return None
+    return {k: v for k, v in entry.items() if k != "bundle"}
+
+
+def stage_bundle(bundle: Dict, path: str = MODEL_PATH) -> Tuple[str, str]:
+    """Escribe el bundle en un temporal junto a ``path`` sin publicarlo.
+
+    Devuelve ``(ruta temporal, versión)``. La versión ya es la definitiva:
+    ``os.replace`` conserva tamaño y mtime, así que los artefactos derivados
+    (tabla de riesgo, bosque compilado) pueden generarse antes de publicar.
+    """
+    import joblib
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    joblib.dump(bundle, tmp_path, compress=0)  # sin comprimir: admite mmap_mode
+    return tmp_path, bundle_fingerprint(tmp_path)
+
+
+def publish_bundle(tmp_path: str, path: str = MODEL_PATH) -> str:
+    """Publica un bundle preparado con ``stage_bundle`` y lo archiva.
+
+    Se reemplaza el fichero (nunca se reescribe en sitio), así que los
+    procesos que lo tengan mapeado siguen leyendo la versión anterior y los
+    demás cogen la nueva en su siguiente ``get_bundle``. Una copia (enlace
+    duro si se puede) queda en ``versions/`` junto al bundle (``models/versions``
+    para el modelo por defecto) con la versión en el nombre.
+    """
+    version = bundle_fingerprint(tmp_path)
+    archive_dir = versions_dir(path)
+    os.makedirs(archive_dir, exist_ok=True)
+    base, ext = os.path.splitext(os.path.basename(path))
+    archived = os.path.join(archive_dir, f"{base}-{version}{ext}")
+    try:
+        os.link(tmp_path, archived)
+    except OSError:
+        shutil.copy2(tmp_path, archived)
+    os.replace(tmp_path, path)
+    _prune_versions(path)
+    _prune_artifacts(path)
+    for callback in list(_on_save):
+        callback(path)
+    return version
+
+
+def save_bundle(bundle: Dict, path: str = MODEL_PATH) -> str:
+    """Escribe el bundle de forma atómica y avisa a las cachés del proceso."""
+    tmp_path, _ = stage_bundle(bundle, path)
+    return publish_bundle(tmp_path, path)
+
+
+def versions_dir(path: str = MODEL_PATH) -> str:
+    return os.path.join(os.path.dirname(path), VERSIONS_DIR)
+
+
+def list_versions(path: str = MODEL_PATH) -> List[str]:
+    """Bundles archivados de ``path``, del más reciente al más antiguo."""
+    base, ext = os.path.splitext(os.path.basename(path))
+    archive_dir = versions_dir(path)
+    if not os.path.isdir(archive_dir):
+        return []
+    files = [os.path.join(archive_dir, f) for f in os.listdir(archive_dir)
+             if f.startswith(base + "-") and f.endswith(ext)]
+    return sorted(files, key=lambda f: os.stat(f).st_mtime_ns, reverse=True)
+
+
+def _prune_versions(path: str) -> None:
+    for old in list_versions(path)[KEEP_VERSIONS:]:
+        os.remove(old)
+
+
+def artifact_path(path: str, version: Optional[str], suffix: str) -> str:
+    """Ruta de un artefacto derivado (tabla de riesgo, bosque compilado...) de ``version``.
+
+    La versión va en el nombre (``models/aignite_model@<versión>.risk.npy``):
+    los artefactos de un bundle nuevo se generan antes de publicarlo sin tocar
+    los de la versión en uso, y cada proceso abre los de la versión que tiene
+    cargada, así que nunca se mezclan dos versiones. Con ``version=None``
+    devuelve el nombre anterior, sin versión: los cargadores sólo lo leen si
+    la versión guardada dentro coincide con la del bundle.
+    """
+    base, _ = os.path.splitext(path)
+    return f"{base}@{version}{suffix}" if version is not None else f"{base}{suffix}"
+
+
+def remove_artifacts(path: str = MODEL_PATH, version: Optional[str] = None,
+                     keep: Iterable[str] = ()) -> None:
+    """Borra los artefactos de ``version`` o, sin ella, los de versiones fuera de ``keep``."""
+    folder = os.path.dirname(path) or "."
+    prefix = os.path.basename(os.path.splitext(path)[0]) + "@"
+    keep = set(keep)
+    if not os.path.isdir(folder):
+        return
+    for name in os.listdir(folder):
+        if not name.startswith(prefix):
+            continue
+        owner = name[len(prefix):].split(".", 1)[0]
+        if owner in keep or (version is not None and owner != version):
+            continue
+        full = os.path.join(folder, name)
+        if os.path.isdir(full):
+            shutil.rmtree(full, ignore_errors=True)
+        else:
+            try:
+                os.remove(full)
+            except FileNotFoundError:
+                pass
+
+
+def _prune_artifacts(path: str) -> None:
+    # Se conservan los de la versión publicada y los de las archivadas (los
+    # enlaces y copias conservan tamaño y mtime, luego también la versión)
+    keep = set()
+    for bundle_path in [path] + list_versions(path):
+        try:
+            keep.add(bundle_fingerprint(bundle_path))
+        except FileNotFoundError:
+            pass
+    remove_artifacts(path, keep=keep)
+
+
+def on_bundle_saved(callback: Callable[[str], None]) -> Callable[[str], None]:
+    _on_save.append(callback)
+    return callback
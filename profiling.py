@@ -0,0 +1,120 @@
+# profiling.py
+#
+# Perfilado opcional de una acción concreta (una opción del menú del CLI, un
+# subcomando o el render de una página de la app): cProfile para el tiempo y
+# tracemalloc para la memoria. Cada acción perfilada deja en el directorio de
+# perfiles un ``.pstats`` (``python -m pstats`` o snakeviz) y un ``.alloc.txt``
+# con el pico de memoria y las N líneas que más memoria han reservado.
+#
+# Se activa con AIGNITE_PROFILE=1 (o ``cli.py --profile``). Con
+# AIGNITE_PROFILE_RATE=0.05 sólo se perfila una de cada ~20 acciones, así que
+# puede quedarse activado en producción: las demás no pagan nada.
+
+import cProfile
+import contextlib
+import os
+import random
+import re
+import sys
+import threading
+import time
+import tracemalloc
+from typing import Optional
+
+ENABLED = os.environ.get("AIGNITE_PROFILE", "0") == "1"
+RATE = float(os.environ.get("AIGNITE_PROFILE_RATE", "1.0"))
+PROFILE_DIR = os.environ.get("AIGNITE_PROFILE_DIR", "profiles")
+TOP_N = int(os.environ.get("AIGNITE_PROFILE_TOP", "25"))
+# tracemalloc ralentiza bastante más que cProfile; AIGNITE_PROFILE_MEMORY=0 lo omite
+MEMORY = os.environ.get("AIGNITE_PROFILE_MEMORY", "1") != "0"
+
+# cProfile y tracemalloc son globales del proceso: una acción perfilada a la
+# vez; si otra sesión ya está perfilando, esta se ejecuta sin perfilar
+_busy = threading.Lock()
+
+
+def configure(enabled: Optional[bool] = None, rate: Optional[float] = None,
+              profile_dir: Optional[str] = None, top: Optional[int] = None,
+              memory: Optional[bool] = None) -> None:
+    global ENABLED, RATE, PROFILE_DIR, TOP_N, MEMORY
+    if enabled is not None:
+        ENABLED = enabled
+    if rate is not None:
+        RATE = rate
+    if profile_dir is not None:
+        PROFILE_DIR = profile_dir
+    if top is not None:
+        TOP_N = top
+    if memory is not None:
+        MEMORY = memory
+
+
+def _base_path(name: str) -> str:
+    slug = re.sub(r"[^\w.-]+", "_", name)
+    now = time.time()
+    stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(now)) + f"{now % 1:.3f}"[1:]
+    return os.path.join(PROFILE_DIR, f"{stamp}-{slug}-{os.getpid()}")
+
+
+def _write_alloc_report(path: str, name: str, elapsed: float, peak: int,
+                        stats, top: int) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(f"{name}: {elapsed:.3f}s, pico de memoria trazada {peak / 2**20:.1f} MiB\n")
+        f.write(f"Top {top} líneas por memoria reservada y aún viva al terminar:\n\n")
+        for stat in stats[:top]:
+            frame = stat.traceback[0]
+            f.write(f"{stat.size_diff / 1024:>10.1f} KiB  {stat.count_diff:>8} bloques  "
+                    f"{frame.filename}:{frame.lineno}\n")
+
+
+@contextlib.contextmanager
+def _profile(name: str):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    base = _base_path(name)
+    own_trace = MEMORY and not tracemalloc.is_tracing()
+    if own_trace:
+        tracemalloc.start()
+    if MEMORY:
+        tracemalloc.reset_peak()
+        before = tracemalloc.take_snapshot()
+    profiler = cProfile.Profile()
+    t0 = time.perf_counter()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        elapsed = time.perf_counter() - t0
+        profiler.dump_stats(f"{base}.pstats")
+        if MEMORY:
+            _, peak = tracemalloc.get_traced_memory()
+            ignore = [tracemalloc.Filter(False, cProfile.__file__),
+                      tracemalloc.Filter(False, tracemalloc.__file__)]
+            stats = tracemalloc.take_snapshot().filter_traces(ignore).compare_to(
+                before.filter_traces(ignore), "lineno")
+            if own_trace:
+                tracemalloc.stop()
+            _write_alloc_report(f"{base}.alloc.txt", name, elapsed, peak, stats, TOP_N)
+        print(f"[profile] {name}: {elapsed:.2f}s → {base}.pstats", file=sys.stderr)
+
+
+def profiled(name: str):
+    """Context manager que perfila el bloque si el perfilado está activo.
+
+    Con el perfilado apagado, o si el muestreo descarta esta ejecución,
+    devuelve un context manager vacío.
+    """
+    if not ENABLED or (RATE < 1.0 and random.random() >= RATE):
+        return contextlib.nullcontext()
+    if not _busy.acquire(blocking=False):
+        return contextlib.nullcontext()
+    return _release_after(_profile(name))
+
+
+@contextlib.contextmanager
+def _release_after(cm):
+    try:
+        with cm:
+            yield
+    finally:
+        _busy.release()
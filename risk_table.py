@@ -0,0 +1,188 @@
+# risk_table.py
+#
+# Tabla de riesgo materializada: todas las entradas del modelo son códigos de
+# los diccionarios de ``mapeos``, así que cada respuesta posible se calcula una
+# vez tras entrenar y se guarda como un array ``(n_heat, n_mat, ..., n_clases)``
+# junto al bundle. En modo "table" predecir es indexar ese array (mmap).
+
+import json
+import os
+import sys
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from encoder import DTYPE, CategoricalEncoder
+from mapeos import CODE_MAPS
+from model_store import MODEL_PATH, artifact_path, bundle_fingerprint
+
+BATCH_SIZE = 65536
+
+
+def table_paths(model_path: str, version: Optional[str]) -> Tuple[str, str]:
+    return (artifact_path(model_path, version, ".risk.npy"),
+            artifact_path(model_path, version, ".risk.json"))
+
+
+def _check_encoder(encoder: CategoricalEncoder) -> None:
+    if encoder.passthrough_columns:
+        raise ValueError(
+            "La tabla de riesgo sólo admite modelos con entradas categóricas; "
+            f"columnas no categóricas: {encoder.passthrough_columns}"
+        )
+    unknown = [c for c in encoder.cat_cols if c not in CODE_MAPS]
+    if unknown:
+        raise ValueError(f"Variables sin diccionario de códigos: {unknown}")
+
+
+def materialize(bundle: Dict, version: str, model_path: str = MODEL_PATH,
+                batch_size: int = BATCH_SIZE) -> str:
+    """Puntúa todo el espacio de códigos y escribe la tabla junto al bundle."""
+    t0 = time.perf_counter()
+    model = bundle["model"]
+    encoder = CategoricalEncoder.from_bundle(bundle)
+    _check_encoder(encoder)
+
+    codes = {c: list(CODE_MAPS[c]) for c in encoder.cat_cols}
+    # Los códigos que el modelo no conoce codifican igual (grupo a cero), así
+    # que basta con puntuar el producto de los índices one-hot *distintos* y
+    # expandirlo después a todas las combinaciones de códigos.
+    uniques, inverses = [], []
+    for c in encoder.cat_cols:
+        idx = np.array([encoder.index_of(c, code) for code in codes[c]])
+        u, inv = np.unique(idx, return_inverse=True)
+        uniques.append(u)
+        inverses.append(inv)
+
+    n_classes = len(model.classes_)
+    eff_shape = tuple(len(u) for u in uniques)
+    n_eff = int(np.prod(eff_shape))
+    eff = np.empty((n_eff, n_classes), dtype=np.float64)
+    for start in range(0, n_eff, batch_size):
+        stop = min(start + batch_size, n_eff)
+        ordinals = np.unravel_index(np.arange(start, stop), eff_shape)
+        X = np.zeros((stop - start, encoder.n_features), dtype=DTYPE)
+        rows = np.arange(stop - start)
+        for u, ords in zip(uniques, ordinals):
+            cols = u[ords]
+            hit = cols >= 0
+            X[rows[hit], cols[hit]] = 1
+        eff[start:stop] = model.predict_proba(X)
+
+    full = eff.reshape(eff_shape + (n_classes,))[np.ix_(*inverses)]
+
+    npy_path, meta_path = table_paths(model_path, version)
+    meta = {
+        "version": version,
+        "features": encoder.cat_cols,
+        "codes": codes,
+        "classes": [str(c) for c in model.classes_],
+        "shape": list(full.shape),
+        "scored_combinations": n_eff,
+    }
+    tmp = f"{npy_path}.tmp-{os.getpid()}.npy"
+    np.save(tmp, np.ascontiguousarray(full))
+    os.replace(tmp, npy_path)
+    with open(f"{meta_path}.tmp", "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    os.replace(f"{meta_path}.tmp", meta_path)
+    print(f"Tabla de riesgo {full.shape[:-1]} ({n_eff} combinaciones distintas "
+          f"puntuadas) guardada en {npy_path} en {time.perf_counter() - t0:.1f}s")
+    return npy_path
+
+
+class RiskTable:
+    """Consulta O(1) de probabilidades por ordinales de código."""
+
+    def __init__(self, probas: np.ndarray, meta: Dict):
+        self.probas = probas
+        self.meta = meta
+        self.version = meta["version"]
+        self.features: List[str] = meta["features"]
+        self._ordinals = [
+            {code: i for i, code in enumerate(meta["codes"][f])} for f in self.features
+        ]
+
+    @classmethod
+    def load(cls, model_path: str = MODEL_PATH,
+             version: Optional[str] = None) -> Optional["RiskTable"]:
+        """Abre en mmap la tabla de ``version`` (por defecto, la del bundle en disco).
+
+        ``None`` si no existe o es de otro bundle.
+        """
+        if version is None:
+            if not os.path.exists(model_path):
+                return None
+            version = bundle_fingerprint(model_path)
+        npy_path, meta_path = table_paths(model_path, version)
+        if not os.path.exists(meta_path):
+            npy_path, meta_path = table_paths(model_path, None)  # nombre sin versión
+        if not (os.path.exists(npy_path) and os.path.exists(meta_path)):
+            return None
+        with open(meta_path, encoding="utf-8") as f:
+            meta = json.load(f)
+        if version is not None and meta["version"] != version:
+            print(f"Tabla de riesgo obsoleta ({meta['version']} != {version}): se ignora.",
+                  file=sys.stderr)
+            return None
+        return cls(np.load(npy_path, mmap_mode="r"), meta)
+
+    def lookup(self, rows: List[Dict]) -> Tuple[np.ndarray, np.ndarray]:
+        """Probabilidades de ``rows`` y máscara de filas fuera de la tabla.
+
+        Las filas con algún código que no está en los diccionarios quedan a
+        cero y con ``missing=True`` para que el llamador las puntúe en vivo.
+        """
+        n = len(rows)
+        index = np.zeros((len(self.features), n), dtype=np.intp)
+        missing = np.zeros(n, dtype=bool)
+        for j, (f, ordinals) in enumerate(zip(self.features, self._ordinals)):
+            for i, data in enumerate(rows):
+                o = ordinals.get(str(data[f]))
+                if o is None:
+                    missing[i] = True
+                else:
+                    index[j, i] = o
+        probas = np.array(self.probas[tuple(index)])
+        probas[missing] = 0
+        return probas, missing
+
+
+    def lookup_columns(self, columns: Dict[str, Sequence]) -> Tuple[np.ndarray, np.ndarray]:
+        """Como ``lookup`` pero con entrada por columnas (``{variable: valores}``)."""
+        n = len(columns[self.features[0]])
+        index = np.empty((len(self.features), n), dtype=np.intp)
+        for j, (f, ordinals) in enumerate(zip(self.features, self._ordinals)):
+            index[j] = np.fromiter((ordinals.get(str(v), -1) for v in columns[f]),
+                                   dtype=np.intp, count=n)
+        missing = (index < 0).any(axis=0)
+        index[:, missing] = 0
+        probas = np.array(self.probas[tuple(index)])
+        probas[missing] = 0
+        return probas, missing
+
+
+def verify(table: RiskTable, bundle: Dict, sample: int = 2000,
+           seed: int = 0, atol: float = 1e-9) -> float:
+    """Compara una muestra de la tabla con ``predict_proba`` en vivo."""
+    rng = np.random.default_rng(seed)
+    shape = table.probas.shape[:-1]
+    flat = rng.choice(int(np.prod(shape)), size=min(sample, int(np.prod(shape))),
+                      replace=False)
+    ordinals = np.unravel_index(flat, shape)
+    rows = [
+        {f: table.meta["codes"][f][o[i]] for f, o in zip(table.features, ordinals)}
+        for i in range(len(flat))
+    ]
+    encoder = CategoricalEncoder.from_bundle(bundle)
+    live = bundle["model"].predict_proba(encoder.encode_many(rows))
+    stored, _ = table.lookup(rows)
+    max_diff = float(np.max(np.abs(live - stored))) if len(rows) else 0.0
+    if max_diff > atol or list(table.meta["classes"]) != [str(c) for c in bundle["model"].classes_]:
+        raise ValueError(
+            f"La tabla de riesgo no coincide con el modelo (máx. diferencia {max_diff:.3g})"
+        )
+    print(f"Tabla de riesgo verificada con {len(rows)} combinaciones "
+          f"(máx. diferencia {max_diff:.3g}).")
+    return max_diff
@@ -0,0 +1,199 @@
+# scoring.py
+
+import sys
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+import metrics
+from encoder import CategoricalEncoder
+from model_store import BACKEND, BACKENDS, MODEL_PATH, get_bundle, on_bundle_saved
+from compiled_forest import CompiledForest
+from risk_table import RiskTable
+
+CACHE_SIZE = 4096
+
+
+class PredictionCache:
+    """LRU acotada de vectores de probabilidad.
+
+    La clave es ``(versión del bundle, encoder.key(...))``: las entradas de un
+    modelo anterior nunca se sirven para otro, y además se vacía entera cuando
+    este proceso guarda un bundle nuevo.
+    """
+
+    def __init__(self, maxsize: int = CACHE_SIZE):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[Tuple, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, keys: List[Tuple]) -> List[Optional[np.ndarray]]:
+        out = []
+        with self._lock:
+            for key in keys:
+                value = self._data.get(key)
+                if value is None:
+                    self.misses += 1
+                else:
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                out.append(value)
+        return out
+
+    def put_many(self, items: Dict[Tuple, np.ndarray]) -> None:
+        with self._lock:
+            for key, value in items.items():
+                value.setflags(write=False)
+                self._data[key] = value
+                self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+
+prediction_cache = PredictionCache()
+on_bundle_saved(lambda path: prediction_cache.clear())
+
+
+class RiskScorer:
+    """Predicción por lotes: una sola pasada del bosque para N registros.
+
+    Las etiquetas salen del argmax sobre ``clf.classes_`` (lo mismo que hace
+    ``RandomForestClassifier.predict``), así que no hace falta recorrer los
+    árboles una segunda vez con ``predict``. Con ``version`` (la huella del
+    bundle) las probabilidades pasan por ``prediction_cache``; con ``table``
+    se indexa la tabla materializada en lugar de recorrer el bosque, y con
+    ``forest`` el bosque se recorre con el motor compilado.
+    """
+
+    def __init__(self, model, encoder: CategoricalEncoder,
+                 version: Optional[str] = None,
+                 cache: Optional[PredictionCache] = prediction_cache,
+                 table: Optional[RiskTable] = None,
+                 forest: Optional[CompiledForest] = None):
+        self.model = model
+        self.encoder = encoder
+        self.classes_ = model.classes_
+        self.version = version
+        self.cache = cache if version is not None else None
+        self.table = table
+        self.forest = forest
+
+    @classmethod
+    def from_bundle(cls, bundle: Dict, version: Optional[str] = None,
+                    backend: Optional[str] = None,
+                    model_path: str = MODEL_PATH) -> "RiskScorer":
+        backend = backend or BACKEND
+        if backend not in BACKENDS:
+            raise ValueError(f"Backend de predicción desconocido: {backend}")
+        table = None
+        if backend == "table":
+            table = RiskTable.load(model_path, version)
+            if table is None:
+                print("Tabla de riesgo no disponible: se usa el bosque (sklearn).",
+                      file=sys.stderr)
+        forest = None
+        if backend == "compiled":
+            forest = CompiledForest.load(model_path, version)
+            if forest is None:
+                print("Bosque compilado no disponible: se usa sklearn.", file=sys.stderr)
+        return cls(bundle["model"], CategoricalEncoder.from_bundle(bundle), version,
+                   table=table, forest=forest)
+
+    def _forest_proba(self, X: np.ndarray) -> np.ndarray:
+        with metrics.timed("predict.predict_proba"):
+            if self.forest is not None:
+                return self.forest.predict_proba(X)
+            return self.model.predict_proba(X)
+
+    def predict_proba_batch(self, rows: List[Dict]) -> np.ndarray:
+        if not rows:
+            return np.empty((0, len(self.classes_)))
+        if self.table is not None:
+            with metrics.timed("predict.table_lookup"):
+                probas, missing = self.table.lookup(rows)
+            if missing.any():
+                probas[missing] = self._live_proba(
+                    [r for r, m in zip(rows, missing) if m]
+                )
+            return probas
+        return self._live_proba(rows)
+
+    def _live_proba(self, rows: List[Dict]) -> np.ndarray:
+        if self.cache is None:
+            with metrics.timed("predict.encode"):
+                X = self.encoder.encode_many(rows)
+            return self._forest_proba(X)
+
+        with metrics.timed("predict.cache_lookup"):
+            keys = [(self.version, self.encoder.key(r)) for r in rows]
+            cached = self.cache.get_many(keys)
+        # Sólo las claves distintas que faltan van al bosque, en una pasada
+        missing = list(dict.fromkeys(k for k, v in zip(keys, cached) if v is None))
+        if missing:
+            with metrics.timed("predict.encode"):
+                X = self.encoder.encode_keys([k[1] for k in missing])
+            probas = self._forest_proba(X)
+            fresh = {k: p.copy() for k, p in zip(missing, probas)}
+            self.cache.put_many(fresh)
+            cached = [fresh[k] if v is None else v for k, v in zip(keys, cached)]
+        return np.stack(cached)
+
+    def predict_proba_columns(self, columns: Dict[str, Sequence]) -> np.ndarray:
+        """Puntuación masiva por columnas; no pasa por la caché LRU."""
+        if self.table is not None:
+            probas, missing = self.table.lookup_columns(columns)
+            if missing.any():
+                sub = {c: [v for v, m in zip(vals, missing) if m]
+                       for c, vals in columns.items()}
+                probas[missing] = self._forest_proba(self.encoder.encode_columns(sub))
+            return probas
+        return self._forest_proba(self.encoder.encode_columns(columns))
+
+    def predict_batch(self, rows: List[Dict]) -> Tuple[np.ndarray, np.ndarray]:
+        probas = self.predict_proba_batch(rows)
+        return self.labels(probas), probas
+
+    def predict(self, data: Dict):
+        labels, probas = self.predict_batch([data])
+        return labels[0], probas[0]
+
+    def labels(self, probas: np.ndarray) -> np.ndarray:
+        return self.classes_.take(np.argmax(probas, axis=1), axis=0)
+
+
+# Scorer vigente por (ruta, backend) en este proceso
+_scorers: Dict[Tuple[str, str], RiskScorer] = {}
+_scorers_lock = threading.Lock()
+
+
+def get_scorer(model_path: str = MODEL_PATH, backend: Optional[str] = None) -> RiskScorer:
+    """RiskScorer del bundle actual; se reconstruye sólo si el bundle cambia."""
+    backend = backend or BACKEND
+    bundle, version = get_bundle(model_path)
+    key = (model_path, backend)
+    with _scorers_lock:
+        scorer = _scorers.get(key)
+        if scorer is None or scorer.version != version:
+            scorer = RiskScorer.from_bundle(bundle, version, backend=backend,
+                                            model_path=model_path)
+            _scorers[key] = scorer
+        return scorer
@@ -0,0 +1,419 @@
+#!/usr/bin/env python3
+# server.py
+#
+# Servicio HTTP de puntuación sin interfaz (sólo biblioteca estándar) para
+# otros sistemas: POST /predict, POST /predict_batch y GET /health. Usa el
+# mismo bundle, encoder y validación que la app. Las peticiones concurrentes
+# se agrupan en micro-lotes: una sola pasada del bosque para todas.
+#
+#   python server.py serve --port 8000 --max-batch 64 --max-wait-ms 2
+#   python server.py loadgen --url http://127.0.0.1:8000 --concurrency 16
+
+import argparse
+import http.client
+import json
+import queue
+import random
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+import numpy as np
+
+from batch_scoring import FIELDS, ValidationError, result_record, validate
+from database import init_db, log_predictions
+from mapeos import CODE_MAPS
+from model_store import bundle_info
+from scoring import BACKENDS, get_scorer
+
+MAX_BATCH = 64
+MAX_WAIT_MS = 2.0
+LATENCY_WINDOW = 10000
+MAX_BODY = 10 * 2**20
+
+
+def percentiles(samples) -> Dict:
+    """p50/p90/p99/máx (en ms) de una ventana de latencias en segundos."""
+    if not len(samples):
+        return {"count": 0}
+    ms = np.asarray(samples, dtype=float) * 1e3
+    p50, p90, p99 = np.percentile(ms, [50, 90, 99])
+    return {"count": len(ms), "p50_ms": float(p50), "p90_ms": float(p90), "p99_ms": float(p99),
+            "max_ms": float(ms.max()), "mean_ms": float(ms.mean())}
+
+
+class LatencyStats:
+    """Latencias recientes por endpoint (ventana acotada) y total de peticiones."""
+
+    def __init__(self, window: int = LATENCY_WINDOW):
+        self._samples: Dict[str, deque] = {}
+        self._totals: Dict[str, int] = {}
+        self._window = window
+        self._lock = threading.Lock()
+
+    def record(self, name: str, seconds: float) -> None:
+        with self._lock:
+            self._samples.setdefault(name, deque(maxlen=self._window)).append(seconds)
+            self._totals[name] = self._totals.get(name, 0) + 1
+
+    def summary(self) -> Dict:
+        with self._lock:
+            snapshot = {k: list(v) for k, v in self._samples.items()}
+            totals = dict(self._totals)
+        return {k: {**percentiles(v), "total": totals[k]} for k, v in snapshot.items()}
+
+
+class MicroBatcher:
+    """Agrupa registros de peticiones concurrentes en una sola predicción.
+
+    El hilo del lote espera la primera petición y, a partir de ahí, acumula
+    las que lleguen durante ``max_wait_ms`` o hasta ``max_batch`` registros.
+    El scorer se pide en cada lote, así que un bundle nuevo entra en el
+    siguiente lote sin cortar peticiones. Cada ``submit`` debe traer como
+    mucho ``max_batch`` registros (``submit_many`` trocea listas mayores).
+
+    Con ``log`` el lote se guarda en la BD después de responder: un fallo al
+    guardar (p. ej. la BD bloqueada) se cuenta y se avisa por stderr, pero
+    no convierte en errores predicciones que ya están hechas.
+    """
+
+    def __init__(self, max_batch: int = MAX_BATCH, max_wait_ms: float = MAX_WAIT_MS,
+                 backend: Optional[str] = None, log: bool = False):
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1e3
+        self.backend = backend
+        self.log = log
+        self.log_errors = 0
+        self._held: Optional[Tuple[List[Dict], Future]] = None
+        self.batch_sizes: deque = deque(maxlen=LATENCY_WINDOW)
+        self.batch_seconds: deque = deque(maxlen=LATENCY_WINDOW)
+        self._queue: "queue.Queue[Tuple[List[Dict], Future]]" = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, records: List[Dict]) -> Future:
+        future: Future = Future()
+        self._queue.put((records, future))
+        return future
+
+    def submit_many(self, records: List[Dict]) -> List[Dict]:
+        """Puntúa ``records`` en trozos de ``max_batch``.
+
+        Los trozos se encolan como peticiones independientes, así que una
+        lista grande se intercala con las peticiones de otros clientes en
+        lugar de bloquearlas en un único lote.
+        """
+        futures = [self.submit(records[i:i + self.max_batch])
+                   for i in range(0, len(records), self.max_batch)]
+        return [r for future in futures for r in future.result()]
+
+    def _collect(self) -> List[Tuple[List[Dict], Future]]:
+        # Lo que no cupo en el lote anterior abre el siguiente
+        first, self._held = self._held or self._queue.get(), None
+        items = [first]
+        n = len(first[0])
+        deadline = time.perf_counter() + self.max_wait
+        while n < self.max_batch:
+            timeout = deadline - time.perf_counter()
+            try:
+                item = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if n + len(item[0]) > self.max_batch:
+                self._held = item
+                break
+            items.append(item)
+            n += len(item[0])
+        return items
+
+    def _run(self) -> None:
+        while True:
+            items = self._collect()
+            rows = [r for records, _ in items for r in records]
+            t = time.perf_counter()
+            try:
+                scorer = get_scorer(backend=self.backend)
+                labels, probas = scorer.predict_batch(rows)
+                classes = scorer.classes_
+            except Exception as e:
+                for _, future in items:
+                    future.set_exception(e)
+                continue
+            self.batch_seconds.append(time.perf_counter() - t)
+            self.batch_sizes.append(len(rows))
+            start = 0
+            for records, future in items:
+                stop = start + len(records)
+                future.set_result([
+                    result_record(r, label, p, classes)
+                    for r, label, p in zip(records, labels[start:stop], probas[start:stop])
+                ])
+                start = stop
+            if self.log:
+                try:
+                    log_predictions(list(zip(rows, labels, probas)))
+                except Exception as e:
+                    self.log_errors += 1
+                    print(f"[server] No se pudieron guardar {len(rows)} predicciones: {e}",
+                          file=sys.stderr)
+
+    def summary(self) -> Dict:
+        sizes = np.asarray(list(self.batch_sizes), dtype=float)
+        return {
+            "max_batch": self.max_batch,
+            "max_wait_ms": self.max_wait * 1e3,
+            "batches": len(sizes),
+            "mean_batch_size": float(sizes.mean()) if len(sizes) else 0.0,
+            "log_errors": self.log_errors,
+            "predict": percentiles(list(self.batch_seconds)),
+        }
+
+
+class ScoringHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive: el cliente reutiliza la conexión
+    server_version = "AIGNITE"
+    # Cabeceras y cuerpo salen en dos escrituras: con Nagle cada respuesta
+    # esperaría al ACK retardado del cliente (~40 ms)
+    disable_nagle_algorithm = True
+
+    # Los fija make_server
+    batcher: MicroBatcher = None
+    stats: LatencyStats = None
+    started: float = 0.0
+    backend: Optional[str] = None
+
+    def log_message(self, format, *args):
+        pass  # una línea por petición es demasiado ruido con carga
+
+    def _send(self, status: int, body: Dict) -> None:
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > MAX_BODY:
+            raise ValidationError("Petición demasiado grande")
+        try:
+            return json.loads(self.rfile.read(length) or b"null")
+        except json.JSONDecodeError as e:
+            raise ValidationError(f"JSON inválido: {e}")
+
+    def do_GET(self):
+        t = time.perf_counter()
+        if self.path != "/health":
+            self._send(404, {"error": "No encontrado"})
+            return
+        scorer = get_scorer(backend=self.backend)
+        info = bundle_info() or {}
+        self._send(200, {
+            "status": "ok",
+            "model_version": scorer.version,
+            "backend": self.backend or "default",
+            "classes": [str(c) for c in scorer.classes_],
+            "model_load_seconds": info.get("load_seconds"),
+            "uptime_s": time.time() - self.started,
+            "latency": self.stats.summary(),
+            "batching": self.batcher.summary(),
+        })
+        self.stats.record("/health", time.perf_counter() - t)
+
+    def do_POST(self):
+        t = time.perf_counter()
+        try:
+            if self.path == "/predict":
+                record = validate(self._read_json())
+                result = self.batcher.submit([record]).result()[0]
+                self._send(200, result)
+            elif self.path == "/predict_batch":
+                body = self._read_json()
+                records = body.get("records") if isinstance(body, dict) else body
+                if not isinstance(records, list):
+                    raise ValidationError('Se espera una lista o {"records": [...]}')
+                valid, errors = [], {}
+                for i, r in enumerate(records):
+                    try:
+                        valid.append(validate(r))
+                    except ValidationError as e:
+                        errors[i] = str(e)
+                scored = iter(self.batcher.submit_many(valid))
+                results = [
+                    {"error": errors[i]} if i in errors else next(scored)
+                    for i in range(len(records))
+                ]
+                self._send(200, {"results": results, "errors": len(errors)})
+            else:
+                self._send(404, {"error": "No encontrado"})
+                return
+        except ValidationError as e:
+            self._send(400, {"error": str(e)})
+        except Exception as e:
+            self._send(500, {"error": f"{type(e).__name__}: {e}"})
+        self.stats.record(self.path, time.perf_counter() - t)
+
+
+class ScoringServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # La cola de listen por defecto (5) hace que, con muchos clientes
+    # conectando a la vez, algunos SYN se reintenten al cabo de 1 s
+    request_queue_size = 128
+
+
+def make_server(host: str = "127.0.0.1", port: int = 8000, max_batch: int = MAX_BATCH,
+                max_wait_ms: float = MAX_WAIT_MS, backend: Optional[str] = None,
+                log: bool = False) -> ScoringServer:
+    get_scorer(backend=backend)  # carga el modelo antes de aceptar peticiones
+    if log:
+        init_db()
+    handler = type("Handler", (ScoringHandler,), {
+        "batcher": MicroBatcher(max_batch, max_wait_ms, backend, log),
+        "stats": LatencyStats(),
+        "started": time.time(),
+        "backend": backend,
+    })
+    return ScoringServer((host, port), handler)
+
+
+def serve(args) -> None:
+    server = make_server(args.host, args.port, args.max_batch, args.max_wait_ms,
+                         args.backend, args.log)
+    print(f"Sirviendo en http://{args.host}:{server.server_address[1]} "
+          f"(micro-lotes de hasta {args.max_batch} registros, "
+          f"espera máx. {args.max_wait_ms} ms)", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Generador de carga local
+# ─────────────────────────────────────────────────────────────────────────────
+def random_record(rng: random.Random) -> Dict:
+    return {f: rng.choice(list(CODE_MAPS[f])) for f in FIELDS}
+
+
+def loadgen(url: str, requests: int = 2000, concurrency: int = 16,
+            batch: int = 0, seed: int = 0) -> Dict:
+    """Lanza ``requests`` peticiones desde ``concurrency`` hilos (una conexión
+    keep-alive por hilo) y mide la latencia vista por el cliente.
+
+    Con ``batch`` > 0 usa /predict_batch con ese número de registros.
+    """
+    target = urlparse(url)
+    per_thread = [requests // concurrency + (i < requests % concurrency)
+                  for i in range(concurrency)]
+    latencies: List[float] = []
+    failures = [0]
+    lock = threading.Lock()
+
+    def worker(n: int, wseed: int) -> None:
+        rng = random.Random(wseed)
+        conn = http.client.HTTPConnection(target.hostname, target.port or 80, timeout=30)
+        local = []
+        for _ in range(n):
+            if batch:
+                path, body = "/predict_batch", {"records": [random_record(rng) for _ in range(batch)]}
+            else:
+                path, body = "/predict", random_record(rng)
+            data = json.dumps(body)
+            t = time.perf_counter()
+            try:
+                conn.request("POST", path, data, {"Content-Type": "application/json"})
+                resp = conn.getresponse()
+                resp.read()
+                ok = resp.status == 200
+            except (OSError, http.client.HTTPException):
+                ok = False
+                conn.close()
+                conn = http.client.HTTPConnection(target.hostname, target.port or 80, timeout=30)
+            local.append(time.perf_counter() - t)
+            if not ok:
+                with lock:
+                    failures[0] += 1
+        conn.close()
+        with lock:
+            latencies.extend(local)
+
+    t0 = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(n, seed + i))
+               for i, n in enumerate(per_thread)]
+    for th in threads:
+        th.start()
+    for th in threads:
+        th.join()
+    elapsed = time.perf_counter() - t0
+    records = len(latencies) * (batch or 1)
+    return {
+        "requests": len(latencies),
+        "failures": failures[0],
+        "concurrency": concurrency,
+        "seconds": elapsed,
+        "requests_per_s": len(latencies) / elapsed if elapsed else 0.0,
+        "records_per_s": records / elapsed if elapsed else 0.0,
+        "latency": percentiles(latencies),
+    }
+
+
+def loadgen_cmd(args) -> None:
+    stats = loadgen(args.url, args.requests, args.concurrency, args.batch, args.seed)
+    lat = stats["latency"]
+    print(f"{stats['requests']} peticiones ({stats['failures']} fallidas) en "
+          f"{stats['seconds']:.2f}s con {stats['concurrency']} clientes: "
+          f"{stats['requests_per_s']:.0f} pet/s, {stats['records_per_s']:.0f} reg/s")
+    if lat["count"]:
+        print(f"latencia p50 {lat['p50_ms']:.2f} ms · p90 {lat['p90_ms']:.2f} ms · "
+              f"p99 {lat['p99_ms']:.2f} ms · máx {lat['max_ms']:.2f} ms")
+    try:
+        conn = http.client.HTTPConnection(urlparse(args.url).hostname,
+                                          urlparse(args.url).port or 80, timeout=10)
+        conn.request("GET", "/health")
+        batching = json.loads(conn.getresponse().read())["batching"]
+        print(f"servidor: {batching['batches']} lotes, "
+              f"{batching['mean_batch_size']:.1f} registros por lote de media")
+    except (OSError, ValueError, KeyError):
+        pass
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="AIGNITE – servicio HTTP de puntuación")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p = sub.add_parser("serve", help="Arranca el servidor")
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=8000)
+    p.add_argument("--max-batch", type=int, default=MAX_BATCH,
+                   help="Registros máximos por micro-lote")
+    p.add_argument("--max-wait-ms", type=float, default=MAX_WAIT_MS,
+                   help="Espera máxima para completar un micro-lote")
+    p.add_argument("--backend", choices=BACKENDS,
+                   help="Backend de predicción (por defecto AIGNITE_BACKEND)")
+    p.add_argument("--log", action="store_true",
+                   help="Guardar las predicciones en registros_incendios")
+    p.set_defaults(func=serve)
+
+    p = sub.add_parser("loadgen", help="Genera carga contra un servidor local")
+    p.add_argument("--url", default="http://127.0.0.1:8000")
+    p.add_argument("--requests", type=int, default=2000)
+    p.add_argument("--concurrency", type=int, default=16)
+    p.add_argument("--batch", type=int, default=0,
+                   help="Registros por petición a /predict_batch (0 = /predict)")
+    p.add_argument("--seed", type=int, default=0)
+    p.set_defaults(func=loadgen_cmd)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,87 +1,368 @@
+import argparse
+import math
 import os
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
 import pandas as pd
 from sklearn.ensemble    import RandomForestClassifier
-from sklearn.model_selection import train_test_split, GridSearchCV
+from sklearn.model_selection import ParameterGrid, StratifiedKFold, cross_val_score, train_test_split
 from sklearn.metrics     import classification_report, confusion_matrix
-import joblib
-
-# 1. Carga del raw file (sep="^") y filtrado de las columnas de interés
-raw_path = "data/raw/fireincident-2.txt"
-df = pd.read_csv(raw_path, sep="^", engine="python", header=0, encoding="latin1")
-
-# Sólo quedarnos con las que usas en tu notebook:
-df = df[[
-    "HEAT_SOURC",   # Fuente de calor
-    "TYPE_MAT",     # Tipo de material
-    "STRUC_STAT",   # Estado estructural
-    "DETECTOR",     # Presencia de detector
-    "DET_TYPE",     # Tipo de detector
-    "FIRE_SPRD"     # Grado de propagación (1–5)
-]]
-
-# 2. Limpieza: eliminar filas con 'UUU' o NaN
-df = df.replace("UUU", pd.NA).dropna()
-
-# 3. Crear variable categórica RISK a partir de FIRE_SPRD
-df["FIRE_SPRD"] = df["FIRE_SPRD"].astype(int)
-df["RISK"] = pd.cut(
-    df["FIRE_SPRD"],
-    bins=[0, 2, 3, 5],              # 1–2 → Bajo; 3 → Medio; 4–5 → Alto
-    labels=["Bajo", "Medio", "Alto"],
-    include_lowest=True
-)
-# Ya no necesitamos FIRE_SPRD como predictor
-df = df.drop(columns=["FIRE_SPRD"])
-
-# 4. Balanceo de clases (1325 muestras de cada una, tal como en tu notebook)
-min_count = df["RISK"].value_counts().min()
-df_bal = pd.concat([
-    df[df["RISK"] == cls].sample(min_count, random_state=42)
-    for cls in ["Bajo", "Medio", "Alto"]
-], axis=0).reset_index(drop=True)
-
-# 5. Definir variables categóricas y numéricas
-cat_cols = ["HEAT_SOURC", "TYPE_MAT", "STRUC_STAT", "DETECTOR", "DET_TYPE"]
-num_cols = []  # si tuvieras otras numéricas, las añades aquí (por ej. AREA)
-
-# 6. One‐hot encoding
-X = pd.get_dummies(df_bal[cat_cols], columns=cat_cols)
-# si hubiera num_cols: X[num_cols] = df_bal[num_cols]
-y = df_bal["RISK"]
-
-# 7. Train/test split
-X_train, X_test, y_train, y_test = train_test_split(
-    X, y, test_size=0.2, random_state=42, stratify=y
-)
-
-# 8. GridSearchCV para Random Forest
-param_grid = {
+from encoder import DTYPE, CategoricalEncoder
+from ingest import load_clean
+from model_store import MODEL_PATH, publish_bundle, remove_artifacts, stage_bundle
+from risk_table import RiskTable, materialize, verify
+import compiled_forest
+import explain
+
+RAW_PATH = "data/raw/fireincident-2.txt"
+CAT_COLS = ["HEAT_SOURC", "TYPE_MAT", "STRUC_STAT", "DETECTOR", "DET_TYPE"]
+PARAM_GRID = {
     "n_estimators":    [200, 500],
     "max_depth":       [None, 10, 20],
     "min_samples_leaf":[1, 2, 5]
 }
-grid = GridSearchCV(
-    RandomForestClassifier(random_state=42),
-    param_grid,
-    cv=5,
-    scoring="accuracy",
-    n_jobs=-1
-)
-grid.fit(X_train, y_train)
-model = grid.best_estimator_
-print("Mejores parámetros:", grid.best_params_)
-
-# 9. Evaluación
-y_pred = model.predict(X_test)
-print("Classification report:\n", classification_report(y_test, y_pred))
-print("Confusion matrix:\n", confusion_matrix(y_test, y_pred))
-
-# 10. Serializar bundle
-os.makedirs("models", exist_ok=True)
-bundle = {
-    "model":    model,
-    "columns":  X_train.columns.tolist(),
-    "cat_cols": cat_cols
+N_FOLDS = 5
+STRATEGIES = ("grid", "halving", "warm_start")
+HALVING_FACTOR = 3
+RANDOM_STATE = 42
+
+
+class TrainingCancelled(Exception):
+    """Se pidió cancelar el entrenamiento (ver jobs.RetrainJob)."""
+
+
+class Budget:
+    """Presupuesto de la búsqueda: segundos de reloj y/o ajustes de fold.
+
+    También transmite el progreso (``progress(fracción)``) y la cancelación:
+    si ``cancel`` (un ``Event``) está activo, ``exhausted`` lanza
+    ``TrainingCancelled`` en el siguiente punto de control.
+    """
+
+    def __init__(self, seconds: Optional[float] = None, max_fits: Optional[int] = None,
+                 progress: Optional[Callable[[float], None]] = None, cancel=None):
+        self.start = time.perf_counter()
+        self.seconds = seconds
+        self.max_fits = max_fits
+        self.progress = progress
+        self.cancel = cancel
+        self.fits = 0
+        self.total_fits: Optional[int] = None  # estimación de cada estrategia
+
+    def spend(self, fits: int) -> None:
+        self.fits += fits
+        if self.progress is not None:
+            self.progress(self.fraction())
+
+    def fraction(self) -> float:
+        done = [0.0]
+        if self.total_fits:
+            done.append(self.fits / self.total_fits)
+        if self.max_fits:
+            done.append(self.fits / self.max_fits)
+        if self.seconds:
+            done.append((time.perf_counter() - self.start) / self.seconds)
+        return min(1.0, max(done))
+
+    def exhausted(self) -> bool:
+        if self.cancel is not None and self.cancel.is_set():
+            raise TrainingCancelled()
+        if self.seconds and time.perf_counter() - self.start >= self.seconds:
+            return True
+        return self.max_fits is not None and self.fits >= self.max_fits
+
+
+def cargar_datos(raw_path: str = RAW_PATH) -> Tuple[pd.DataFrame, pd.Series, List[str]]:
+    # 1-2. Carga del raw file (sep="^") con sólo las columnas de interés y
+    # limpieza ('UUU' o NaN fuera). ingest cachea el resultado en data/cache.
+    df = load_clean(raw_path)
+
+    # 3. Crear variable categórica RISK a partir de FIRE_SPRD
+    df["RISK"] = pd.cut(
+        df["FIRE_SPRD"],
+        bins=[0, 2, 3, 5],              # 1–2 → Bajo; 3 → Medio; 4–5 → Alto
+        labels=["Bajo", "Medio", "Alto"],
+        include_lowest=True
+    )
+    # Ya no necesitamos FIRE_SPRD como predictor
+    df = df.drop(columns=["FIRE_SPRD"])
+
+    # 4. Balanceo de clases (1325 muestras de cada una, tal como en tu notebook)
+    min_count = df["RISK"].value_counts().min()
+    df_bal = pd.concat([
+        df[df["RISK"] == cls].sample(min_count, random_state=RANDOM_STATE)
+        for cls in ["Bajo", "Medio", "Alto"]
+    ], axis=0).reset_index(drop=True)
+
+    # 5. Variables categóricas (si hubiera numéricas, p. ej. AREA, se
+    # añadirían a X tal cual después del one-hot)
+    cat_cols = list(CAT_COLS)
+
+    # 6. One‐hot encoding
+    # (sólo las categorías presentes tras balancear, como con columnas de texto)
+    X = pd.get_dummies(
+        df_bal[cat_cols].apply(lambda s: s.cat.remove_unused_categories()),
+        columns=cat_cols,
+    )
+    y = df_bal["RISK"]
+    return X, y, cat_cols
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Estrategias de búsqueda. Todas reciben los mismos folds (calculados una vez)
+# y devuelven (mejores parámetros, resultados por evaluación).
+# ─────────────────────────────────────────────────────────────────────────────
+def _cv_score(params: Dict, X: np.ndarray, y: np.ndarray, folds, budget: Budget) -> float:
+    # Los árboles de cada ajuste se reparten entre todos los núcleos (como en
+    # warm_start_search): paralelizar sólo los folds dejaría como mucho
+    # len(folds) núcleos ocupados, con los candidatos uno detrás de otro
+    est = RandomForestClassifier(random_state=RANDOM_STATE, n_jobs=-1, **params)
+    scores = cross_val_score(est, X, y, cv=folds, scoring="accuracy")
+    budget.spend(len(folds))
+    return float(scores.mean())
+
+
+def grid_search(X, y, folds, param_grid: Dict, budget: Budget) -> Tuple[Dict, List[Dict]]:
+    """Búsqueda exhaustiva (como GridSearchCV), cortada si se agota el presupuesto."""
+    grid = ParameterGrid(param_grid)
+    budget.total_fits = len(grid) * len(folds)
+    results = []
+    for params in grid:
+        if budget.exhausted() and results:
+            break
+        results.append({**params, "score": _cv_score(params, X, y, folds, budget)})
+    best = max(results, key=lambda r: r["score"])
+    return {k: best[k] for k in param_grid}, results
+
+
+def halving_search(X, y, folds, param_grid: Dict, budget: Budget,
+                   factor: int = HALVING_FACTOR) -> Tuple[Dict, List[Dict]]:
+    """Successive halving sobre el número de muestras de entrenamiento.
+
+    Todos los candidatos se evalúan primero con una fracción de cada fold; a
+    cada ronda pasa el mejor 1/``factor`` y las muestras se multiplican por
+    ``factor``, hasta usar el fold completo en la última ronda.
+    """
+    candidates = list(ParameterGrid(param_grid))
+    n_rounds = max(1, math.ceil(math.log(len(candidates), factor)))
+    # Orden aleatorio fijo por fold: el subconjunto de cada ronda contiene
+    # al de la anterior
+    rng = np.random.default_rng(RANDOM_STATE)
+    shuffled = [(rng.permutation(train), test) for train, test in folds]
+    max_samples = min(len(train) for train, _ in folds)
+    min_samples = min(max_samples, len(np.unique(y)) * 10)
+    budget.total_fits = len(folds) * sum(
+        math.ceil(len(candidates) / factor ** rnd) for rnd in range(n_rounds)
+    )
+
+    results = []
+    last_round: List[Dict] = []
+    for rnd in range(n_rounds):
+        n_samples = max(min_samples, max_samples // factor ** (n_rounds - 1 - rnd))
+        sub_folds = [(train[:n_samples], test) for train, test in shuffled]
+        scored = []
+        for params in candidates:
+            if budget.exhausted() and (scored or last_round):
+                break
+            score = _cv_score(params, X, y, sub_folds, budget)
+            scored.append({**params, "score": score, "round": rnd, "n_samples": n_samples})
+        results.extend(scored)
+        if scored:
+            last_round = scored
+        if len(scored) < len(candidates):
+            break
+        scored.sort(key=lambda r: r["score"], reverse=True)
+        keep = max(1, math.ceil(len(candidates) / factor))
+        candidates = [{k: r[k] for k in param_grid} for r in scored[:keep]]
+    best = max(last_round, key=lambda r: r["score"])
+    return {k: best[k] for k in param_grid}, results
+
+
+def warm_start_search(X, y, folds, param_grid: Dict, budget: Budget) -> Tuple[Dict, List[Dict]]:
+    """Para cada combinación del resto de parámetros, hace crecer el bosque.
+
+    Con ``warm_start`` cada valor de ``n_estimators`` sólo añade árboles al
+    bosque del valor anterior (con la misma semilla salen los mismos árboles
+    que entrenando desde cero), así que probar [200, 500] cuesta 500 árboles.
+    """
+    sizes = sorted(param_grid["n_estimators"])
+    rest = {k: v for k, v in param_grid.items() if k != "n_estimators"}
+    budget.total_fits = len(ParameterGrid(rest)) * len(folds) * len(sizes)
+    results = []
+    for params in ParameterGrid(rest):
+        if budget.exhausted() and results:
+            break
+        fold_scores = {n: [] for n in sizes}
+        for train, test in folds:
+            est = RandomForestClassifier(random_state=RANDOM_STATE, warm_start=True,
+                                         n_jobs=-1, **params)
+            for n in sizes:
+                est.set_params(n_estimators=n)
+                est.fit(X[train], y[train])
+                fold_scores[n].append(est.score(X[test], y[test]))
+                budget.spend(1)
+        results.extend({**params, "n_estimators": n, "score": float(np.mean(s))}
+                       for n, s in fold_scores.items())
+    best = max(results, key=lambda r: r["score"])
+    return {k: best[k] for k in param_grid}, results
+
+
+SEARCHES = {
+    "grid": grid_search,
+    "halving": halving_search,
+    "warm_start": warm_start_search,
 }
-joblib.dump(bundle, "models/aignite_model.pkl")
-print("Modelo guardado en models/aignite_model.pkl")
+
+
+def guardar_modelo(model, columns: List[str], cat_cols: List[str],
+                   X_check: Optional[np.ndarray] = None,
+                   X_explain: Optional[np.ndarray] = None,
+                   explain_random: Optional[int] = None,
+                   model_path: str = MODEL_PATH, cancel=None) -> str:
+    # 10. Serializar bundle. Se escribe aparte y sólo se publica cuando sus
+    # artefactos derivados ya existen. Llevan la versión en el nombre
+    # (model_store.artifact_path): quien cargue la versión nueva los encuentra
+    # listos y los de la versión en uso no se tocan aunque algo falle aquí.
+    # ``cancel`` se atiende mientras se calcula SHAP (el paso largo) y antes
+    # de publicar; la publicación en sí ya no se interrumpe.
+    bundle = {
+        "model":    model,
+        "columns":  list(columns),
+        "cat_cols": cat_cols
+    }
+    tmp_path, version = stage_bundle(bundle, model_path)
+    try:
+        # 11. Tabla de riesgo materializada (backend "table") y comprobación en vivo
+        materialize(bundle, version, model_path)
+        verify(RiskTable.load(model_path, version), bundle)
+
+        # 12. Bosque compilado (backend "compiled"), comprobado contra predict_proba
+        compiled_forest.export(bundle, version, model_path, X_check=X_check)
+
+        # 13. Artefactos de explicación (importancias, |SHAP| medio, códigos)
+        if X_explain is not None:
+            explain.build_artifacts(bundle, version, X_explain, model_path,
+                                    n_random=explain_random,
+                                    stop=cancel.is_set if cancel is not None else None)
+        if cancel is not None and cancel.is_set():
+            raise TrainingCancelled()
+    except BaseException:
+        os.remove(tmp_path)
+        remove_artifacts(model_path, version)
+        raise
+
+    # Publicación atómica (invalida la caché de predicciones del proceso)
+    publish_bundle(tmp_path, model_path)
+    print(f"Modelo {version} guardado en {model_path}")
+    return version
+
+
+def retrain_and_return_test(strategy: str = "grid", budget_s: Optional[float] = None,
+                            max_fits: Optional[int] = None,
+                            param_grid: Optional[Dict] = None,
+                            raw_path: str = RAW_PATH, model_path: str = MODEL_PATH,
+                            save: bool = True,
+                            progress: Optional[Callable[[str, float], None]] = None,
+                            cancel=None):
+    """Entrena el bosque, lo guarda y devuelve el conjunto de test.
+
+    ``strategy`` es "grid" (exhaustiva), "halving" (successive halving sobre
+    muestras) o "warm_start" (crece ``n_estimators`` sin reentrenar). Con
+    ``budget_s`` (segundos) o ``max_fits`` (ajustes de fold) la búsqueda se
+    detiene al agotarse y se queda con el mejor candidato evaluado.
+
+    Devuelve ``(model, X_test, y_test, best_params, timings)``; ``timings``
+    tiene los segundos de cada fase y el número de ajustes de la búsqueda.
+
+    ``progress(fase, fracción)`` recibe el avance global (0-1) y ``cancel``
+    (un ``Event``) permite abortar con ``TrainingCancelled`` hasta justo antes
+    de publicar el bundle (ver ``guardar_modelo``).
+    """
+    if strategy not in SEARCHES:
+        raise ValueError(f"Estrategia de búsqueda desconocida: {strategy}")
+    param_grid = param_grid or PARAM_GRID
+    timings: Dict[str, float] = {}
+
+    def stage(name: str, fraction: float) -> None:
+        if name not in ("guardado", "fin") and cancel is not None and cancel.is_set():
+            raise TrainingCancelled()
+        if progress is not None:
+            progress(name, fraction)
+
+    stage("carga", 0.0)
+    t = time.perf_counter()
+
+    X, y, cat_cols = cargar_datos(raw_path)
+    timings["load"] = time.perf_counter() - t
+
+    # 7. Train/test split
+    X_train, X_test, y_train, y_test = train_test_split(
+        X, y, test_size=0.2, random_state=RANDOM_STATE, stratify=y
+    )
+
+    # 8. Búsqueda de hiperparámetros. Los folds (los mismos que usa
+    # GridSearchCV con cv=5) se calculan una vez para todos los candidatos;
+    # se entrena sobre arrays para no trocear DataFrames en cada ajuste.
+    t = time.perf_counter()
+    X_arr = X_train.to_numpy(dtype=DTYPE)
+    y_arr = y_train.to_numpy()
+    folds = list(StratifiedKFold(n_splits=N_FOLDS).split(X_arr, y_arr))
+    timings["folds"] = time.perf_counter() - t
+
+    t = time.perf_counter()
+    stage("busqueda", 0.05)
+    budget = Budget(budget_s, max_fits, cancel=cancel,
+                    progress=lambda f: stage("busqueda", 0.05 + 0.8 * f))
+    best_params, results = SEARCHES[strategy](X_arr, y_arr, folds, param_grid, budget)
+    timings["search"] = time.perf_counter() - t
+    timings["fits"] = budget.fits
+    print(f"Búsqueda '{strategy}': {len(results)} evaluaciones, {budget.fits} ajustes "
+          f"en {timings['search']:.1f}s")
+    print("Mejores parámetros:", best_params)
+
+    # Reajuste con todo el train (como refit=True de GridSearchCV). Se entrena
+    # en paralelo pero el modelo se guarda con n_jobs=None: para predecir
+    # filas sueltas el pool de hilos cuesta más de lo que ahorra.
+    stage("reajuste", 0.85)
+    t = time.perf_counter()
+    model = RandomForestClassifier(random_state=RANDOM_STATE, n_jobs=-1, **best_params)
+    model.fit(X_train, y_train)
+    model.set_params(n_jobs=None)
+    timings["refit"] = time.perf_counter() - t
+
+    # 9. Evaluación
+    stage("evaluacion", 0.9)
+    t = time.perf_counter()
+    y_pred = model.predict(X_test)
+    print("Classification report:\n", classification_report(y_test, y_pred))
+    print("Confusion matrix:\n", confusion_matrix(y_test, y_pred))
+    timings["evaluate"] = time.perf_counter() - t
+
+    if save:
+        stage("guardado", 0.92)
+        t = time.perf_counter()
+        # Muestra estratificada: cada código con filas de train tiene al
+        # menos ARTIFACT_MIN_PER_CODE en los artefactos de explicación
+        X_explain, n_random = explain.artifact_sample(
+            X_arr, CategoricalEncoder(X_train.columns, cat_cols), seed=RANDOM_STATE)
+        guardar_modelo(model, X_train.columns, cat_cols,
+                       X_check=X_test.to_numpy(dtype=DTYPE), X_explain=X_explain,
+                       explain_random=n_random, model_path=model_path, cancel=cancel)
+        timings["save"] = time.perf_counter() - t
+
+    print("Tiempos: " + ", ".join(
+        f"{k} {v:.1f}s" for k, v in timings.items() if k != "fits"
+    ))
+    stage("fin", 1.0)
+    return model, X_test, y_test, best_params, timings
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Entrena y guarda el modelo de AIGNITE")
+    parser.add_argument("--strategy", choices=STRATEGIES, default="grid")
+    parser.add_argument("--budget", type=float, help="Segundos máximos de búsqueda")
+    parser.add_argument("--max-fits", type=int, help="Ajustes de fold máximos")
+    args = parser.parse_args()
+    retrain_and_return_test(args.strategy, args.budget, args.max_fits)